@@ -0,0 +1,99 @@
+#! /usr/bin/env python3
+# Two-level factorial designs, to measure the effect (e.g. the overhead) of enabling some programs.
+# The levels are coded -1 (disabled) and +1 (enabled).
+
+import math
+import random
+import itertools
+import numpy
+
+def design_generators(nb_factors, fraction):
+    # For a 2^(k-p) design, the p last factors are aliased with interactions of the k-p first ones.
+    # The highest order interactions are used first, to keep the resolution as high as possible.
+    nb_base = nb_factors - fraction
+    if nb_base < 1 or fraction < 0:
+        raise ValueError('Cannot build a 2^(%d-%d) design.' % (nb_factors, fraction))
+    interactions = [subset for size in range(nb_base, 1, -1) for subset in itertools.combinations(range(nb_base), size)]
+    if fraction > len(interactions):
+        raise ValueError('Cannot build a 2^(%d-%d) design, at most %d factors can be aliased.' % (nb_factors, fraction, len(interactions)))
+    return nb_base, interactions[:fraction]
+
+def factorial_design(factors, fraction=0):
+    # Return the list of design points, each one is a dict {factor: level}.
+    if len(factors) == 0:
+        return [{}]
+    nb_base, generators = design_generators(len(factors), fraction)
+    points = []
+    for base in itertools.product([-1, 1], repeat=nb_base):
+        levels = list(base) + [int(numpy.prod([base[i] for i in generator])) for generator in generators]
+        points.append(dict(zip(factors, levels)))
+    return points
+
+def run_plan(factors, nb_runs, fraction=0, seed=None, settings=({},)):
+    # Balanced plan, made of (setting, design point) pairs: each replicate contains every pair once, in a random order
+    # (the replicates are blocks, so that a slow drift of the machine is spread evenly on all the pairs).
+    # The settings are the other parameters of the experiment (e.g. the matrix size), nb_runs is the number of runs
+    # of each setting, it is rounded up to a whole number of replicates.
+    rng = random.Random(seed)
+    points = factorial_design(factors, fraction)
+    nb_replicates = max(1, -(-nb_runs // len(points)))
+    plan = []
+    for _ in range(nb_replicates):
+        block = list(itertools.product(settings, points))
+        rng.shuffle(block)
+        plan.extend(block)
+    return plan
+
+def t_cdf(t, df):
+    # Exact cumulative distribution function of Student's t distribution for an integer number of degrees of freedom
+    # (Abramowitz and Stegun, 26.7.3 and 26.7.4).
+    theta = math.atan(abs(t) / math.sqrt(df))
+    cos2 = math.cos(theta)**2
+    term, total = 1, 1
+    if df % 2 == 1:
+        for k in range(1, (df-1)//2):
+            term *= 2*k / (2*k+1) * cos2
+            total += term
+        inside = 2/math.pi * (theta + (math.sin(theta)*math.cos(theta)*total if df > 1 else 0))
+    else:
+        for k in range(1, df//2):
+            term *= (2*k-1) / (2*k) * cos2
+            total += term
+        inside = math.sin(theta) * total
+    return 0.5 + math.copysign(inside, t)/2
+
+def t_quantile(p, df):
+    # Quantile of Student's t distribution, by bisection on its exact distribution function.
+    if p < 0.5:
+        return -t_quantile(1-p, df)
+    low, high = 0, 1
+    while t_cdf(high, df) < p:
+        low, high = high, 2*high
+    for _ in range(100):
+        middle = (low + high) / 2
+        if t_cdf(middle, df) < p:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+def main_effects(points, responses, confidence=0.95):
+    # Least squares fit of the main effects model y = b0 + sum(b_i*x_i). The effect of a factor is the difference
+    # between its two levels, i.e. 2*b_i. Return a dict {factor: (effect, lower bound, upper bound)}, and the baseline.
+    factors = list(points[0])
+    X = numpy.array([[1] + [point[factor] for factor in factors] for point in points], dtype=float)
+    y = numpy.asarray(responses, dtype=float)
+    coefficients, _, rank, _ = numpy.linalg.lstsq(X, y, rcond=None)
+    df = len(y) - rank
+    if df <= 0:
+        raise ValueError('Not enough runs to estimate the variance (%d runs for %d parameters).' % (len(y), rank))
+    residuals = y - X @ coefficients
+    variance = residuals @ residuals / df
+    std_errors = numpy.sqrt(variance * numpy.diag(numpy.linalg.pinv(X.T @ X)))
+    t = t_quantile(1 - (1-confidence)/2, df)
+    effects = {}
+    for i, factor in enumerate(factors):
+        effect, error = 2*coefficients[i+1], 2*std_errors[i+1]
+        effects[factor] = (float(effect), float(effect - t*error), float(effect + t*error))
+    baseline = coefficients[0] - sum(coefficients[1:]) # all the factors disabled
+    return effects, float(baseline)
@@ -5,22 +5,45 @@ import abc
 import re
 import itertools
 import time
-import platform
-import psutil
 import csv
 import zipfile
-import random
 import collections
+import numpy
 import pandas
-import cpuinfo # https://github.com/workhorsy/py-cpuinfo
-import git     # https://github.com/gitpython-developers/GitPython
+import monitor
+import inventory
+import design
+from pinning import CPUTopology, format_cpu_list
 from multiprocessing import cpu_count
 
-from runner import run_command, compile_generic
+from runner import run_command, build_once
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from tracing import Tracer
 
 def mean(l):
     return sum(l)/len(l)
 
+# Layout of the binary result channel written by multi_dgemm, must match result_channel.h
+CHANNEL_MAGIC = b'DGEMMREC'
+CHANNEL_VERSION = 1
+CHANNEL_MAX_COUNTERS = 10
+HEADER_DTYPE = numpy.dtype([('magic', 'S8'), ('version', '<u4'), ('record_size', '<u4'), ('capacity', '<u8'), ('nb_records', '<u8')])
+RECORD_DTYPE = numpy.dtype([('call_index', '<i4'), ('thread_index', '<i4'), ('core_index', '<i4'), ('nb_counters', '<i4'),
+                            ('start', '<f8'), ('time', '<f8'), ('likwid_time', '<f8'), ('counters', '<f8', (CHANNEL_MAX_COUNTERS,))])
+
+def read_result_channel(filename):
+    # Return the records written so far, as a read-only view on the file (no copy, no parsing).
+    header = numpy.fromfile(filename, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header['magic'][0] != CHANNEL_MAGIC:
+        raise ValueError('File %s is not a result channel.' % filename)
+    if header['version'][0] != CHANNEL_VERSION or header['record_size'][0] != RECORD_DTYPE.itemsize:
+        raise ValueError('Result channel %s has an incompatible layout (version %d, records of %d bytes).' % (filename,
+            header['version'][0], header['record_size'][0]))
+    nb_records = int(header['nb_records'][0])
+    if nb_records == 0:
+        return numpy.zeros(0, dtype=RECORD_DTYPE)
+    return numpy.memmap(filename, dtype=RECORD_DTYPE, mode='r', offset=HEADER_DTYPE.itemsize, shape=(nb_records,))
+
 class Program(metaclass=abc.ABCMeta):
     key = ['run_index']
     def __init__(self):
@@ -49,6 +72,10 @@ class Program(metaclass=abc.ABCMeta):
     def __environment_variables__(self):
         pass
 
+    def configure(self, setting):
+        # called before each run with the parameters of the run (e.g. size, nb_threads), the programs use those they need
+        pass
+
     def fetch_data(self):
         self.__fetch_data__()
         self.run_index += 1
@@ -61,6 +88,10 @@ class Program(metaclass=abc.ABCMeta):
         data['run_index'] = self.run_index
         self.data.loc[len(self.data)] = data
 
+    def __append_frame__(self, frame):
+        frame['run_index'] = self.run_index
+        self.data = pandas.concat([self.data, frame[self.data.columns]], ignore_index=True)
+
     @staticmethod
     def __merge_data__(df1, df2, key):
         return df1.join(df2.set_index(key), on=key)
@@ -82,6 +113,13 @@ class ComposeWrapper(Program):
     def __init__(self, *programs):
         self.programs = programs
 
+    def __del__(self):
+        pass
+
+    def configure(self, setting):
+        for prog in self.programs:
+            prog.configure(setting)
+
     def __command_line__(self):
         cmd = []
         for prog in self.programs:
@@ -91,7 +129,7 @@ class ComposeWrapper(Program):
     def __environment_variables__(self):
         env = dict()
         for prog in self.programs:
-            env.update(prog)
+            env.update(prog.environment_variables)
         return env
 
     def __fetch_data__(self):
@@ -100,8 +138,36 @@ class ComposeWrapper(Program):
 
 
 class DisableWrapper(Program):
+    # Factor of an experimental design: the wrapped program is only used in the runs where it is enabled.
+    # For the other runs, the data only contains the run_index (the other columns are filled with NaN by the merge).
     def __init__(self, program):
         self.program = program
+        self.enabled = True
+        self.run_index = 0
+        self.disabled_runs = []
+
+    def __del__(self): # no temporary directory, the wrapped program has its own
+        pass
+
+    @property
+    def name(self):
+        return type(self.program).__name__
+
+    @property
+    def header(self):
+        return self.program.header
+
+    @property
+    def key(self):
+        return self.program.key
+
+    @property
+    def data(self):
+        disabled = pandas.DataFrame({'run_index': self.disabled_runs})
+        return pandas.concat([self.program.data, disabled], ignore_index=True)
+
+    def configure(self, setting):
+        self.program.configure(setting)
 
     def __command_line__(self):
         if self.enabled:
@@ -119,7 +185,12 @@ class DisableWrapper(Program):
         if self.enabled:
             self.program.fetch_data()
         else:
-            self.__append_data__({h : 'N/A' for h in self.header})
+            self.disabled_runs.append(self.program.run_index)
+            self.program.run_index += 1
+
+    def post_process(self):
+        if len(self.program.data) > 0:
+            self.program.post_process()
 
 class PurePythonProgram(Program):
     def __command_line__(self):
@@ -160,7 +231,7 @@ class CommandLine(PurePythonProgram):
     header = ['git_hash', 'command_line']
     def __init__(self):
         super().__init__()
-        self.hash = git.Repo(search_parent_directories=True).head.object.hexsha
+        self.hash = inventory.get_git_hash()
         self.cmd = ' '.join(sys.argv)
 
     def __fetch_data__(self):
@@ -178,8 +249,8 @@ class Platform(PurePythonProgram):
     header = ['hostname', 'os']
     def __init__(self):
         super().__init__()
-        self.hostname = platform.node()
-        self.os = platform.platform()
+        self.hostname = inventory.get_static_inventory()['hostname']
+        self.os = inventory.get_static_inventory()['os']
 
     def __fetch_data__(self):
         self.__append_data__({'hostname': self.hostname, 'os': self.os})
@@ -192,25 +263,29 @@ class CPU(PurePythonProgram):
               'cache_size',
             ]
 
+    def __init__(self):
+        super().__init__()
+        self.inventory = inventory.get_static_inventory()
+        self.sensors = inventory.get_sensors()
+
     def __fetch_data__(self):
-        self.cpuinfo = cpuinfo.get_cpu_info()
-        cache_size = self.cpuinfo['l2_cache_size']
-        cache_size = cache_size.split()
-        assert len(cache_size) == 2 and cache_size[1] == 'KB'
-        self.cpuinfo['l2_cache_size'] = int(cache_size[0])*1000
-        self.__append_data__({'cpu_model': self.cpuinfo['brand'],
-                            'nb_cores':  self.cpuinfo['count'],
-                            'advertised_frequency': self.cpuinfo['hz_advertised_raw'][0],
-                            'current_frequency': self.cpuinfo['hz_actual_raw'][0],
-                            'cache_size': self.cpuinfo['l2_cache_size'],
+        self.__append_data__({'cpu_model': self.inventory['cpu_model'],
+                            'nb_cores':  self.inventory['nb_cores'],
+                            'advertised_frequency': self.inventory['advertised_frequency'],
+                            'current_frequency': self.sensors.current_frequency(),
+                            'cache_size': self.inventory['cache_size'],
                             })
 
 
 class Temperature(PurePythonProgram):
     header = ['average_temperature']
 
+    def __init__(self):
+        super().__init__()
+        self.sensors = inventory.get_sensors()
+
     def __fetch_data__(self):
-        temperatures = [temp.current for temp in psutil.sensors_temperatures()['coretemp'] if temp.label.startswith('Core')]
+        temperatures = self.sensors.core_temperatures()
         assert len(temperatures) == cpu_count() or len(temperatures) == cpu_count()/2 # case of hyperthreading
         return self.__append_data__({'average_temperature': mean(temperatures)})
 
@@ -262,29 +337,90 @@ class Perf(Program):
         self.__append_data__(data)
 
 class RemoveOperatingSystemNoise(Program):#Disableable):
-    header = ['cpubind']
-    def __init__(self, nb_threads):
+    header = ['cpubind', 'pinning_policy']
+    def __init__(self, nb_threads, policy='compact'):
         super().__init__()
-        self.nb_cores = psutil.cpu_count()
-        if nb_threads not in (1, self.nb_cores):
-            raise ValueError('wrong number of threads, can only handle either one thread or a number equal to the number of cores (%d).' % self.nb_cores)
+        self.topology = CPUTopology()
         self.nb_threads = nb_threads
+        self.policy = policy
+        self.update_mapping() # fail early if the mapping is not possible
+
+    def update_mapping(self):
+        # computed once per run (the policy per_socket is random), both the command line and the environment use it
+        self.mapping = self.topology.mapping(self.nb_threads, self.policy)
+        self.cpubind = format_cpu_list(self.mapping)
+
+    def configure(self, setting):
+        self.nb_threads = setting.get('nb_threads', self.nb_threads)
+        self.update_mapping()
 
     def __environment_variables__(self):
-        return {'OMP_PROc_BIND' : 'TRUE'}
+        # the i-th OpenMP thread is pinned on the i-th CPU of the mapping
+        return {'OMP_PROC_BIND' : 'TRUE', 'OMP_PLACES': ','.join('{%d}' % cpu for cpu in self.mapping)}
 
     def __command_line__(self):
-        if self.nb_threads == self.nb_cores:
-            self.cpubind = 'all'
-        else:
-            self.cpubind = str(random.randint(0, self.nb_cores-1))
         return ['chrt', '--fifo', '99',                                         # TODO move chrt in a separate class
                 'numactl', '--physcpubind=%s' % self.cpubind, '--localalloc',   # we have to choose between localalloc and membind, let's pick localalloc
                 # also cannot use --touch option here, not sure to understand why
                 ]
 
     def __fetch_data__(self):
-        self.__append_data__({'cpubind': self.cpubind})
+        self.__append_data__({'cpubind': self.cpubind, 'pinning_policy': self.policy})
+
+class Monitor(Program):
+    # Run monitor.py around the application. The samples and the dgemm calls are both timestamped with CLOCK_MONOTONIC,
+    # they are joined in post_process to get the average frequency, load and temperature during each call.
+    header = ['average_frequency', 'average_load', 'average_temperature', 'nb_samples']
+    key = ['run_index', 'call_index']
+    prefixes = {'average_frequency': 'frequency_', 'average_load': 'load_', 'average_temperature': 'temperature_'}
+
+    def __init__(self, application, frequency=100):
+        super().__init__()
+        self.application = application
+        self.frequency = frequency
+        self.samples = {}
+
+    def __environment_variables__(self):
+        return {}
+
+    def __command_line__(self):
+        return [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'monitor.py'),
+                '--channels', 'frequency,load,temperature', self.tmp_filename, str(self.frequency), '--']
+
+    def __fetch_data__(self):
+        columns, offset = monitor.read_header(self.tmp_filename)
+        frames = numpy.fromfile(self.tmp_filename, dtype='<f8', offset=offset)
+        frames = frames[:len(frames)//len(columns)*len(columns)].reshape(-1, len(columns))
+        samples = {'time': frames[:, 0]}
+        for name, prefix in self.prefixes.items(): # average over the cores
+            indices = [i for i, column in enumerate(columns) if column.startswith(prefix)]
+            samples[name] = frames[:, indices].mean(axis=1) if len(indices) > 0 else numpy.full(len(frames), numpy.nan)
+        self.samples[self.run_index] = samples
+
+    def join_calls(self, calls, samples):
+        # As-of join: average the samples taken during each call, or take the last sample before the call if there is none.
+        start = calls['start'].astype(float).values
+        end = start + calls['time'].astype(float).values
+        low = numpy.searchsorted(samples['time'], start, side='left')
+        high = numpy.searchsorted(samples['time'], end, side='right')
+        nb_samples = high - low
+        frame = pandas.DataFrame({'run_index': calls['run_index'].values, 'call_index': calls['call_index'].values, 'nb_samples': nb_samples})
+        for name in self.prefixes:
+            values = samples[name]
+            if len(values) == 0:
+                frame[name] = numpy.nan
+                continue
+            cumsum = numpy.concatenate([[0], numpy.cumsum(values)])
+            previous = values[numpy.clip(low-1, 0, len(values)-1)]
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                frame[name] = numpy.where(nb_samples > 0, (cumsum[high]-cumsum[low])/nb_samples, previous)
+        return frame
+
+    def post_process(self):
+        calls = self.application.data
+        frames = [self.join_calls(calls[calls['run_index'] == run_index], samples) for run_index, samples in self.samples.items()]
+        if len(frames) > 0:
+            self.data = pandas.concat(frames, ignore_index=True)[self.header + self.key]
 
 class LikwidError(Exception):
     pass
@@ -292,16 +428,19 @@ class LikwidError(Exception):
 class Likwid(Program):
     keys = ['run_index', 'call_index', 'thread_index']
     header = []
-    def __init__(self, group, nb_threads):
+    def __init__(self, group, nb_threads, policy='compact'):
         super().__init__()
         self.group = group
-        self.nb_cores = psutil.cpu_count()
-        if nb_threads not in (1, self.nb_cores):
-            raise ValueError('wrong number of threads, can only handle either one thread or a number equal to the number of cores (%d).' % self.nb_cores)
+        self.topology = CPUTopology()
+        self.topology.mapping(nb_threads, policy) # fail early if the mapping is not possible
         self.nb_threads = nb_threads
+        self.policy = policy
         self.tmp_output = os.path.join(self.tmp_dir.name, 'output.csv')
         self.check_group()
 
+    def configure(self, setting):
+        self.nb_threads = setting.get('nb_threads', self.nb_threads)
+
     def check_group(self):
         stdout, stderr = run_command(['likwid-perfctr', '-a'])
         stdout = stdout.decode('ascii')
@@ -316,10 +455,8 @@ class Likwid(Program):
         return {'LIKWID_FILENAME': self.tmp_filename}
 
     def __command_line__(self):
-        if self.nb_threads == self.nb_cores:
-            self.cpubind = '%d-%d' % (0, self.nb_cores-1)
-        else:
-            self.cpubind = str(random.randint(0, self.nb_cores-1))
+        # likwid pins the i-th thread on the i-th CPU of the list
+        self.cpubind = format_cpu_list(self.topology.mapping(self.nb_threads, self.policy))
         return ['chrt', '--fifo', '99',                                         # TODO move chrt in a separate class
                 'likwid-perfctr', '-C', self.cpubind, '-g', self.group, '-o', self.tmp_output, '-m'
                 ]
@@ -356,22 +493,22 @@ class Likwid(Program):
             self.events
         except AttributeError:
             self.get_available_events()
-            self.header = ['cpu_clock', 'call_index', 'likwid_time', 'thread_index', 'core_index'] + self.events
+            self.header = ['cpu_clock', 'cpubind', 'pinning_policy', 'call_index', 'likwid_time', 'thread_index', 'core_index'] + self.events
             self.cumulative_values = list(set(self.cumulative_values) & set(self.events)) + ['likwid_time']
             self.data = pandas.DataFrame(columns=self.header + ['run_index'])
 
     def __fetch_data__(self):
         self.__init_data__()
         clock = self.get_cpu_clock()
-        with open(self.tmp_filename) as f:
-            reader = csv.reader(f)
-            for row in reader:
-                assert len(row) == len(self.header)-1
-                entry = {'cpu_clock': clock}
-                for i in range(1, len(self.header)): # start from 1 because 0 is the cpu_clock
-                    h = self.header[i]
-                    entry[h] = float(row[i-1])
-                self.__append_data__(entry)
+        records = read_result_channel(self.tmp_filename)
+        assert (records['nb_counters'] == len(self.events)).all()
+        frame = pandas.DataFrame({name: records[name] for name in ['call_index', 'likwid_time', 'thread_index', 'core_index']})
+        for i, event in enumerate(self.events):
+            frame[event] = records['counters'][:, i]
+        frame['cpu_clock'] = clock
+        frame['cpubind'] = self.cpubind
+        frame['pinning_policy'] = self.policy
+        self.__append_frame__(frame)
 
     def __decumulate__(self):
         df = self.data.set_index(['run_index', 'call_index', 'thread_index'])[self.cumulative_values]
@@ -386,29 +523,29 @@ class Likwid(Program):
 class LikwidClock(Likwid):
     cumulative_values = ['likwid_time', 'INSTR_RETIRED_ANY', 'CPU_CLK_UNHALTED_CORE', 'CPU_CLK_UNHALTED_REF', 'PWR_PKG_ENERGY', 'PWR_DRAM_ENERGY']
 
-    def __init__(self, nb_threads):
-        super().__init__('CLOCK', nb_threads)
+    def __init__(self, nb_threads, policy='compact'):
+        super().__init__('CLOCK', nb_threads, policy)
 
 class LikwidEnergy(Likwid):
     cumulative_values = ['likwid_time', 'INSTR_RETIRED_ANY', 'CPU_CLK_UNHALTED_CORE', 'CPU_CLK_UNHALTED_REF', 'PWR_PKG_ENERGY', 'PWR_PP0_ENERGY', 'PWR_DRAM_ENERGY']
 
-    def __init__(self, nb_threads):
-        super().__init__('ENERGY', nb_threads)
+    def __init__(self, nb_threads, policy='compact'):
+        super().__init__('ENERGY', nb_threads, policy)
 
 
-def get_likwid_instance(group, nb_threads):
+def get_likwid_instance(group, nb_threads, policy='compact'):
     likwid_cls = {
         'clock': LikwidClock,
         'energy': LikwidEnergy,
     }
     try:
-        return likwid_cls[group](nb_threads)
+        return likwid_cls[group](nb_threads, policy)
     except KeyError:
         raise ValueError('This Likwid event group is not supported: %s.\nSupported values: %s.' % (group, list(likwid_cls.keys())))
 
 
 class Dgemm(Program):
-    header = ['call_index', 'size', 'nb_calls', 'time']
+    header = ['call_index', 'lib', 'size', 'block_size', 'nb_threads', 'nb_calls', 'start', 'time']
     key = ['run_index', 'call_index']
 
     def __init__(self, lib, size, nb_calls, nb_threads, block_size, likwid=None):
@@ -417,31 +554,56 @@ class Dgemm(Program):
         self.size = size
         self.nb_calls = nb_calls
         self.nb_threads = nb_threads
+        self.block_size = block_size
         self.likwid = likwid
-        compile_generic('multi_dgemm', lib, block_size, likwid)
+        self.executable = build_once('multi_dgemm', lib, block_size, likwid)
+
+    def configure(self, setting):
+        self.lib = setting.get('lib', self.lib)
+        self.size = setting.get('size', self.size)
+        self.nb_threads = setting.get('nb_threads', self.nb_threads)
+        self.block_size = setting.get('block_size', self.block_size)
+        self.executable = build_once('multi_dgemm', self.lib, self.block_size, self.likwid)
 
     def __environment_variables__(self):
         return {'OMP_NUM_THREADS' : str(self.nb_threads)}
 
     def __command_line__(self):
-        return ['./multi_dgemm', str(self.nb_calls), str(self.size), self.tmp_filename]
+        return ['./%s' % self.executable, str(self.nb_calls), str(self.size), self.tmp_filename]
 
     def __fetch_data__(self):
-        with open(self.tmp_filename, 'r') as f:
-            times = f.readlines()
-        for call_index, t in enumerate(times):
-            self.__append_data__({'call_index': call_index, 'size': self.size, 'nb_calls': self.nb_calls, 'time': t})
+        records = read_result_channel(self.tmp_filename)
+        frame = pandas.DataFrame({'call_index': records['call_index'], 'start': records['start'], 'time': records['time']})
+        frame['lib'] = self.lib
+        frame['size'] = self.size
+        frame['block_size'] = self.block_size
+        frame['nb_threads'] = self.nb_threads
+        frame['nb_calls'] = self.nb_calls
+        self.__append_frame__(frame)
+
+    def post_process(self):
+        # parallel efficiency: performance relative to nb_threads times the average performance of a single thread
+        # with the same library, size and block size (NaN if there is no single thread run)
+        size = self.data['size'].astype(float)
+        self.data['gflops'] = 2*size**3 / self.data['time'].astype(float) / 1e9
+        configuration = [self.data[column].map(str) for column in ['lib', 'size', 'block_size']] # strings, the block size may be None
+        sequential = self.data['gflops'].where(self.data['nb_threads'].astype(int) == 1)
+        sequential = sequential.groupby(configuration).transform('mean')
+        self.data['efficiency'] = self.data['gflops'] / (self.data['nb_threads'].astype(float) * sequential)
+
 
 class ExpEngine:
-    def __init__(self, application, wrappers):
+    # The wrappers that are instances of DisableWrapper are the factors of a two-level factorial design
+    # (a 2^(k-fraction) design), their overhead on the application time is reported at the end.
+    def __init__(self, application, wrappers, fraction=0, seed=None, tracer=None):
         self.wrappers = wrappers
         self.application = application
         self.programs = [*self.wrappers, self.application]
+        self.factors = [prog for prog in self.wrappers if isinstance(prog, DisableWrapper)]
+        self.fraction = fraction
+        self.seed = seed
         self.base_environment = dict(os.environ)
-
-    def randomly_enable(self):
-        for prog in self.programs:
-            prog.enabled = random.choice([False, True])
+        self.tracer = tracer or Tracer(enabled=False)
 
     def enable_all(self):
         for prog in self.programs:
@@ -483,23 +645,61 @@ class ExpEngine:
         os.environ.clear()
         os.environ.update(self.base_environment)
         os.environ.update(self.environment_variables)
-        self.output = run_command(self.command_line)
-
-    def run_all(self, csv_filename, nb_runs, compress=False):
-        with open(csv_filename, 'w') as f:
-            for run_index in range(nb_runs):
-                self.randomly_enable()
+        command_line = self.command_line
+        with self.tracer.span('run_command', 'application', command=' '.join(command_line)):
+            self.output = run_command(command_line)
+
+    def gen_plan(self, nb_runs, settings):
+        names = [factor.name for factor in self.factors]
+        plan = design.run_plan(names, nb_runs, self.fraction, self.seed, settings)
+        if len(plan) != nb_runs*len(settings):
+            print('Doing %d runs instead of %d, to have a balanced design.' % (len(plan), nb_runs*len(settings)))
+        return plan
+
+    def report_overhead(self, plan):
+        # response: average time of the application in each run, relative to the average time of the same setting
+        times = pandas.to_numeric(self.application.data['time']).groupby(self.application.data['run_index']).mean()
+        settings = pandas.Series([str(sorted(setting.items())) for setting, _ in plan])
+        setting_times = pandas.Series(times.values).groupby(settings).transform('mean')
+        responses = times.values / setting_times.values if settings.nunique() > 1 else times.values
+        effects, baseline = design.main_effects([point for _, point in plan], responses)
+        print('Baseline (all the factors disabled): %.6f' % baseline)
+        for name, (effect, low, high) in effects.items():
+            print('%s: overhead %+.6f (%+.2f%%), 95%% confidence interval [%+.6f, %+.6f]' % (name, effect, 100*effect/baseline, low, high))
+
+    def run_all(self, csv_filename, nb_runs, compress=False, settings=({},)):
+        with self.tracer.profiled():
+            self._run_all(csv_filename, nb_runs, compress, settings)
+
+    def _run_all(self, csv_filename, nb_runs, compress, settings):
+        plan = self.gen_plan(nb_runs, settings)
+        design_data = pandas.DataFrame([{'%s_enabled' % name: level == 1 for name, level in point.items()} for _, point in plan])
+        design_data['run_index'] = range(len(plan))
+        for run_index, (setting, point) in enumerate(plan):
+            with self.tracer.span('run', run_index=run_index, **{str(key): str(value) for key, value in setting.items()}):
+                with self.tracer.span('configure'):
+                    for prog in self.programs:
+                        prog.configure(setting)
+                    for factor in self.factors:
+                        factor.enabled = point[factor.name] == 1
                 self.run()
                 for prog in self.programs:
-                    prog.fetch_data()
-        all_data = pandas.DataFrame()
+                    with self.tracer.span('fetch_data', program=type(prog).__name__):
+                        prog.fetch_data()
+        all_data = design_data
         for prog in self.programs:
-            prog.post_process()
-            all_data = prog.merge_data(all_data)
-        with open(csv_filename, 'w') as f:
-            f.write(all_data.to_csv())
+            with self.tracer.span('post_process', program=type(prog).__name__):
+                prog.post_process()
+            with self.tracer.span('merge_data', program=type(prog).__name__):
+                all_data = prog.merge_data(all_data)
+        with self.tracer.span('write_csv'):
+            with open(csv_filename, 'w') as f:
+                f.write(all_data.to_csv())
         if compress:
             zip_name = os.path.splitext(csv_filename)[0] + '.zip'
-            with zipfile.ZipFile(zip_name, 'w', zipfile.ZIP_DEFLATED) as myzip:
-                myzip.write(csv_filename)
+            with self.tracer.span('compress'):
+                with zipfile.ZipFile(zip_name, 'w', zipfile.ZIP_DEFLATED) as myzip:
+                    myzip.write(csv_filename)
             print('Compressed the results: %s' % zip_name)
+        if len(self.factors) > 0:
+            self.report_overhead(plan)
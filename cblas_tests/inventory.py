@@ -0,0 +1,171 @@
+#! /usr/bin/env python3
+# Hardware and environment inventory. The static facts are collected once, and cached on disk until the next reboot
+# (the cache is keyed by the boot ID). The dynamic sensors are opened once per process and read with pread.
+
+import os
+import re
+import sys
+import glob
+import json
+import platform
+import tempfile
+import functools
+
+INVENTORY_VERSION = 2 # part of the name of the cache, to change when the content of the inventory changes
+
+def get_boot_id():
+    with open('/proc/sys/kernel/random/boot_id') as f:
+        return f.read().strip()
+
+def parse_cpuinfo():
+    # fields of the first processor in /proc/cpuinfo
+    info = {}
+    with open('/proc/cpuinfo') as f:
+        for line in f:
+            if line.strip() == '':
+                break
+            key, _, value = line.partition(':')
+            info[key.strip()] = value.strip()
+    return info
+
+def parse_frequency(brand): # e.g. 'Intel(R) Xeon(R) CPU E5-2630 0 @ 2.30GHz'
+    match = re.search(r'([\d.]+)\s*([MG])Hz', brand)
+    if match is None:
+        return None
+    return int(float(match.group(1)) * {'M': 1e6, 'G': 1e9}[match.group(2)])
+
+def get_l2_cache_size():
+    # size of the L2 cache of the first CPU, with 1000 bytes per KB like py-cpuinfo (the "cache size" of /proc/cpuinfo
+    # is the one of the last level cache), None if unknown
+    for directory in sorted(glob.glob('/sys/devices/system/cpu/cpu0/cache/index[0-9]*')):
+        try:
+            with open(os.path.join(directory, 'level')) as f:
+                level = f.read().strip()
+            with open(os.path.join(directory, 'type')) as f:
+                cache_type = f.read().strip()
+            with open(os.path.join(directory, 'size')) as f:
+                size = f.read().strip()
+        except OSError:
+            continue
+        match = re.match(r'(\d+)K$', size)
+        if level == '2' and cache_type != 'Instruction' and match is not None:
+            return int(match.group(1))*1000
+    return None
+
+def collect_static_inventory():
+    cpu = parse_cpuinfo()
+    brand = cpu.get('model name', platform.processor())
+    return {
+        'hostname': platform.node(),
+        'os': platform.platform(),
+        'cpu_model': brand,
+        'nb_cores': os.cpu_count(),
+        'advertised_frequency': parse_frequency(brand),
+        'cache_size': get_l2_cache_size(),
+    }
+
+@functools.lru_cache()
+def get_static_inventory():
+    try:
+        cache_file = os.path.join(tempfile.gettempdir(), 'hardware_inventory_%d_%s.json' % (INVENTORY_VERSION, get_boot_id()))
+    except OSError: # no boot ID, no cache
+        return collect_static_inventory()
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    inventory = collect_static_inventory()
+    tmp_file = '%s.%d' % (cache_file, os.getpid())
+    with open(tmp_file, 'w') as f:
+        json.dump(inventory, f)
+    os.replace(tmp_file, cache_file) # atomic, several processes may write the cache at the same time
+    return inventory
+
+def find_git_dir(path):
+    path = os.path.abspath(path)
+    while True:
+        candidate = os.path.join(path, '.git')
+        if os.path.isdir(candidate):
+            return candidate
+        if os.path.isfile(candidate): # worktree or submodule, the file points to the git directory
+            with open(candidate) as f:
+                content = f.read().strip()
+            if content.startswith('gitdir:'):
+                return os.path.normpath(os.path.join(path, content[len('gitdir:'):].strip()))
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+@functools.lru_cache()
+def get_git_hash(path=os.path.dirname(os.path.abspath(__file__))):
+    # read the hash of HEAD directly in the .git directory, without loading the repository
+    git_dir = find_git_dir(path)
+    if git_dir is None:
+        return None
+    with open(os.path.join(git_dir, 'HEAD')) as f:
+        head = f.read().strip()
+    if not head.startswith('ref:'):
+        return head # detached HEAD
+    ref = head[4:].strip()
+    common_dir = git_dir # the branches of a worktree are in the git directory of the main repository
+    try:
+        with open(os.path.join(git_dir, 'commondir')) as f:
+            common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    except FileNotFoundError:
+        pass
+    for directory in (git_dir, common_dir):
+        try:
+            with open(os.path.join(directory, ref)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            pass
+    try:
+        with open(os.path.join(common_dir, 'packed-refs')) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 2 and fields[1] == ref:
+                    return fields[0]
+    except FileNotFoundError:
+        pass
+    return None
+
+class Sensors:
+    # Dynamic values, read at each run. The files are opened only once.
+    def __init__(self):
+        self.temperature_fds = []
+        for label_path in glob.glob('/sys/class/hwmon/hwmon*/temp*_label'):
+            try:
+                with open(os.path.join(os.path.dirname(label_path), 'name')) as f:
+                    if f.read().strip() != 'coretemp':
+                        continue
+                with open(label_path) as f:
+                    if not f.read().startswith('Core'):
+                        continue
+                self.temperature_fds.append(os.open(label_path.replace('_label', '_input'), os.O_RDONLY))
+            except OSError:
+                continue
+        self.frequency_fds = []
+        for path in glob.glob('/sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_cur_freq'):
+            try:
+                self.frequency_fds.append(os.open(path, os.O_RDONLY))
+            except OSError:
+                continue
+
+    def core_temperatures(self): # in degree Celsius
+        return [int(os.pread(fd, 64, 0))/1e3 for fd in self.temperature_fds]
+
+    def current_frequency(self): # average frequency of the cores, in Hz
+        if len(self.frequency_fds) == 0: # no cpufreq driver, fallback on /proc/cpuinfo
+            return int(float(parse_cpuinfo()['cpu MHz'])*1e6)
+        frequencies = [int(os.pread(fd, 64, 0))*1e3 for fd in self.frequency_fds]
+        return int(sum(frequencies)/len(frequencies))
+
+@functools.lru_cache()
+def get_sensors():
+    return Sensors()
+
+if __name__ == '__main__':
+    json.dump(dict(get_static_inventory(), git_hash=get_git_hash()), sys.stdout, indent=4)
+    print()
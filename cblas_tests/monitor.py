@@ -1,48 +1,299 @@
 #! /usr/bin/env python3
 
-import psutil
-import time
+import os
+import re
 import sys
 import csv
-from collections import namedtuple
+import glob
+import time
+import signal
+import argparse
+import threading
+from subprocess import Popen
+from array import array
 
-def get_cpu_freq():
-    return [freq.current for freq in psutil.cpu_freq(percpu=True)]
+# Output format: one ASCII header line with the column names, followed by fixed-width frames of float64 (one per column).
+# The first column is the CLOCK_MONOTONIC timestamp of the sample, in seconds.
+MAGIC = 'monitor-v1'
 
-def get_cpu_percent():
-    return psutil.cpu_percent(percpu=True)
+def open_fd(path):
+    try:
+        return os.open(path, os.O_RDONLY)
+    except OSError: # missing file, or not readable by this user (e.g. RAPL counters)
+        return None
 
-def get_cpu_temp(): # long and not very precise...
-    return [temp.current for temp in psutil.sensors_temperatures()['coretemp'][1:]]
+def read_int(fd):
+    return int(os.pread(fd, 64, 0))
 
-base_time = time.time()
+def cpu_index(path):
+    return int(re.search(r'cpu(\d+)', path).group(1))
 
-def get_time():
-    return time.time() - base_time
+class Channel:
+    # A set of columns, sampled together. The sample method writes the values in the frame, starting at the given offset.
+    columns = []
 
-def get_next_entry():
-    return namedtuple('Entry', ['time', 'frequency', 'load'])(get_time(), get_cpu_freq(), get_cpu_percent())
+    def close(self):
+        for fd in self.fds:
+            os.close(fd)
 
-if __name__ == '__main__':
-    if len(sys.argv) != 3:
-        sys.stderr.write('Syntax: %s <csv_file> <frequency (Hz)>\n')
-        sys.exit(1)
-    filename = sys.argv[1]
-    freq = float(sys.argv[2])
-    assert freq > 0
-    period = 1/freq
-    with open(filename, 'w') as f:
-        writer = csv.writer(f)
-        entry = get_next_entry()
-        header = ['time', 'metric', 'metric_type', 'metric_id']
-        writer.writerow((header))
-        while True:
+class FrequencyChannel(Channel):
+    def __init__(self):
+        self.fds = []
+        self.columns = []
+        for path in sorted(glob.glob('/sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_cur_freq'), key=cpu_index):
+            fd = open_fd(path)
+            if fd is not None:
+                self.fds.append(fd)
+                self.columns.append('frequency_%d' % cpu_index(path))
+
+    def sample(self, frame, offset):
+        for i, fd in enumerate(self.fds):
+            frame[offset+i] = read_int(fd)/1e3 # kHz -> MHz, same unit than psutil
+        return offset + len(self.fds)
+
+class LoadChannel(Channel):
+    # Percentage of non-idle time of each CPU since the previous sample, computed from /proc/stat.
+    def __init__(self):
+        self.fds = [os.open('/proc/stat', os.O_RDONLY)]
+        self.previous = self.read_times()
+        self.cpus = sorted(self.previous) # fixed, the load of a CPU which goes offline is 0
+        self.columns = ['load_%d' % cpu for cpu in self.cpus]
+
+    def read_times(self):
+        times = {}
+        data = os.pread(self.fds[0], 1 << 16, 0)
+        for line in data.split(b'\n'):
+            if line[:3] == b'cpu' and line[3:4].isdigit():
+                fields = line.split()
+                values = [int(value) for value in fields[1:9]]
+                idle = values[3] + values[4] # idle + iowait
+                times[int(fields[0][3:])] = (sum(values)-idle, sum(values))
+        return times
+
+    def sample(self, frame, offset):
+        current = self.read_times()
+        for i, cpu in enumerate(self.cpus):
+            if cpu not in current or cpu not in self.previous:
+                frame[offset+i] = 0
+                continue
+            busy, total = current[cpu][0]-self.previous[cpu][0], current[cpu][1]-self.previous[cpu][1]
+            frame[offset+i] = 100*busy/total if total > 0 else 0
+        self.previous = current
+        return offset + len(self.cpus)
+
+class TemperatureChannel(Channel):
+    def __init__(self):
+        self.fds = []
+        self.columns = []
+        for hwmon in sorted(glob.glob('/sys/class/hwmon/hwmon*')):
+            try:
+                with open(os.path.join(hwmon, 'name')) as f:
+                    if f.read().strip() != 'coretemp':
+                        continue
+            except OSError:
+                continue
+            for path in sorted(glob.glob(os.path.join(hwmon, 'temp*_input')), key=lambda p: int(re.search(r'temp(\d+)', p).group(1))):
+                fd = open_fd(path)
+                if fd is not None:
+                    self.fds.append(fd)
+                    self.columns.append('temperature_%s_%d' % (os.path.basename(hwmon), len(self.columns)))
+
+    def sample(self, frame, offset):
+        for i, fd in enumerate(self.fds):
+            frame[offset+i] = read_int(fd)/1e3 # millidegree -> degree Celsius
+        return offset + len(self.fds)
+
+class EnergyChannel(Channel):
+    # Cumulative energy (in joules) of the RAPL domains, the wraparounds of the hardware counters are compensated.
+    def __init__(self):
+        self.fds = []
+        self.columns = []
+        self.max_ranges = []
+        for domain in sorted(glob.glob('/sys/class/powercap/intel-rapl:*')):
+            fd = open_fd(os.path.join(domain, 'energy_uj'))
+            if fd is None:
+                continue
             try:
-                for i, freq in enumerate(entry.frequency):
-                    writer.writerow([entry.time, freq, 'frequency', i])
-                for i, load in enumerate(entry.load):
-                    writer.writerow([entry.time, load, 'load', i])
-                time.sleep(period)
-                entry = get_next_entry()
+                with open(os.path.join(domain, 'name')) as f:
+                    name = f.read().strip()
+                with open(os.path.join(domain, 'max_energy_range_uj')) as f:
+                    max_range = int(f.read())
+            except OSError:
+                os.close(fd)
+                continue
+            self.fds.append(fd)
+            self.max_ranges.append(max_range)
+            self.columns.append('energy_%s_%s' % (os.path.basename(domain).split(':', 1)[1].replace(':', '_'), name))
+        self.first = [read_int(fd) for fd in self.fds]
+        self.previous = list(self.first)
+        self.wraparounds = [0]*len(self.fds)
+
+    def sample(self, frame, offset):
+        for i, fd in enumerate(self.fds):
+            value = read_int(fd)
+            if value < self.previous[i]:
+                self.wraparounds[i] += 1
+            self.previous[i] = value
+            frame[offset+i] = (value - self.first[i] + self.wraparounds[i]*self.max_ranges[i])/1e6
+        return offset + len(self.fds)
+
+CHANNELS = {
+    'frequency': FrequencyChannel,
+    'load': LoadChannel,
+    'temperature': TemperatureChannel,
+    'energy': EnergyChannel,
+}
+
+class RingBuffer:
+    # Preallocated buffer of frames, filled by the sampler and emptied by the flush thread.
+    # When the flush thread is late and the buffer is full, the new frames are dropped (and counted).
+    def __init__(self, width, capacity):
+        self.width = width
+        self.capacity = capacity
+        self.buffer = array('d', bytes(8*width*capacity))
+        self.head = 0 # number of frames pushed
+        self.tail = 0 # number of frames popped
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def push(self, frame):
+        with self.lock:
+            if self.head - self.tail == self.capacity:
+                self.dropped += 1
+                return
+            start = (self.head % self.capacity)*self.width
+        # the slot cannot be read by the flush thread before head is incremented
+        self.buffer[start:start+self.width] = frame
+        with self.lock:
+            self.head += 1
+
+    def flush(self, output):
+        with self.lock:
+            head, tail = self.head, self.tail
+        view = memoryview(self.buffer)
+        while tail < head:
+            start = tail % self.capacity
+            stop = min(self.capacity, start + head - tail)
+            output.write(view[start*self.width:stop*self.width])
+            tail += stop - start
+        output.flush() # so that the samples are not lost if the monitor is killed
+        with self.lock:
+            self.tail = tail
+
+class Monitor:
+    def __init__(self, filename, frequency, channels=tuple(CHANNELS), buffer_size=1 << 16, flush_period=1):
+        self.filename = filename
+        self.period = 1/frequency
+        self.flush_period = flush_period
+        self.channels = [CHANNELS[name]() for name in channels]
+        self.columns = ['time'] + [column for channel in self.channels for column in channel.columns]
+        self.frame = array('d', bytes(8*len(self.columns)))
+        self.ring = RingBuffer(len(self.columns), buffer_size)
+        self.stopped = threading.Event()
+
+    def sample(self):
+        self.frame[0] = time.monotonic()
+        offset = 1
+        for channel in self.channels:
+            offset = channel.sample(self.frame, offset)
+        self.ring.push(self.frame)
+
+    def flush_loop(self, output):
+        while not self.stopped.wait(self.flush_period):
+            self.ring.flush(output)
+        self.ring.flush(output)
+
+    def run(self):
+        # sample until stop is called (or until SIGINT/SIGTERM), the samples are aligned on a fixed grid to avoid drift
+        with open(self.filename, 'wb') as output:
+            output.write(('%s %s\n' % (MAGIC, ','.join(self.columns))).encode('ascii'))
+            flusher = threading.Thread(target=self.flush_loop, args=(output,))
+            flusher.start()
+            try:
+                next_time = time.monotonic()
+                while not self.stopped.is_set():
+                    self.sample()
+                    next_time += self.period
+                    delay = next_time - time.monotonic()
+                    if delay > 0:
+                        self.stopped.wait(delay)
+                    else:
+                        next_time = time.monotonic()
             except KeyboardInterrupt:
-                break
+                pass
+            finally:
+                self.stopped.set()
+                flusher.join()
+                for channel in self.channels:
+                    channel.close()
+        if self.ring.dropped > 0:
+            sys.stderr.write('Warning: %d frames were dropped, increase the buffer size.\n' % self.ring.dropped)
+
+    def stop(self):
+        self.stopped.set()
+
+def read_header(filename):
+    # return the column names and the offset of the first frame
+    with open(filename, 'rb') as f:
+        line = f.readline()
+    magic, columns = line.decode('ascii').split()
+    if magic != MAGIC:
+        raise ValueError('File %s was not produced by monitor.py.' % filename)
+    return columns.split(','), len(line)
+
+def read_frames(filename):
+    columns, offset = read_header(filename)
+    values = array('d')
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        values.frombytes(f.read())
+    nb_frames = len(values) // len(columns)
+    return columns, [values[i*len(columns):(i+1)*len(columns)] for i in range(nb_frames)]
+
+def to_csv(filename, csv_filename):
+    columns, frames = read_frames(filename)
+    with open(csv_filename, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(frames)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sample the frequency, load, temperature and energy of the CPUs.',
+            usage='%(prog)s [options] output_file frequency [-- command...]')
+    parser.add_argument('output_file', type=str, help='Path of the binary output file.')
+    parser.add_argument('frequency', type=float, help='Sampling frequency (Hz).')
+    parser.add_argument('--channels', type=lambda s: s.split(','), default=list(CHANNELS),
+            help='Channels to sample, among %s (default: all of them).' % ','.join(CHANNELS))
+    parser.add_argument('--buffer_size', type=int, default=1 << 16, help='Number of frames of the ring buffer.')
+    parser.add_argument('--flush_period', type=float, default=1, help='Period of the writes to the output file (s).')
+    parser.add_argument('--csv', type=str, default=None, help='Convert the output to a CSV file once the sampling is stopped.')
+    # a command can be given after "--", the sampling then stops when it terminates (otherwise, it stops on SIGINT or SIGTERM)
+    argv = sys.argv[1:]
+    command = []
+    if '--' in argv:
+        command = argv[argv.index('--')+1:]
+        argv = argv[:argv.index('--')]
+    args = parser.parse_args(argv)
+    if args.frequency <= 0:
+        parser.error('The frequency must be positive.')
+    for channel in args.channels:
+        if channel not in CHANNELS:
+            parser.error('Unknown channel %s, available channels: %s.' % (channel, ','.join(CHANNELS)))
+    monitor = Monitor(args.output_file, args.frequency, args.channels, args.buffer_size, args.flush_period)
+    signal.signal(signal.SIGTERM, lambda signum, frame: monitor.stop())
+    returncode = 0
+    if len(command) > 0:
+        process = Popen(command)
+        def wait():
+            monitor.returncode = process.wait()
+            monitor.stop()
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        monitor.run()
+        waiter.join()
+        returncode = monitor.returncode
+    else:
+        monitor.run()
+    if args.csv is not None:
+        to_csv(args.output_file, args.csv)
+    sys.exit(returncode)
@@ -1,32 +1,38 @@
 #include <stdlib.h>
 #include <stdio.h>
 #include <time.h>
-#include <sys/time.h>
 #include <assert.h>
 #include <string.h>
 #include <likwid.h>
 #include <omp.h>
 #include <sched.h>
 #include "common_matrix.h"
+#include "result_channel.h"
 
 void syntax(char *exec_name) {
     fprintf(stderr, "Syntax: %s <nb_calls> <size> [output_file]\n", exec_name);
     exit(1);
 }
 
+double get_time(void) {
+    struct timespec t;
+    clock_gettime(CLOCK_MONOTONIC, &t);
+    return t.tv_sec + 1e-9*t.tv_nsec;
+}
+
 int main(int argc, char* argv[]) {
     if (argc != 3 && argc != 4)
         syntax(argv[0]);
 
     int nb_calls = atoi(argv[1]);
     int size    = atoi(argv[2]);
-    FILE *outfile;
-    if(argc == 3)
-        outfile = stdout;
-    else
-        outfile = fopen(argv[3], "w");
     if(size <= 0 || nb_calls <= 0)
         syntax(argv[0]);
+    // without output file, the times are printed on stdout, otherwise they are written in a binary result channel
+    channel_t channel;
+    int use_channel = argc == 4;
+    if(use_channel && channel_open(&channel, argv[3], nb_calls) < 0)
+        exit(1);
     double *A = allocate_matrix(size);
     double *B = allocate_matrix(size);
     double *C = allocate_matrix(size);
@@ -36,11 +42,9 @@ int main(int argc, char* argv[]) {
 
 #ifdef LIKWID_PERFMON
     char *likwid_filename = getenv("LIKWID_FILENAME");
-    FILE *likwid_outfile;
-    if(likwid_filename == NULL)
-        likwid_outfile = stdout;
-    else
-        likwid_outfile = fopen(likwid_filename, "w");
+    channel_t likwid_channel;
+    if(likwid_filename != NULL && channel_open(&likwid_channel, likwid_filename, (uint64_t)nb_calls*omp_get_max_threads()) < 0)
+        exit(1);
     LIKWID_MARKER_INIT;
     #pragma omp parallel
     {
@@ -49,8 +53,6 @@ int main(int argc, char* argv[]) {
     }
     assert(perfmon_getNumberOfGroups() == 1); // we do not handle the multi-group case (yet?)
 #endif
-    struct timeval before = {};
-    struct timeval after = {};
 
     for(int i = 0; i < nb_calls; i++) {
 #ifdef LIKWID_PERFMON
@@ -59,44 +61,51 @@ int main(int argc, char* argv[]) {
             LIKWID_MARKER_START("perf_dgemm");
         }
 #endif
-        gettimeofday(&before, NULL);
+        double before = get_time();
         matrix_product(A, B, C, size);
 #ifdef LIKWID_PERFMON
         #pragma omp parallel
         {
             LIKWID_MARKER_STOP("perf_dgemm");
-            int nevents = 10;
-            double events[10];
-            double time;
+            channel_record_t record = {.call_index = i, .thread_index = omp_get_thread_num(), .core_index = sched_getcpu(), .start = before};
+            int nevents = CHANNEL_MAX_COUNTERS;
             int count;
-            LIKWID_MARKER_GET("perf_dgemm", &nevents, events, &time, &count);
-            int my_thread_id = omp_get_thread_num();
+            LIKWID_MARKER_GET("perf_dgemm", &nevents, record.counters, &record.likwid_time, &count);
+            record.nb_counters = nevents;
             for(int nthread = 0; nthread < omp_get_num_threads(); nthread++) {
-                if(my_thread_id == nthread) {
-                    fprintf(likwid_outfile, "%d,%f,%d,%d", i, time, my_thread_id, sched_getcpu());
-                    for (int ev = 0; ev < nevents; ev++) {
-                        fprintf(likwid_outfile, ",%f", events[ev]);
+                if(record.thread_index == nthread) {
+                    if(likwid_filename == NULL) {
+                        printf("%d,%f,%d,%d", i, record.likwid_time, record.thread_index, record.core_index);
+                        for (int ev = 0; ev < nevents; ev++) {
+                            printf(",%f", record.counters[ev]);
+                        }
+                        printf("\n");
                     }
-                    fprintf(likwid_outfile, "\n");
+                    else
+                        channel_write(&likwid_channel, &record);
                 }
                 #pragma omp barrier
             }
         }
 #endif
-        gettimeofday(&after, NULL);
-        double total_time = (after.tv_sec-before.tv_sec) + 1e-6*(after.tv_usec-before.tv_usec);
-        fprintf(outfile, "%f\n", total_time);
+        double after = get_time();
+        if(use_channel) {
+            channel_record_t record = {.call_index = i, .thread_index = -1, .core_index = -1, .start = before, .time = after-before};
+            channel_write(&channel, &record);
+        }
+        else
+            printf("%f\n", after-before);
     }
 
-    if(outfile != stdout)
-        fclose(outfile);
+    if(use_channel)
+        channel_close(&channel);
     free_matrix(A);
     free_matrix(B);
     free_matrix(C);
 #ifdef LIKWID_PERFMON
     LIKWID_MARKER_CLOSE;
-    if(likwid_outfile != stdout)
-        fclose(likwid_outfile);
+    if(likwid_filename != NULL)
+        channel_close(&likwid_channel);
 #endif
     return 0;
 }
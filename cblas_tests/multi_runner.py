@@ -1,47 +1,96 @@
 #! /usr/bin/env python3
 
+import os
+import sys
 import argparse
+import itertools
 from experiment import *
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from topology import IntSetParser
+import tracing
+
+LIBRARIES = ['mkl', 'mkl2', 'atlas', 'openblas', 'naive']
+
+def parse_libs(string):
+    libs = string.split(',')
+    for lib in libs:
+        if lib not in LIBRARIES:
+            raise argparse.ArgumentTypeError('unknown library %s, the possible choices are %s' % (lib, ','.join(LIBRARIES)))
+    return libs
+
+def gen_settings(libs, sizes, block_sizes, nb_threads):
+    # the block size is only used by the naive implementation, the other libraries are not run for each block size
+    settings = []
+    for lib, size, threads in itertools.product(libs, sorted(sizes), sorted(nb_threads)):
+        for block_size in (sorted(block_sizes) if lib == 'naive' else [None]):
+            settings.append({'lib': lib, 'size': size, 'block_size': block_size, 'nb_threads': threads})
+    return settings
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
             description='Experiment runner')
     parser.add_argument('--nb_runs', type=int,
-            default=50, help='Number of experiment to run.')
+            default=50, help='Number of experiment to run for each combination of library, size, block size and number of threads.')
     parser.add_argument('--nb_calls', type=int,
             default=50, help='Number of calls to dgemm for each run.')
-    parser.add_argument('--size', type=int,
-            default=1024, help='Size of the matrix.").')
-    parser.add_argument('--block_size', type=int,
-            default=128, help='Block size of the matrix for computations.").')
-    parser.add_argument('-np', '--nb_threads', type=int,
-            default=1, help='Number of threads used to perform the operation (may not be supported by all BLAS libraries).')
+    parser.add_argument('--size', type=lambda s: IntSetParser.parse(s),
+            default={1024}, help='Sizes of the matrix (e.g. "1024,2048" or "1000:4000:1000").')
+    parser.add_argument('--block_size', type=lambda s: IntSetParser.parse(s),
+            default={128}, help='Block sizes of the matrix for computations (only used by the naive implementation).')
+    parser.add_argument('-np', '--nb_threads', type=lambda s: IntSetParser.parse(s),
+            default={1}, help='Numbers of threads used to perform the operation (may not be supported by all BLAS libraries).')
     parser.add_argument('--remove_os_noise', action='store_true',
             help='Remove the operating system noise (e.g. by using a FIFO scheduling policy and binding threads and memory).')
+    parser.add_argument('--pinning', type=str, choices=CPUTopology.policies,
+            default='compact', help='Placement of the threads when they are pinned (with --remove_os_noise or --likwid).')
     parser.add_argument('--likwid', type=str, choices=['clock', 'energy'],
             default=None, help='Measure the given Likwid event. When used, the option --remove_os_noise is automatically enabled.')
+    parser.add_argument('--monitor', type=float, default=None,
+            help='Sample the CPU frequency, load and temperature at the given frequency (Hz), and attach their average to each dgemm call.')
+    parser.add_argument('--overhead', action='store_true',
+            help='Measure the overhead of the instrumentation (perf, intercoolr, OS noise removal) with a factorial design.')
+    parser.add_argument('--fraction', type=int, default=0,
+            help='With --overhead, use a 2^(k-fraction) fractional factorial design instead of the full one.')
+    parser.add_argument('--seed', type=int, default=None,
+            help='Seed of the random order of the runs.')
     required_named = parser.add_argument_group('required named arguments')
     required_named.add_argument('--csv_file', type = str,
             required=True, help='Path of the CSV file for the results.')
-    required_named.add_argument('--lib', type = str,
-            required=True, help='Library to use.',
-            choices = ['mkl', 'mkl2', 'atlas', 'openblas', 'naive'])
+    required_named.add_argument('--lib', type = parse_libs,
+            required=True, help='Libraries to use, separated by commas, among %s.' % ','.join(LIBRARIES))
+    tracing.add_arguments(parser)
     args = parser.parse_args()
+    if args.overhead and args.likwid is not None:
+        # dgemm is built with the Likwid markers, which need likwid-perfctr, and Likwid also does the pinning
+        parser.error('Options --overhead and --likwid are incompatible.')
+    settings = gen_settings(args.lib, args.size, args.block_size, args.nb_threads)
+    for setting in settings: # all the executables are built before the first run
+        build_once('multi_dgemm', setting['lib'], setting['block_size'], args.likwid)
+    max_threads = max(args.nb_threads)
     wrappers=[
             CommandLine(),
             Date(),
             Platform(),
             CPU(),
     ]
+    instrumentation = []
     if args.likwid is None:
-        wrappers.extend([
-                Temperature(),
+        wrappers.append(Temperature())
+        instrumentation.extend([
                 Perf(),
                 Intercoolr(),
             ])
     else:
-        wrappers.append(get_likwid_instance(group=args.likwid, nb_threads=args.nb_threads))
+        instrumentation.append(get_likwid_instance(group=args.likwid, nb_threads=max_threads, policy=args.pinning))
     if args.remove_os_noise and args.likwid is None:
-        wrappers.append(RemoveOperatingSystemNoise(args.nb_threads))
-    exp = ExpEngine(application=Dgemm(lib=args.lib, size=args.size, nb_calls=args.nb_calls, nb_threads=args.nb_threads, block_size=args.block_size, likwid=args.likwid), wrappers=wrappers)
-    exp.run_all(nb_runs=args.nb_runs, csv_filename=args.csv_file, compress=True)
+        instrumentation.append(RemoveOperatingSystemNoise(max_threads, args.pinning))
+    if args.overhead:
+        instrumentation = [DisableWrapper(prog) for prog in instrumentation]
+    wrappers.extend(instrumentation)
+    first = settings[0]
+    dgemm = Dgemm(lib=first['lib'], size=first['size'], nb_calls=args.nb_calls, nb_threads=first['nb_threads'], block_size=first['block_size'], likwid=args.likwid)
+    if args.monitor is not None: # first wrapper, so that the monitor itself is not pinned nor run with a real-time priority
+        wrappers.insert(0, Monitor(dgemm, args.monitor))
+    exp = ExpEngine(application=dgemm, wrappers=wrappers, fraction=args.fraction, seed=args.seed, tracer=tracing.tracer_from_args(args))
+    exp.run_all(nb_runs=args.nb_runs, csv_filename=args.csv_file, compress=True, settings=settings)
+    exp.tracer.report(args.trace, args.profile)
@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+# Topology-aware thread pinning, the topology is read in /sys/devices/system.
+
+import os
+import re
+import sys
+import glob
+import random
+from collections import namedtuple
+
+CPU = namedtuple('CPU', ['cpu', 'socket', 'node', 'core', 'smt_index'])
+
+def parse_cpu_list(string): # e.g. '0-3,8,10-11'
+    cpus = []
+    for block in string.strip().split(','):
+        if '-' in block:
+            first, last = block.split('-')
+            cpus.extend(range(int(first), int(last)+1))
+        elif block != '':
+            cpus.append(int(block))
+    return cpus
+
+def format_cpu_list(cpus):
+    return ','.join(str(cpu) for cpu in cpus)
+
+def read_file(path, default=''):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+def get_isolated_cpus():
+    isolated = parse_cpu_list(read_file('/sys/devices/system/cpu/isolated'))
+    if len(isolated) > 0:
+        return set(isolated)
+    # older kernels do not have the sysfs file, the isolcpus list may also be prefixed by flags (e.g. isolcpus=nohz,domain,2-5)
+    match = re.search(r'\bisolcpus=(\S+)', read_file('/proc/cmdline'))
+    if match is None:
+        return set()
+    blocks = [block for block in match.group(1).split(',') if block[:1].isdigit()]
+    return set(parse_cpu_list(','.join(blocks)))
+
+class CPUTopology:
+    policies = ['compact', 'scatter', 'per_socket']
+
+    def __init__(self):
+        online = parse_cpu_list(read_file('/sys/devices/system/cpu/online', '0-%d' % (os.cpu_count()-1)))
+        nodes = {}
+        for path in glob.glob('/sys/devices/system/node/node[0-9]*/cpulist'):
+            node = int(re.search(r'node(\d+)', path).group(1))
+            for cpu in parse_cpu_list(read_file(path)):
+                nodes[cpu] = node
+        self.cpus = []
+        siblings = {}
+        for cpu in online:
+            topology = '/sys/devices/system/cpu/cpu%d/topology' % cpu
+            socket = int(read_file(os.path.join(topology, 'physical_package_id'), '0'))
+            core = int(read_file(os.path.join(topology, 'core_id'), str(cpu)))
+            smt_index = siblings.get((socket, core), 0)
+            siblings[(socket, core)] = smt_index + 1
+            self.cpus.append(CPU(cpu, socket, nodes.get(cpu, 0), core, smt_index))
+        self.isolated = get_isolated_cpus()
+
+    def available_cpus(self):
+        # when some CPUs are isolated from the scheduler, the experiments are run on them
+        if len(self.isolated) > 0:
+            return [cpu for cpu in self.cpus if cpu.cpu in self.isolated]
+        return list(self.cpus)
+
+    @staticmethod
+    def compact_order(cpus):
+        # one thread per physical core, the SMT siblings are only used once all the physical cores are busy
+        return sorted(cpus, key=lambda cpu: (cpu.smt_index, cpu.socket, cpu.node, cpu.core, cpu.cpu))
+
+    @staticmethod
+    def scatter_order(cpus):
+        # round-robin on the sockets (and the NUMA nodes inside the sockets)
+        domains = {}
+        for cpu in CPUTopology.compact_order(cpus):
+            domains.setdefault((cpu.socket, cpu.node), []).append(cpu)
+        domains = [domains[key] for key in sorted(domains)]
+        order = []
+        for i in range(max(len(domain) for domain in domains)):
+            order.extend(domain[i] for domain in domains if i < len(domain))
+        return order
+
+    def mapping(self, nb_threads, policy='compact'):
+        # return the list of CPUs to use, the thread i should be pinned on the i-th CPU of this list
+        cpus = self.available_cpus()
+        if policy == 'compact':
+            order = self.compact_order(cpus)
+        elif policy == 'scatter':
+            order = self.scatter_order(cpus)
+        elif policy == 'per_socket': # all the threads on a same socket, chosen randomly among those which are large enough
+            sockets = sorted({cpu.socket for cpu in cpus})
+            sockets = [socket for socket in sockets if len([cpu for cpu in cpus if cpu.socket == socket]) >= nb_threads]
+            if len(sockets) == 0:
+                raise ValueError('No socket has %d available CPUs.' % nb_threads)
+            socket = random.choice(sockets)
+            order = self.compact_order([cpu for cpu in cpus if cpu.socket == socket])
+        else:
+            raise ValueError('Unknown pinning policy %s, available policies: %s.' % (policy, ', '.join(self.policies)))
+        if nb_threads > len(order):
+            raise ValueError('Cannot pin %d threads on %d available CPUs.' % (nb_threads, len(order)))
+        return [cpu.cpu for cpu in order[:nb_threads]]
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.stderr.write('Syntax: %s <nb_threads> <policy>\n' % sys.argv[0])
+        sys.exit(1)
+    print(format_cpu_list(CPUTopology().mapping(int(sys.argv[1]), sys.argv[2])))
@@ -1,34 +1,115 @@
 #! /usr/bin/env python3
 
+import os
+import sys
+import csv
+import time
 import argparse
+from statistics import mean, median, stdev
 import numpy as np
-import time
-import sys
+try:
+    from threadpoolctl import threadpool_limits, threadpool_info
+except ImportError:
+    threadpool_limits = None
+
+# columns of the results of experiment.Dgemm, which is not imported to avoid loading pandas and the whole harness
+DGEMM_HEADER = ['call_index', 'lib', 'size', 'block_size', 'nb_threads', 'nb_calls', 'start', 'time']
+# read by the BLAS libraries when they are loaded, used when threadpoolctl is not available
+THREAD_VARIABLES = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS']
+
+def set_nb_threads(nb_threads):
+    if threadpool_limits is not None:
+        return threadpool_limits(limits=nb_threads, user_api='blas')
+    if any(os.environ.get(var) != str(nb_threads) for var in THREAD_VARIABLES):
+        # numpy is already imported, the only way to change the number of threads is to restart with the right environment
+        for var in THREAD_VARIABLES:
+            os.environ[var] = str(nb_threads)
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+def get_blas_name():
+    if threadpool_limits is None:
+        return 'numpy'
+    apis = [info['internal_api'] for info in threadpool_info() if info['user_api'] == 'blas']
+    return 'numpy-%s' % apis[0] if len(apis) > 0 else 'numpy'
+
+def init_matrix(rng, shape, dtype):
+    # random non-zero values, so that no BLAS kernel can take a shortcut
+    return rng.uniform(0.5, 1.5, size=shape).astype(dtype)
+
+def matrix_product(A, B, C):
+    start = time.monotonic()
+    t = time.perf_counter()
+    np.matmul(A, B, out=C)
+    return start, time.perf_counter() - t
+
+def is_stable(times, window, threshold):
+    # the warm-up is over when the coefficient of variation of the last calls is below the threshold
+    if len(times) < window:
+        return False
+    last = times[-window:]
+    return stdev(last) / mean(last) < threshold
+
+def run(shape, dtype, nb_calls, max_warmup, window=5, threshold=0.02, seed=None):
+    M, N, K = shape
+    rng = np.random.default_rng(seed)
+    A = init_matrix(rng, (M, K), dtype)
+    B = init_matrix(rng, (K, N), dtype)
+    C = np.empty((M, N), dtype=dtype)
+    warmup = []
+    while len(warmup) < max_warmup and not is_stable(warmup, window, threshold):
+        warmup.append(matrix_product(A, B, C)[1])
+    return len(warmup), [matrix_product(A, B, C) for _ in range(nb_calls)]
 
-def init_matrix(size):
-    return np.zeros((size, size))
+def positive_int(string):
+    value = int(string)
+    if value < 1:
+        raise argparse.ArgumentTypeError('must be a positive integer')
+    return value
 
-def matrix_product(A, B):
-    t = time.time()
-    np.dot(A, B)
-    return time.time() - t
+def parse_shape(string):
+    shape = [int(n) for n in string.split(',')]
+    if len(shape) != 3 or min(shape) <= 0:
+        raise argparse.ArgumentTypeError('the shape is made of three positive integers M,N,K')
+    return shape
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
-            description='Experiment runner')
-    parser.add_argument('--nb_calls', type=int,
-            default=50, help='Number of calls to dgemm.')
+            description='Benchmark of the BLAS library used by numpy')
+    parser.add_argument('--nb_calls', type=positive_int,
+            default=50, help='Number of calls to dgemm (after the warm-up).')
     parser.add_argument('--size', type=int,
-            default=1024, help='Size of the matrix.").')
-    parser.add_argument('--gflops', action='store_true',
-            help='Display Gflops instead of seconds.").')
+            default=1024, help='Size of the (square) matrices.')
+    parser.add_argument('--shape', type=parse_shape,
+            default=None, help='Shape M,N,K of the product of a MxK matrix by a KxN matrix (overrides --size).')
+    parser.add_argument('--dtype', type=str, choices=['float64', 'float32'],
+            default='float64', help='Type of the elements of the matrices.')
+    parser.add_argument('-np', '--nb_threads', type=int,
+            default=None, help='Number of threads used by the BLAS library (default: the library default).')
+    parser.add_argument('--max_warmup', type=int,
+            default=50, help='Maximal number of warm-up calls, the warm-up stops earlier when the times are stable.')
+    parser.add_argument('--seed', type=int,
+            default=None, help='Seed of the random matrices.')
+    parser.add_argument('--csv_file', type=str,
+            default=None, help='Path of a CSV file for the time of each call, with the same columns than the Dgemm results.')
     args = parser.parse_args()
-    A = init_matrix(args.size)
-    B = init_matrix(args.size)
-    for _ in range(args.nb_calls):
-        t = matrix_product(A, B)
-        gflops = 2*args.size**3 / t * 1e-9
-        if args.gflops:
-            print(gflops)
-        else:
-            print(t)
+    shape = args.shape if args.shape is not None else [args.size]*3
+    limits = set_nb_threads(args.nb_threads) if args.nb_threads is not None else None # kept alive during the benchmark
+    nb_warmup, results = run(shape, args.dtype, args.nb_calls, args.max_warmup, seed=args.seed)
+    size = shape[0] if len(set(shape)) == 1 else ','.join(str(n) for n in shape)
+    lib = get_blas_name()
+    nb_threads = args.nb_threads if args.nb_threads is not None else 'default'
+    flop = 2*shape[0]*shape[1]*shape[2]
+    if args.csv_file is not None:
+        with open(args.csv_file, 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(DGEMM_HEADER + ['gflops', 'dtype'])
+            for call_index, (start, t) in enumerate(results):
+                entry = {'call_index': call_index, 'lib': lib, 'size': size, 'block_size': None, 'nb_threads': nb_threads,
+                         'nb_calls': args.nb_calls, 'start': start, 'time': t}
+                writer.writerow([entry[h] for h in DGEMM_HEADER] + [flop / t * 1e-9, args.dtype])
+    times = [t for _, t in results]
+    gflops = [flop / t * 1e-9 for t in times]
+    print('%s, %s, shape %s, %s threads, %d warm-up calls' % (lib, args.dtype, 'x'.join(str(n) for n in shape), nb_threads, nb_warmup))
+    for name, values in [('time', times), ('gflops', gflops)]:
+        print('%s: mean %g, median %g, std %g, min %g, max %g' % (name, mean(values), median(values),
+            stdev(values) if len(values) > 1 else 0, min(values), max(values)))
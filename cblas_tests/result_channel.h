@@ -0,0 +1,84 @@
+#ifndef RESULT_CHANNEL_H
+#define RESULT_CHANNEL_H
+// Binary result channel: a memory-mapped file made of a header followed by fixed-size records.
+// The number of records is published after each write, so the file can be read while the program is still running.
+// The layout must be kept consistent with HEADER_DTYPE and RECORD_DTYPE in experiment.py.
+#include <stdio.h>
+#include <stdint.h>
+#include <string.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+
+#define CHANNEL_MAGIC "DGEMMREC"
+#define CHANNEL_VERSION 1
+#define CHANNEL_MAX_COUNTERS 10
+
+typedef struct {
+    char magic[8];
+    uint32_t version;
+    uint32_t record_size;
+    uint64_t capacity;
+    uint64_t nb_records;
+} channel_header_t;
+
+typedef struct {
+    int32_t call_index;
+    int32_t thread_index;           // -1 for a record of the whole call
+    int32_t core_index;
+    int32_t nb_counters;
+    double start;                   // CLOCK_MONOTONIC timestamp, in seconds
+    double time;
+    double likwid_time;
+    double counters[CHANNEL_MAX_COUNTERS];
+} channel_record_t;
+
+typedef struct {
+    channel_header_t *header;
+    channel_record_t *records;
+    size_t size;
+} channel_t;
+
+static inline int channel_open(channel_t *channel, const char *filename, uint64_t capacity) {
+    channel->size = sizeof(channel_header_t) + capacity*sizeof(channel_record_t);
+    int fd = open(filename, O_RDWR | O_CREAT | O_TRUNC, 0644);
+    if(fd < 0) {
+        perror("open");
+        return -1;
+    }
+    if(ftruncate(fd, channel->size) < 0) {
+        perror("ftruncate");
+        close(fd);
+        return -1;
+    }
+    void *ptr = mmap(NULL, channel->size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    close(fd);
+    if(ptr == MAP_FAILED) {
+        perror("mmap");
+        return -1;
+    }
+    channel->header = (channel_header_t*) ptr;
+    channel->records = (channel_record_t*) ((char*)ptr + sizeof(channel_header_t));
+    memcpy(channel->header->magic, CHANNEL_MAGIC, sizeof(channel->header->magic));
+    channel->header->version = CHANNEL_VERSION;
+    channel->header->record_size = sizeof(channel_record_t);
+    channel->header->capacity = capacity;
+    __atomic_store_n(&channel->header->nb_records, 0, __ATOMIC_RELEASE);
+    return 0;
+}
+
+// Not thread-safe, the callers have to serialize the writes.
+static inline int channel_write(channel_t *channel, const channel_record_t *record) {
+    uint64_t index = channel->header->nb_records;
+    if(index >= channel->header->capacity)
+        return -1;
+    channel->records[index] = *record;
+    __atomic_store_n(&channel->header->nb_records, index+1, __ATOMIC_RELEASE);
+    return 0;
+}
+
+static inline void channel_close(channel_t *channel) {
+    munmap(channel->header, channel->size);
+}
+
+#endif
@@ -15,6 +15,7 @@ except ImportError:
     psutil = None
 import time
 import re
+from inventory import get_sensors
 try:
     from subprocess import DEVNULL
 except ImportError:
@@ -123,8 +124,8 @@ def get_dim(sizes):
 def mean(l):
     return sum(l)/len(l)
 
-def get_cpu_temp(): # long and not very precise...
-    temperatures = [temp.current for temp in psutil.sensors_temperatures()['coretemp'] if temp.label.startswith('Core')]
+def get_cpu_temp():
+    temperatures = get_sensors().core_temperatures()
     assert len(temperatures) == cpu_count() or len(temperatures) == cpu_count()/2 # case of hyperthreading
     return temperatures
 
@@ -181,24 +182,40 @@ def run_all_dtrsm(csv_file, nb_exp, size_range, big_size_range, offloading_mode,
 class LibraryNotFound(Exception):
     pass
 
-def compile_generic(exec_filename, lib, block_size=128, likwid=None):
+def compile_generic(exec_filename, lib, block_size=128, likwid=None, output=None):
     c_filename = exec_filename + '.c'
+    if output is None:
+        output = exec_filename
     options = []
     if likwid is not None:
         options.extend(['-DLIKWID_PERFMON', '-llikwid'])
     lib_to_command = {
-        'mkl': ['icc', '-DUSE_MKL', c_filename, 'common_matrix.c', '-fopenmp', '-mkl', '-O3', '-o', exec_filename, *options],
+        'mkl': ['icc', '-DUSE_MKL', c_filename, 'common_matrix.c', '-fopenmp', '-mkl', '-O3', '-o', output, *options],
         'mkl2': ['/opt/intel/bin/icc', '-DUSE_MKL', c_filename, 'common_matrix.c', '-fopenmp', '-I', '/opt/intel/compilers_and_libraries_2017.0.098/linux/mkl/include',
-		'/opt/intel/mkl/lib/intel64/libmkl_rt.so', '-O3', '-o', exec_filename, *options], # an ugly command for a non-standard library location
-        'atlas': ['gcc', '-DUSE_ATLAS', c_filename, 'common_matrix.c', '-fopenmp', '/usr/lib/atlas-base/libcblas.so.3', '-O3', '-o', exec_filename, *options],
-        'openblas': ['gcc', '-DUSE_OPENBLAS', c_filename, 'common_matrix.c', '-fopenmp', '-I', '/tmp/include', '/tmp/lib/libopenblas.so', '-O3', '-o', exec_filename, *options],
-        'naive': ['gcc', '-DBLOCK_SIZE=%d' % block_size, *options, '-std=c99', '-fopenmp', '-DUSE_NAIVE', c_filename, 'common_matrix.c', '-O3', '-o', exec_filename, *options],
+		'/opt/intel/mkl/lib/intel64/libmkl_rt.so', '-O3', '-o', output, *options], # an ugly command for a non-standard library location
+        'atlas': ['gcc', '-DUSE_ATLAS', c_filename, 'common_matrix.c', '-fopenmp', '/usr/lib/atlas-base/libcblas.so.3', '-O3', '-o', output, *options],
+        'openblas': ['gcc', '-DUSE_OPENBLAS', c_filename, 'common_matrix.c', '-fopenmp', '-I', '/tmp/include', '/tmp/lib/libopenblas.so', '-O3', '-o', output, *options],
+        'naive': ['gcc', '-DBLOCK_SIZE=%d' % block_size, *options, '-std=c99', '-fopenmp', '-DUSE_NAIVE', c_filename, 'common_matrix.c', '-O3', '-o', output, *options],
     }
     try:
         run_command(lib_to_command[lib])
     except KeyError:
         raise LibraryNotFound('Library unknown. The possible choices are %s' % list(lib_to_command.keys()))
 
+built_executables = {}
+
+def build_once(exec_filename, lib, block_size=128, likwid=None):
+    # Compile each (library, block size, likwid) combination only once, in its own executable, and return its name.
+    # The block size is only used by the naive implementation.
+    if lib != 'naive':
+        block_size = None
+    key = (exec_filename, lib, block_size, likwid)
+    if key not in built_executables:
+        output = '_'.join([exec_filename, lib] + (['bs%d' % block_size] if block_size is not None else []) + (['likwid'] if likwid is not None else []))
+        compile_generic(exec_filename, lib, block_size, likwid, output)
+        built_executables[key] = output
+    return built_executables[key]
+
 def size_parser(string):
     min_v, max_v = (int(n) for n in string.split(','))
     return namedtuple('size_range', ['min', 'max'])(min_v, max_v)
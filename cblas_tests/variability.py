@@ -1,12 +1,194 @@
 #! /usr/bin/env python3
+# Streaming statistics of timings: the memory does not depend on the number of values, and the summaries of several
+# files (processed in parallel) can be merged.
+
+import sys
+import csv
+import math
+import argparse
 import fileinput
+from multiprocessing import Pool
+from collections import defaultdict
+
+QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+class Moments:
+    # Welford's algorithm, merged with the formula of Chan et al.
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def merge(self, other):
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.
+
+class TDigest:
+    # Quantile sketch made of at most O(compression) weighted centroids (Dunning's merging t-digest).
+    # The centroids are small near the extreme quantiles, so the tails are precise.
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.centroids = [] # sorted list of [mean, weight]
+        self.buffer = []
+        self.count = 0
+
+    def add(self, x, weight=1):
+        self.buffer.append([x, weight])
+        self.count += weight
+        if len(self.buffer) >= 5*self.compression:
+            self.compress()
+
+    def merge(self, other):
+        for mean, weight in other.centroids + other.buffer:
+            self.add(mean, weight)
+
+    def compress(self):
+        if len(self.buffer) == 0:
+            return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        self.centroids = [list(points[0])]
+        cumulated = 0
+        for mean, weight in points[1:]:
+            last = self.centroids[-1]
+            q = (cumulated + (last[1] + weight)/2) / self.count
+            if last[1] + weight <= max(1, 4*self.count*q*(1-q)/self.compression):
+                last[0] += (mean - last[0]) * weight / (last[1] + weight)
+                last[1] += weight
+            else:
+                cumulated += last[1]
+                self.centroids.append([mean, weight])
+
+    def quantile(self, q):
+        # linear interpolation between the centers of the centroids
+        self.compress()
+        if self.count == 0:
+            return math.nan
+        target = q * self.count
+        cumulated = 0
+        previous_center, previous_mean = 0, self.centroids[0][0]
+        for mean, weight in self.centroids:
+            center = cumulated + weight/2
+            if target < center:
+                if center == previous_center:
+                    return mean
+                ratio = (target - previous_center) / (center - previous_center)
+                return previous_mean + ratio * (mean - previous_mean)
+            cumulated += weight
+            previous_center, previous_mean = center, mean
+        return self.centroids[-1][0]
+
+    def mad(self):
+        # median absolute deviation, estimated from the centroids (a second pass on the data is not possible)
+        median = self.quantile(0.5)
+        deviations = TDigest(self.compression)
+        for mean, weight in self.centroids:
+            deviations.add(abs(mean - median), weight)
+        return deviations.quantile(0.5)
+
+class Summary:
+    def __init__(self):
+        self.moments = Moments()
+        self.digest = TDigest()
+
+    def add(self, x):
+        self.moments.add(x)
+        self.digest.add(x)
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.digest.merge(other.digest)
+        return self
+
+    def report(self):
+        m = self.moments
+        median = self.digest.quantile(0.5)
+        mad = self.digest.mad()
+        result = {'count': m.count, 'mean': m.mean, 'std': m.std, 'min': m.min, 'max': m.max, 'mad': mad,
+                  'variability': (m.max-m.min)/m.mean,  # the old metric, very sensitive to the outliers
+                  'robust_variability': mad/median}
+        for q in QUANTILES:
+            result['q%g' % (100*q)] = self.digest.quantile(q)
+        return result
 
-def mean(l):
-    return sum(l)/len(l)
+def summarize_file(args):
+    # return a dict {group: Summary}, the group is a tuple of the values of the group_by columns
+    filename, column, group_by = args
+    summaries = defaultdict(Summary)
+    if column is None: # one value per line
+        for line in fileinput.input(filename):
+            if line.strip() != '':
+                summaries[()].add(float(line))
+        return dict(summaries)
+    with (open(filename) if filename != '-' else sys.stdin) as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        try:
+            value_index = header.index(column)
+            group_indices = [header.index(name) for name in group_by]
+        except ValueError as e:
+            raise ValueError('%s: %s' % (filename, e))
+        for row in reader:
+            try:
+                value = float(row[value_index])
+            except ValueError: # e.g. N/A
+                continue
+            summaries[tuple(row[i] for i in group_indices)].add(value)
+    return dict(summaries)
 
-def variability(l):
-    return (max(l)-min(l))/mean(l)
+def summarize_all(filenames, column=None, group_by=(), nb_workers=1):
+    jobs = [(filename, column, tuple(group_by)) for filename in filenames]
+    if nb_workers > 1 and len(jobs) > 1:
+        with Pool(nb_workers) as pool:
+            results = pool.map(summarize_file, jobs)
+    else:
+        results = map(summarize_file, jobs)
+    summaries = defaultdict(Summary)
+    for result in results:
+        for group, summary in result.items():
+            summaries[group].merge(summary)
+    return summaries
 
 if __name__ == '__main__':
-    times = [float(x) for x in fileinput.input()]
-    print(variability(times))
+    parser = argparse.ArgumentParser(description='Streaming statistics of timings.')
+    parser.add_argument('files', nargs='*', default=['-'],
+            help='Input files, either one value per line or CSV files with --column (default: standard input).')
+    parser.add_argument('--column', type=str, default=None,
+            help='Column of the CSV files to summarize (e.g. time).')
+    parser.add_argument('--group_by', type=lambda s: s.split(','), default=[],
+            help='Columns of the CSV files used to group the values (e.g. size,nb_threads).')
+    parser.add_argument('--nb_workers', type=int, default=1,
+            help='Number of files to process in parallel.')
+    args = parser.parse_args()
+    if len(args.group_by) > 0 and args.column is None:
+        parser.error('--group_by requires --column.')
+    summaries = summarize_all(args.files, args.column, args.group_by, args.nb_workers)
+    writer = csv.writer(sys.stdout)
+    header = None
+    for group, summary in sorted(summaries.items()):
+        report = summary.report()
+        if header is None:
+            header = list(args.group_by) + list(report)
+            writer.writerow(header)
+        writer.writerow(list(group) + list(report.values()))
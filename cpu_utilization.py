@@ -1,34 +1,26 @@
 #! /usr/bin/env python3
 
-import sys
 import random
-from subprocess import Popen, PIPE, DEVNULL
-import re
 import csv
-from math import log, floor
 from itertools import product
-from page_faults import measure_page_faults, compile_exec
+from page_faults import measure_all, compile_exec, get_parser, parse_args, gen_configurations
 
 MAX_ITER = 4
 
 if __name__ == '__main__':
-    if len(sys.argv) != 4:
-        print('Syntax: %s <nb_exp> <max_size> <CSV file>')
-        sys.exit(1)
+    args = parse_args(get_parser('CPU utilization of the shared malloc'))
     compile_exec()
-    nb_exp = int(sys.argv[1])
-    max_size = int(sys.argv[2])
-    file_name = sys.argv[3]
-    experiments = list(product(range(1, MAX_ITER+1), [True, False]))
-    with open(file_name, 'w') as f:
+    configurations = list(product(range(1, MAX_ITER+1), gen_configurations(args.modes, args.blocksizes)))
+    experiments = []
+    for exp in range(args.nb_exp):
+        random.shuffle(configurations)
+        size = random.randint(1, args.max_size)
+        experiments.extend((True, size, nb_iter, mode, blocksize) for nb_iter, (mode, blocksize) in configurations)
+    with open(args.csv_file, 'w') as f:
         csv_writer = csv.writer(f)
-        csv_writer.writerow(('size', 'mem_access', 'hugepage', 'system_time', 'user_time', 'total_time', 'nb_page_faults', 'cpu_utilization', 'memory_size'))
-        exp_id = 0
-        for exp in range(nb_exp):
-            experiments = list(experiments)
-            random.shuffle(experiments)
-            print('Experiment %d/%d' % (exp+1, nb_exp))
-            size = random.randint(1, max_size)
-            for nb_iter, hugepage in experiments:
-                sys_time, usr_time, total_time, nb_page_faults, cpu_utilization, memory_size = measure_page_faults(True, size, nb_iter, hugepage)
-                csv_writer.writerow((size, nb_iter, hugepage, sys_time, usr_time, total_time, nb_page_faults, cpu_utilization, memory_size))
+        csv_writer.writerow(('size', 'mem_access', 'mode', 'blocksize', 'system_time', 'user_time', 'total_time', 'nb_page_faults', 'major_page_faults',
+            'cpu_utilization', 'peak_rss', 'peak_pss', 'page_table_size', 'dtlb_load_misses', 'dtlb_store_misses'))
+        for i, ((shared, size, nb_iter, mode, blocksize), m) in enumerate(measure_all(experiments, args.nb_workers, not args.no_pinning)):
+            print('Experiment %d/%d' % (i+1, len(experiments)))
+            csv_writer.writerow((size, nb_iter, mode, blocksize, m.system_time, m.user_time, m.total_time, m.minor_page_faults, m.major_page_faults,
+                m.cpu_utilization, m.peak_rss, m.peak_pss, m.page_table_size, m.dtlb_load_misses, m.dtlb_store_misses))
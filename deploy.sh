@@ -28,7 +28,6 @@ for i in $*; do (
 	run_command $i 'for j in *.zip; do unzip $j; done'
 	echo "Stop copying on host $i"
 	echo "Start compiling on host $i"
-	run_command $i 'yes | apt install smemstat'
 	run_command $i 'wget https://bootstrap.pypa.io/get-pip.py && python3 get-pip.py && yes | apt install python3-dev && pip3 install lxml psutil pandas statsmodels'
 	run_command $i 'cd simgrid && mkdir build && cd build && cmake -Denable_documentation=OFF .. && make -j 32 && make install'
 	run_command $i 'cd hpl* && sed -ri "s|TOPdir\s*=.+|TOPdir="`pwd`"|g" Make.SMPI && make startup arch=SMPI && make SMPI_OPTS="-DSMPI_OPTIMIZATION" arch=SMPI' # use only the Phi coefficients
@@ -1,23 +1,95 @@
 #! /usr/bin/env python3
 
 import sys
+import math
+import argparse
+from collections import Counter
 import topology
 
+# Layout of the SVG rendering (in pixels)
+SPACING = 24      # horizontal distance between two glyphs
+LEVEL_GAP = 80    # vertical distance between two levels
+MARGIN = 40
+RADIUS = 6
+
+def level_layout(topo, threshold):
+    # For each level, the number of switches aggregated in a glyph and the number of glyphs. The index of a switch of
+    # level l is a mixed radix number whose digits are, from the least significant, in up[:l+1] then in down[l+1:] (see
+    # FatTree.switch_edges). A glyph is made of the switches which only differ by their trailing digits, i.e. one set of
+    # identical sub-trees, with as few trailing digits as possible so that the level has at most threshold glyphs.
+    layout = []
+    for l in range(len(topo.down)):
+        nb_switches = topo.nb_switches(l)
+        group = 1
+        for radix in topo.up[:l+1] + topo.down[l+1:]:
+            if nb_switches // group <= threshold:
+                break
+            group *= radix
+        layout.append((group, nb_switches // group))
+    return layout
+
+def glyph_x(index, nb_glyphs, width):
+    return MARGIN + (index + 0.5) * (width - 2*MARGIN) / nb_glyphs
+
+def dump_svg_topology(topo, fd, y_offset, width, threshold):
+    # written in a single pass: the edges (bundled by pair of glyphs), then the switches, then the caption
+    nb_levels = len(topo.down)
+    layout = level_layout(topo, threshold)
+    y = lambda l: y_offset + (nb_levels - 1 - l) * LEVEL_GAP
+    for l in range(1, nb_levels):
+        child_group, nb_children = layout[l-1]
+        parent_group, nb_parents = layout[l]
+        bundles = Counter((child // child_group, parent // parent_group) for child, parent in topo.switch_edges(l))
+        for (child, parent), count in bundles.items():
+            nb_links = count * topo.parallel[l]
+            fd.write('<line x1="%.1f" y1="%.1f" x2="%.1f" y2="%.1f" stroke-width="%.2f"><title>%d links</title></line>\n' % (
+                glyph_x(child, nb_children, width), y(l-1), glyph_x(parent, nb_parents, width), y(l), 1 + math.log2(nb_links), nb_links))
+    for l, (group, nb_glyphs) in enumerate(layout):
+        for i in range(nb_glyphs):
+            x = glyph_x(i, nb_glyphs, width)
+            if group == 1:
+                fd.write('<circle cx="%.1f" cy="%.1f" r="%d"/>\n' % (x, y(l), RADIUS))
+            else:
+                fd.write('<rect x="%.1f" y="%.1f" width="%d" height="%d"/><text x="%.1f" y="%.1f">%d</text>\n' % (
+                    x - 2*RADIUS, y(l) - RADIUS, 4*RADIUS, 2*RADIUS, x, y(l) + RADIUS/2, group))
+            if l == 0: # the nodes are not drawn, only their number
+                fd.write('<text x="%.1f" y="%.1f">%d</text>\n' % (x, y(l) + 3*RADIUS, group * topo.down[0]))
+    fd.write('<text x="%.1f" y="%.1f" class="caption">%s</text>\n' % (width/2, y(-1) + RADIUS, topo))
+
+def topo_to_svg(topologies, filename, threshold=64):
+    heights = [len(topo.down) * LEVEL_GAP + MARGIN for topo in topologies]
+    width = 2*MARGIN + SPACING * max(nb_glyphs for topo in topologies for _, nb_glyphs in level_layout(topo, threshold))
+    with open(filename, 'w') as fd:
+        fd.write('<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" font-family="sans-serif" font-size="8">\n' % (
+            width, sum(heights) + MARGIN))
+        fd.write('<style>line {stroke: gray} circle, rect {fill: white; stroke: black} text {text-anchor: middle} '
+                 '.caption {font-size: 12px}</style>\n')
+        y_offset = MARGIN
+        for topo, height in zip(topologies, heights):
+            dump_svg_topology(topo, fd, y_offset, width, threshold)
+            y_offset += height
+        fd.write('</svg>\n')
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Draw fat-trees, in SVG (fast, for large trees), PDF or TeX (TikZ).')
+    parser.add_argument('file_name', type=str, help='Output file, its extension gives the format (svg, pdf or tex).')
+    parser.add_argument('topologies', nargs='+', help='Descriptions of the fat-trees.')
+    parser.add_argument('--threshold', type=int, default=64,
+            help='Maximal number of glyphs per level in SVG, larger levels are drawn by groups of identical sub-trees.')
+    args = parser.parse_args()
     topologies = []
-    if len(sys.argv) < 3:
-        print('Syntax: %s <file_name> <topologies>' % sys.argv[0])
-        sys.exit(1)
-    filename = sys.argv[1]
-    for descriptor in sys.argv[2:]:
+    for descriptor in args.topologies:
         topologies.extend(topology.FatTreeParser.parse(descriptor))
+    extension = args.file_name.split('.')[-1]
+    if extension == 'svg':
+        topo_to_svg(topologies, args.file_name, args.threshold)
+        sys.exit(0)
     for topo in topologies:
         topo.initialize()
-    extension = filename.split('.')[-1]
     if extension == 'pdf':
-        topology.topo_to_pdf(topologies, filename)
+        topology.topo_to_pdf(topologies, args.file_name)
     elif extension == 'tex':
-        topology.topo_to_tex(topologies, filename)
+        topology.topo_to_tex(topologies, args.file_name)
     else:
         print('Unknown extension: %s.' % extension)
         sys.exit(1)
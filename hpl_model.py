@@ -0,0 +1,60 @@
+#! /usr/bin/env python3
+
+# Cheap analytic model of HPL, used to rank the experiments before simulating them.
+# It follows the main loop of HPL (right-looking LU factorization, one panel of NB columns per iteration)
+# and uses the same linear models of dgemm and dtrsm than the simulation.
+
+from math import ceil, log2
+
+DOUBLE_SIZE = 8
+
+def log_steps(nb_proc):
+    if nb_proc <= 1:
+        return 0
+    return ceil(log2(nb_proc))
+
+def bcast_time(msg_size, nb_proc, bandwidth, latency, bcast=2):
+    if nb_proc <= 1:
+        return 0
+    if bcast in (0, 1):     # increasing ring (modified or not)
+        nb_steps = nb_proc - 1
+    elif bcast in (2, 3):   # increasing 2-ring (modified or not)
+        nb_steps = ceil((nb_proc-1)/2)
+    elif bcast in (4, 5):   # long (modified or not), scatter followed by an allgather
+        return (log_steps(nb_proc) + nb_proc - 1)*latency + 2*msg_size/bandwidth
+    else:
+        raise ValueError('Unknown broadcast algorithm: %s.' % bcast)
+    return nb_steps*latency + msg_size/bandwidth # the message is pipelined along the ring
+
+def linear_time(model, size):
+    coefficient, intercept = model
+    if size <= 0:
+        return 0
+    return coefficient*size + intercept
+
+def predict_time(size, P, Q, dgemm, dtrsm, network, NB=128, bcast=2, depth=1):
+    # Return the predicted time (in microseconds) of HPL.
+    # Parameters dgemm and dtrsm are the pairs <coefficient, intercept> given to the simulation,
+    # network is the pair <bandwidth, latency> of the platform (in bytes per second and seconds).
+    bandwidth, latency = network
+    total_time = 0
+    for col in range(0, size, NB):
+        nb = min(NB, size-col)
+        n = size - col              # order of the trailing matrix
+        mp = ceil(n/P)              # local rows of the panel
+        mp_update = ceil((n-nb)/P)  # local rows of the trailing matrix, without the panel
+        nq = ceil((n-nb)/Q)         # local columns of the trailing matrix
+        factorization = linear_time(dgemm, mp*nb*nb/2) + nb*log_steps(P)*latency # one pivot search per column
+        broadcast = bcast_time(mp*nb*DOUBLE_SIZE, Q, bandwidth, latency, bcast)
+        swap = log_steps(P)*(latency + nb*nq*DOUBLE_SIZE/bandwidth)
+        trsm = linear_time(dtrsm, nq*nb*nb)
+        update = linear_time(dgemm, mp_update*nq*nb)
+        if depth > 0: # the broadcast of the next panel is overlapped with the update
+            total_time += factorization + swap + trsm + max(broadcast, update)
+        else:
+            total_time += factorization + swap + trsm + broadcast + update
+    return total_time*1e6
+
+def predict_gflops(size, time):
+    # Same formula than HPL, time is in microseconds.
+    return (2/3*size**3 + 2*size**2) / (time*1e-6) * 1e-9
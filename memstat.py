@@ -1,13 +1,13 @@
 #!/usr/bin/env python3
 
-from subprocess import Popen
-from time import sleep
-import json
-from os.path import basename
+import os
+import time
+import locale
+import argparse
+from collections import deque
 from curses import wrapper
-import sys
 
-TMP_FILE = '/tmp/memstat.json'
+SPARKLINE = ' ▁▂▃▄▅▆▇█'
 
 def mem_to_human(size):
     size = float(size)
@@ -15,45 +15,118 @@ def mem_to_human(size):
     for s in reversed(sorted(units)):
         if size/s >= 1:
             return '%.3f %s' % (size/s, units[s])
+    return '0 B'
 
-def get_memory_usage(process_names):
-    process = Popen(['smemstat', '-q', '-o', TMP_FILE, '-p', ','.join(process_names)])
-    assert process.wait() == 0
-    with open(TMP_FILE, 'r') as f:
-        result = json.load(f)
-    result = result['smemstat']['smem-per-process']
+def parse_kb_fields(data, fields): # lines like 'Rss:    1404 kB', the values are returned in bytes
+    result = dict.fromkeys(fields, 0)
+    for line in data.split(b'\n'):
+        key, _, value = line.partition(b':')
+        key = key.decode('ascii', 'replace')
+        if key in result:
+            result[key] += int(value.split()[0])*1024
     return result
 
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def read_smaps(pid):
+    # smaps_rollup is only available since Linux 4.14, otherwise the values of all the mappings are summed
+    fields = ['Rss', 'Pss', 'Private_Clean', 'Private_Dirty', 'Swap', 'Shared_Hugetlb', 'Private_Hugetlb']
+    try:
+        return parse_kb_fields(read_file('/proc/%d/smaps_rollup' % pid), fields)
+    except FileNotFoundError:
+        if not os.path.exists('/proc/%d' % pid):
+            raise
+        return parse_kb_fields(read_file('/proc/%d/smaps' % pid), fields)
+
+def get_command(pid):
+    cmdline = read_file('/proc/%d/cmdline' % pid).split(b'\0')
+    if len(cmdline[0]) > 0:
+        return os.path.basename(cmdline[0].decode('utf-8', 'replace'))
+    return read_file('/proc/%d/comm' % pid).decode('utf-8', 'replace').strip() # kernel thread
+
+def read_process_memory(pid):
+    # all the values are in bytes, the USS is the memory which is private to the process (i.e. freed when it terminates)
+    smaps = read_smaps(pid)
+    status = parse_kb_fields(read_file('/proc/%d/status' % pid), ['VmPTE', 'HugetlbPages'])
+    return {'pid': pid,
+            'uss': smaps['Private_Clean'] + smaps['Private_Dirty'],
+            'pss': smaps['Pss'],
+            'rss': smaps['Rss'],
+            'swap': smaps['Swap'],
+            'page_table_size': status['VmPTE'],
+            'hugetlb': status['HugetlbPages'] or smaps['Shared_Hugetlb'] + smaps['Private_Hugetlb'],
+            'command': get_command(pid)}
+
+def list_pids():
+    return sorted(int(name) for name in os.listdir('/proc') if name.isdigit())
+
+def get_memory_usage(process_names=None, pids=None):
+    # Memory of the processes with the given names (or with the given PIDs, or all the readable processes), in a single
+    # pass on /proc. The processes which terminate during the pass or are not readable by this user are skipped.
+    names = set(process_names) if process_names is not None else None
+    result = []
+    for pid in (pids if pids is not None else list_pids()):
+        try:
+            if names is not None:
+                comm = read_file('/proc/%d/comm' % pid).decode('utf-8', 'replace').strip()
+                if comm not in names and get_command(pid) not in names: # comm is truncated to 15 characters
+                    continue
+            result.append(read_process_memory(pid))
+        except (FileNotFoundError, ProcessLookupError, PermissionError, IndexError, ValueError):
+            continue
+    return result
+
+def sparkline(values, width):
+    values = list(values)[-width:]
+    top = max(values) if len(values) > 0 else 0
+    if top == 0:
+        return ' '*len(values)
+    return ''.join(SPARKLINE[round(v/top*(len(SPARKLINE)-1))] for v in values)
+
 def format_entry(columns, column_sizes):
     return ' '.join(str(col).ljust(column_sizes[i]) for i, col in enumerate(columns))
 
-def format_output(result):
-    column_sizes = [5, 15, 15, 10]
-    columns = ['PID', 'USS', 'RSS', 'command']
+def format_output(result, history, history_size):
+    column_sizes = [7, 13, 13, 13, 13, 13, history_size, 10]
+    columns = ['PID', 'USS', 'PSS', 'RSS', 'page table', 'hugetlb', 'USS history', 'command']
     output = []
     output.append(format_entry(columns, column_sizes))
     for entry in result:
         output.append(format_entry([entry['pid'],
                                     mem_to_human(entry['uss']),
+                                    mem_to_human(entry['pss']),
                                     mem_to_human(entry['rss']),
+                                    mem_to_human(entry['page_table_size']),
+                                    mem_to_human(entry['hugetlb']),
+                                    sparkline(history[entry['pid']], history_size),
                                     entry['command']
                                     ],
                                     column_sizes))
     return output
 
-
-def main(stdscr, process_names):
+def main(stdscr, process_names, period, history_size=30):
+    history = {}
     while True:
+        result = get_memory_usage(process_names)
+        alive = {entry['pid'] for entry in result}
+        for pid in list(history):
+            if pid not in alive:
+                del history[pid]
+        for entry in result:
+            history.setdefault(entry['pid'], deque(maxlen=history_size)).append(entry['uss'])
         stdscr.clear()
-        output = format_output(get_memory_usage(process_names))
-        for i, line in enumerate(output):
-            stdscr.addstr(i, 0, line)
+        height, width = stdscr.getmaxyx()
+        for i, line in enumerate(format_output(result, history, history_size)[:height]):
+            stdscr.addstr(i, 0, line[:width-1])
         stdscr.refresh()
-        sleep(1)
-
+        time.sleep(period)
 
 if __name__ == '__main__':
-    if len(sys.argv) == 1:
-        sys.stderr.write('Syntax: %s <process_names>\n' % sys.argv[0])
-        sys.exit(1)
-    wrapper(main, sys.argv[1:])
+    parser = argparse.ArgumentParser(description='Memory usage of the processes, refreshed periodically.')
+    parser.add_argument('process_names', nargs='+', help='Names of the processes to monitor.')
+    parser.add_argument('--period', type=float, default=1, help='Refresh period (s).')
+    args = parser.parse_args()
+    locale.setlocale(locale.LC_ALL, '') # for the sparkline characters
+    wrapper(main, args.process_names, args.period)
@@ -0,0 +1,188 @@
+#! /usr/bin/env python3
+
+# Micro-benchmarks of the Python side of the experiments (parsing the descriptions, generating the platforms, parsing
+# the outputs, merging the results), on synthetic inputs of increasing scale. The baseline stores the times relative to
+# the one of a reference loop, so that it remains meaningful on another machine.
+
+import os
+import sys
+import json
+import math
+import time
+import gc
+import argparse
+import tempfile
+import pandas
+from topology import FatTree, FatTreeParser, IntSetParser, default_topo, CoreSpeedSetting
+from run_measures import AbstractRunner
+from compare_csv import compare_all
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cblas_tests'))
+import experiment
+
+def square_tree(scale): # fat-tree with (about) the given number of nodes
+    side = max(2, int(math.sqrt(scale)))
+    return FatTree([side, side], [1, 4], [1, 1])
+
+def bench_parse(scale, directory):
+    side = max(1, int(math.sqrt(scale)))
+    description = '2;1:%d,1:%d;1,1;1,1' % (side, side)
+    return lambda: FatTreeParser.parse(description)
+
+def bench_initialize(scale, directory):
+    tree = square_tree(scale)
+    return tree.initialize
+
+def bench_host_file(scale, directory):
+    tree = square_tree(scale)
+    return lambda: tree.dump_host_file(os.path.join(directory, 'host.txt'))
+
+def bench_topology_file(scale, directory):
+    # heterogeneous speeds, so that the platform is described host by host
+    tree = square_tree(scale)
+    tree.topo_settings = default_topo.updated(speed_classes=[(0.5, CoreSpeedSetting(1, 'Gf')), (0.5, CoreSpeedSetting(2, 'Gf'))])
+    return lambda: tree.dump_topology_file(os.path.join(directory, 'topo.xml'))
+
+def bench_parse_smpi(scale, directory):
+    # the output of the application (one line per rank) followed by the timings of SMPI and /usr/bin/time
+    runner = AbstractRunner([], [1], [1], 1, os.devnull)
+    lines = [b'[rank %d] iteration done, residual=1.234e-05' % i for i in range(scale)]
+    lines += [b'Simulated time: 12.5 seconds.',
+              b'The simulation took 3.25 seconds (after parsing and platform setup)',
+              b'2.125 seconds were actual computation of the application',
+              b'/usr/bin/time:output 1.50 0.25 0 12345 98%', b'']
+    output = b'\n'.join(lines)
+    return lambda: runner.parse_smpi(output, ['smpirun'])
+
+class SyntheticProgram(experiment.Program):
+    header = ['call_index', 'time']
+    key = ['run_index', 'call_index']
+
+    def __command_line__(self):
+        return []
+
+    def __environment_variables__(self):
+        return {}
+
+    def __fetch_data__(self):
+        pass
+
+def bench_merge_data(scale, directory):
+    nb_calls = min(scale, 100)
+    index = pandas.RangeIndex(scale)
+    program = SyntheticProgram()
+    program.data = pandas.DataFrame({'call_index': index % nb_calls, 'time': index * 1e-3, 'run_index': index // nb_calls})
+    other = pandas.DataFrame({'run_index': index // nb_calls, 'call_index': index % nb_calls, 'frequency': index * 1e6})
+    return lambda: program.merge_data(other)
+
+def bench_compare_all(scale, directory):
+    # every row of the second file has a single matching row in the first one, with the same values
+    index = pandas.RangeIndex(scale)
+    df = pandas.DataFrame({'size': index % 100, 'nb_proc': index // 100, 'time': index + 1.0, 'memory_size': index * 1e3 + 1,
+        'index': index + 1, 'filename': 'control.csv'})
+    return lambda: compare_all(df, df, ['size', 'nb_proc'])
+
+# name: (function returning the function to measure for a given scale, writing its files in the given temporary
+# directory, largest scale it can handle in reasonable time)
+benchmarks = {
+    'FatTreeParser.parse'           : (bench_parse,         10**6),
+    'FatTree.initialize'            : (bench_initialize,    10**6),
+    'FatTree.dump_host_file'        : (bench_host_file,     10**6),
+    'FatTree.dump_topology_file'    : (bench_topology_file, 10**5),
+    'AbstractRunner.parse_smpi'     : (bench_parse_smpi,    10**6),
+    'Program.merge_data'            : (bench_merge_data,    10**6),
+    'compare_csv.compare_all'       : (bench_compare_all,   10**4), # quadratic, one filtering of the first file per row
+}
+
+def reference_loop():
+    total = 0
+    for i in range(200000):
+        total += i*i
+    return total
+
+def measure(func, repeat, min_time=0.2):
+    # best time of a call, each measure calling the function for at least min_time (for the tiny inputs), without the
+    # garbage collector (like timeit), whose runs depend on the previous allocations
+    gc.collect()
+    gc.disable()
+    try:
+        best = min(measure_once(func, min_time) for _ in range(repeat))
+    finally:
+        gc.enable()
+    return best
+
+def measure_once(func, min_time):
+    nb_calls = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        nb_calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed/nb_calls
+
+def run_all(names, scales, repeat):
+    # return {benchmark: (time, time relative to the reference loop)}, the reference loop being measured right before
+    # each benchmark, in the same conditions (e.g. the load of the machine, the frequency of the CPU)
+    results = {}
+    for name in names:
+        gen_func, max_scale = benchmarks[name]
+        for scale in sorted(scales):
+            if scale > max_scale:
+                continue
+            with tempfile.TemporaryDirectory() as directory:
+                func = gen_func(scale, directory)
+                reference = measure(reference_loop, repeat)
+                duration = measure(func, repeat)
+            results['%s@%d' % (name, scale)] = (duration, duration/reference)
+    return results
+
+def compare(results, baseline, threshold):
+    # return the list of the regressions
+    regressions = []
+    print('%-45s %12s %10s' % ('benchmark', 'time (s)', 'vs base'))
+    for key, (duration, relative) in results.items():
+        line = '%-45s %12.3e' % (key, duration)
+        if baseline is not None and key in baseline:
+            ratio = relative / baseline[key]
+            line += ' %9.2fx' % ratio
+            if ratio > 1 + threshold:
+                line += '  REGRESSION'
+                regressions.append(key)
+        print(line)
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Micro-benchmarks of topology.py, run_measures.py, experiment.py and compare_csv.py on synthetic inputs.')
+    parser.add_argument('--scales', type=lambda s: IntSetParser.parse(s),
+            default={10**2, 10**4, 10**6}, help='Sizes of the synthetic inputs (number of nodes, of topologies, of lines or of rows), the benchmarks skip the sizes too large for them.')
+    parser.add_argument('--benchmarks', type=lambda s: s.split(','),
+            default=list(benchmarks), help='Benchmarks to run, comma-separated (default: all of them, i.e. %s).' % ','.join(benchmarks))
+    parser.add_argument('--repeat', type=int, default=5,
+            help='Number of measures of each benchmark, the best one is kept.')
+    parser.add_argument('--baseline', type=str, default='microbench_baseline.json',
+            help='Path of the JSON file of the baseline.')
+    parser.add_argument('--save', action='store_true',
+            help='Save the results in the baseline (the benchmarks which are not run keep their previous value).')
+    parser.add_argument('--threshold', type=float, default=0.25,
+            help='Relative slowdown compared to the baseline above which a benchmark is a regression.')
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in benchmarks:
+            parser.error('Unknown benchmark %s, must be one of %s.' % (name, ', '.join(benchmarks)))
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = run_all(args.benchmarks, args.scales, args.repeat)
+    regressions = compare(results, baseline, args.threshold)
+    if args.save:
+        baseline = dict(baseline or {}, **{key: relative for key, (_, relative) in results.items()})
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+        print('Baseline saved in %s.' % args.baseline)
+    elif baseline is None:
+        print('No baseline (%s), use --save to record one.' % args.baseline)
+    if len(regressions) > 0 and not args.save:
+        sys.stderr.write('%d regression(s) above %d%%: %s\n' % (len(regressions), args.threshold*100, ', '.join(regressions)))
+        sys.exit(1)
@@ -11,8 +11,21 @@
 // sudo mount none /tmp/huge -t hugetlbfs -o rw,mode=0777
 // sudo sh -c 'echo 1 >> /proc/sys/vm/nr_hugepages'
 
-// Test the shared malloc with a size of 1000000 bytes and 7 writes to the whole buffer:
-// ./page_faults 1 1000000 7
+// 1GiB huge page settings (allocation mode 4):
+// mkdir /tmp/huge1G
+// sudo mount none /tmp/huge1G -t hugetlbfs -o rw,mode=0777,pagesize=1G
+// sudo sh -c 'echo 1 >> /sys/kernel/mm/hugepages/hugepages-1048576kB/nr_hugepages'
+
+// Allocation modes:
+// 0: pages populated at allocation (MAP_POPULATE), malloc for a non-shared allocation
+// 1: 2MiB huge pages (hugetlbfs for a shared allocation, MAP_HUGETLB otherwise)
+// 2: lazy allocation, pages are allocated at their first access
+// 3: transparent huge pages (madvise(MADV_HUGEPAGE)), lazy allocation
+// 4: 1GiB huge pages (hugetlbfs for a shared allocation, MAP_HUGETLB otherwise)
+
+// Test the shared malloc with a size of 1000000 bytes, 7 writes to the whole buffer, populated pages and a block size of 2MiB:
+// ./page_faults 1 1000000 7 0 2097152
+// The program outputs the time, then the number of dTLB load and store misses (-1 if they cannot be measured).
 
 #include <stdio.h>
 #include <stdlib.h>
@@ -22,6 +35,9 @@
 #include <stdint.h>
 #include <string.h>
 #include <sys/time.h>
+#include <sys/ioctl.h>
+#include <sys/syscall.h>
+#include <linux/perf_event.h>
 
 
 #ifdef VERBOSE
@@ -34,15 +50,37 @@
 
 
 #define huge_filename "/tmp/huge/test-XXXXXX"
+#define huge_1g_filename "/tmp/huge1G/test-XXXXXX"
 #define filename "/tmp/test-XXXXXX"
 
-static const size_t blocksize = 1<<21;
+#ifndef MAP_HUGE_SHIFT
+#define MAP_HUGE_SHIFT 26
+#endif
+#ifndef MAP_HUGE_1GB
+#define MAP_HUGE_1GB (30 << MAP_HUGE_SHIFT)
+#endif
+
+enum {MODE_POPULATE=0, MODE_HUGETLBFS=1, MODE_LAZY=2, MODE_THP=3, MODE_HUGETLBFS_1G=4, NB_MODES};
+
+static size_t blocksize = 1<<21;
 
 static int bogusfile=-1;
 static void *allocated_ptr = NULL;
 static size_t allocated_size = -1;
 
-void* shared_malloc(size_t size, int hugepage) {
+int is_hugetlb(int mode) {
+    return mode == MODE_HUGETLBFS || mode == MODE_HUGETLBFS_1G;
+}
+
+size_t page_size(int mode) {
+    if(mode == MODE_HUGETLBFS)
+        return 1<<21;
+    if(mode == MODE_HUGETLBFS_1G)
+        return 1<<30;
+    return sysconf(_SC_PAGESIZE);
+}
+
+void* shared_malloc(size_t size, int mode) {
     void *mem;
     /* First reserve memory area */
     allocated_size = size+2*blocksize;
@@ -58,12 +96,18 @@ void* shared_malloc(size_t size, int hugepage) {
      * It still exists in memory but not in the file system (thus it cannot be leaked). */
     if(bogusfile == -1) {
         char name[30];
-        if(hugepage)
+        if(mode == MODE_HUGETLBFS)
             strcpy(name, huge_filename);
+        else if(mode == MODE_HUGETLBFS_1G)
+            strcpy(name, huge_1g_filename);
         else
             strcpy(name, filename);
         bogusfile = mkstemp(name);
-        if(!hugepage) {
+        if(bogusfile < 0) {
+            perror("mkstemp");
+            return NULL;
+        }
+        if(!is_hugetlb(mode)) {
             char* dumb = (char*)calloc(1, blocksize);
             ssize_t err = write(bogusfile, dumb, blocksize);
             assert(err > 0);
@@ -71,11 +115,11 @@ void* shared_malloc(size_t size, int hugepage) {
         }
         unlink(name);
     }
-    int flag;
-    if(hugepage)
-        flag = MAP_FIXED | MAP_SHARED | MAP_POPULATE | MAP_HUGETLB;
-    else
-        flag = MAP_FIXED | MAP_SHARED | MAP_POPULATE;
+    int flag = MAP_FIXED | MAP_SHARED;
+    if(mode != MODE_LAZY && mode != MODE_THP)
+        flag |= MAP_POPULATE;
+    if(is_hugetlb(mode))
+        flag |= MAP_HUGETLB;
     unsigned int i;
     /* Map the bogus file in place of the anonymous memory */
     for (i = 0; i < size / blocksize; i++) {
@@ -93,22 +137,44 @@ void* shared_malloc(size_t size, int hugepage) {
     if (size % blocksize) {
         void* pos = (void*)((unsigned long)mem + i * blocksize);
         void* res = mmap(pos, (size % blocksize), PROT_READ | PROT_WRITE,
-                         MAP_FIXED | MAP_SHARED | MAP_POPULATE, bogusfile, 0);
+                         flag & ~MAP_HUGETLB, bogusfile, 0);
         assert(res == pos);
         print("mmap*     : %p - %p\n", pos, pos+blocksize+size%blocksize);
     }
+    if(mode == MODE_THP && madvise(mem, size, MADV_HUGEPAGE) < 0)
+        perror("madvise");
     return mem;
 }
 
-void *allocate(size_t size, int shared, int hugepage) {
+void *private_malloc(size_t size, int mode) {
+    int flag = MAP_ANONYMOUS | MAP_PRIVATE;
+    if(mode == MODE_HUGETLBFS)
+        flag |= MAP_HUGETLB;
+    else if(mode == MODE_HUGETLBFS_1G)
+        flag |= MAP_HUGETLB | MAP_HUGE_1GB;
+    size_t pagesize = page_size(mode);
+    allocated_size = (size+pagesize-1) / pagesize * pagesize;
+    allocated_ptr = mmap(NULL, allocated_size, PROT_READ | PROT_WRITE, flag, -1, 0);
+    if(allocated_ptr == MAP_FAILED) {
+        perror("mmap");
+        return NULL;
+    }
+    if(mode == MODE_THP && madvise(allocated_ptr, allocated_size, MADV_HUGEPAGE) < 0)
+        perror("madvise");
+    return allocated_ptr;
+}
+
+void *allocate(size_t size, int shared, int mode) {
     if(shared)
-        return shared_malloc(size, hugepage);
-    else
+        return shared_malloc(size, mode);
+    else if(mode == MODE_POPULATE)
         return malloc(size);
+    else
+        return private_malloc(size, mode);
 }
 
-void deallocate(void *ptr, size_t size, int shared) {
-    if(shared) {
+void deallocate(void *ptr, size_t size, int shared, int mode) {
+    if(shared || mode != MODE_POPULATE) {
         if(munmap(allocated_ptr, allocated_size) < 0) {
             perror("munmap_final");
         }
@@ -119,28 +185,63 @@ void deallocate(void *ptr, size_t size, int shared) {
         free(ptr);
 }
 
+int open_tlb_counter(int operation) {
+    struct perf_event_attr attr;
+    memset(&attr, 0, sizeof(attr));
+    attr.size = sizeof(attr);
+    attr.type = PERF_TYPE_HW_CACHE;
+    attr.config = PERF_COUNT_HW_CACHE_DTLB | (operation << 8) | (PERF_COUNT_HW_CACHE_RESULT_MISS << 16);
+    attr.disabled = 1;
+    attr.exclude_kernel = 1;
+    attr.exclude_hv = 1;
+    return syscall(__NR_perf_event_open, &attr, 0, -1, -1, 0);
+}
+
+long long read_counter(int fd) {
+    long long value;
+    if(fd < 0 || read(fd, &value, sizeof(value)) != sizeof(value))
+        return -1;
+    return value;
+}
+
 int main(int argc, char *argv[]) {
-    if(argc != 5) {
-        printf("Syntax: %s <shared_allocation> <allocation_size> <mem_access> <huge_page>", argv[0]);
+    if(argc != 5 && argc != 6) {
+        printf("Syntax: %s <shared_allocation> <allocation_size> <mem_access> <allocation_mode> [block_size]", argv[0]);
         exit(1);
     }
     int shared      = atoi(argv[1]);
     size_t size     = atol(argv[2]);
     int mem_access  = atoi(argv[3]);
-    int hugepage   = atoi(argv[4]);
+    int mode        = atoi(argv[4]);
+    if(argc == 6)
+        blocksize   = atol(argv[5]);
+    if(mode < 0 || mode >= NB_MODES) {
+        printf("Wrong allocation mode: %d.\n", mode);
+        exit(1);
+    }
+    if(shared && (blocksize == 0 || (blocksize & (blocksize-1)) != 0 || blocksize % page_size(mode) != 0)) {
+        printf("Wrong block size: %zu (must be a power of two and a multiple of the page size).\n", blocksize);
+        exit(1);
+    }
+    int load_misses = open_tlb_counter(PERF_COUNT_HW_CACHE_OP_READ);
+    int store_misses = open_tlb_counter(PERF_COUNT_HW_CACHE_OP_WRITE);
     struct timeval before = {};
     struct timeval after = {};
+    ioctl(load_misses, PERF_EVENT_IOC_ENABLE, 0);
+    ioctl(store_misses, PERF_EVENT_IOC_ENABLE, 0);
     gettimeofday(&before, NULL);\
-    uint8_t *buff   = allocate(size, shared, hugepage);
+    uint8_t *buff   = allocate(size, shared, mode);
     if(buff == NULL) {
         printf("Error with allocation.\n");
         exit(1);
     }
     for(int i = 0; i < mem_access; i++)
         memset(buff, i, size);
-    deallocate(buff, size, shared);
+    deallocate(buff, size, shared, mode);
     gettimeofday(&after, NULL);
+    ioctl(load_misses, PERF_EVENT_IOC_DISABLE, 0);
+    ioctl(store_misses, PERF_EVENT_IOC_DISABLE, 0);
     double real_time = (after.tv_sec-before.tv_sec) + 1e-6*(after.tv_usec-before.tv_usec);\
-    printf("%g\n", real_time);
+    printf("%g %lld %lld\n", real_time, read_counter(load_misses), read_counter(store_misses));
     return 0;
 }
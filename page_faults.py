@@ -1,41 +1,183 @@
 #! /usr/bin/env python3
 
+import os
 import sys
+import glob
 import random
+import argparse
+import queue
 from subprocess import Popen, PIPE, DEVNULL
-import re
 import csv
-import psutil
-from math import log, floor
+from collections import namedtuple
+from topology import IntSetParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from itertools import product
 import time
 
-def measure_page_faults(shared, size, mem_access, hugepage):
-    initial_free_memory = psutil.virtual_memory().available
-    memory_size = 0
-    p = Popen(['/usr/bin/time', '-f', '%S %U %F %R %P', './page_faults', str(int(shared)), str(size), str(int(mem_access)), str(int(hugepage))],
-            stdout = PIPE, stderr = PIPE)
-    sleep_time = 0.05
-    while p.poll() is None:
-        memory_size = max(memory_size, initial_free_memory-psutil.virtual_memory().available)
-        time.sleep(sleep_time)
-        sleep_time = max(1, sleep_time*2)
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+# Allocation modes of page_faults.c, in the order of their identifiers, with their page size
+ALLOCATION_MODES = ['populate', 'hugetlbfs', 'lazy', 'thp', 'hugetlbfs_1g']
+PAGE_SIZES = {'populate': 1<<12, 'hugetlbfs': 1<<21, 'lazy': 1<<12, 'thp': 1<<12, 'hugetlbfs_1g': 1<<30}
+DEFAULT_BLOCKSIZE = 1<<21 # same value than smpi/shared-malloc-blocksize in run_measures
+
+Measure = namedtuple('Measure', ['system_time', 'user_time', 'total_time', 'minor_page_faults', 'major_page_faults',
+                                 'cpu_utilization', 'peak_rss', 'peak_pss', 'page_table_size', 'dtlb_load_misses', 'dtlb_store_misses'])
+
+class ProcessSampler:
+    # The files are opened once and read with pread, the sampling can therefore be done at a millisecond resolution.
+    # The file smaps_rollup is bound to the memory of the process when it is opened, it is therefore only opened once the
+    # process runs the given command (and not a wrapper like numactl, which then execs it).
+    def __init__(self, pid, command=None):
+        self.pid = pid
+        self.command = command
+        self.stat_fd = os.open('/proc/%d/stat' % pid, os.O_RDONLY)
+        self.status_fd = os.open('/proc/%d/status' % pid, os.O_RDONLY)
+        self.comm_fd = os.open('/proc/%d/comm' % pid, os.O_RDONLY)
+        self.smaps_fd = None
+        self.smaps_available = True
+        self.error = None # last error of a sample, reported if no sample succeeded
+        self.nb_samples = 0
+        self.peak_rss = 0
+        self.peak_pss = 0
+        self.peak_page_table = 0
+
+    def open_smaps(self): # return False if the process does not run the command yet
+        if self.command is not None and os.pread(self.comm_fd, 64, 0).strip() != self.command.encode()[:15]: # comm is truncated
+            return False
+        try:
+            self.smaps_fd = os.open('/proc/%d/smaps_rollup' % self.pid, os.O_RDONLY)
+        except FileNotFoundError: # kernel older than 4.14
+            self.smaps_available = False
+        return True
+
+    def close(self):
+        os.close(self.stat_fd)
+        os.close(self.status_fd)
+        os.close(self.comm_fd)
+        if self.smaps_fd is not None:
+            os.close(self.smaps_fd)
+
+    def read_stat(self): # return the number of minor and major page faults, and the user and system times
+        data = os.pread(self.stat_fd, 4096, 0)
+        fields = data[data.rindex(b')')+2:].split() # the command name may contain spaces, fields[0] is the third field of the file
+        minor, major = int(fields[7]), int(fields[9])
+        user_time, system_time = int(fields[11])/CLOCK_TICKS, int(fields[12])/CLOCK_TICKS
+        return minor, major, user_time, system_time
+
+    def read_smaps(self): # return the RSS and PSS, in bytes
+        if self.smaps_fd is None:
+            return 0, 0
+        rss, pss = 0, 0
+        for line in os.pread(self.smaps_fd, 8192, 0).split(b'\n'):
+            if line.startswith(b'Rss:'):
+                rss = int(line.split()[1])*1024
+            elif line.startswith(b'Pss:'):
+                pss = int(line.split()[1])*1024
+        return rss, pss
+
+    def read_page_table_size(self): # in bytes
+        for line in os.pread(self.status_fd, 8192, 0).split(b'\n'):
+            if line.startswith(b'VmPTE:'):
+                return int(line.split()[1])*1024
+        return 0
+
+    def sample(self):
+        try:
+            if self.smaps_fd is None and self.smaps_available and not self.open_smaps():
+                return
+            rss, pss = self.read_smaps()
+            page_table = self.read_page_table_size()
+        except OSError as e: # in particular, the process may have just terminated
+            self.error = e
+            return
+        self.nb_samples += 1
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_pss = max(self.peak_pss, pss)
+        self.peak_page_table = max(self.peak_page_table, page_table)
+
+def has_exited(pid):
+    # does not reap the process, so that its final statistics can still be read in /proc
+    return os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+
+def get_mode_id(mode): # the mode is either its name or its identifier (a boolean for the old hugepage option)
+    if isinstance(mode, str):
+        return ALLOCATION_MODES.index(mode)
+    return int(mode)
+
+def measure_page_faults(shared, size, mem_access, mode, blocksize=DEFAULT_BLOCKSIZE, cpu=None, sampling_period=1e-3):
+    args = ['./page_faults', str(int(shared)), str(size), str(int(mem_access)), str(get_mode_id(mode)), str(blocksize)]
+    if cpu is not None:
+        args = ['numactl', '--physcpubind=%d' % cpu, '--localalloc'] + args
+    start = time.perf_counter()
+    p = Popen(args, stdout = PIPE, stderr = PIPE)
+    sampler = ProcessSampler(p.pid, 'page_faults')
+    try:
+        while not has_exited(p.pid):
+            sampler.sample()
+            time.sleep(sampling_period)
+        minor, major, usr_time, sys_time = sampler.read_stat()
+    finally:
+        sampler.close()
+    if sampler.nb_samples == 0 and sampler.error is not None:
+        print('Warning: the memory of the process could not be sampled (%s), its peak_rss, peak_pss and page_table_size are 0.' % sampler.error, file=sys.stderr)
     output = p.communicate()
-    total_time = float(output[0].decode('ascii'))
-    output = output[1].decode('ascii')
+    wall_time = time.perf_counter() - start
     assert p.wait() == 0
-    sys_time, usr_time, major, minor, cpu_percent = output.split()
-    sys_time = float(sys_time)
-    usr_time = float(usr_time)
-    major = int(major)
-    minor = int(minor)
-    cpu_utilization = cpu_percent[:-1]
-    if cpu_utilization == '?':
-        cpu_utilization = 'N/A'
+    total_time, load_misses, store_misses = output[0].decode('ascii').split()
+    load_misses, store_misses = [int(misses) if int(misses) >= 0 else 'N/A' for misses in (load_misses, store_misses)]
+    cpu_utilization = (usr_time + sys_time) / wall_time
+    return Measure(sys_time, usr_time, float(total_time), minor, major, cpu_utilization, sampler.peak_rss, sampler.peak_pss,
+            sampler.peak_page_table, load_misses, store_misses)
+
+def gen_configurations(modes, blocksizes):
+    # valid (mode, blocksize) pairs for a shared allocation, the block size must be a multiple of the page size
+    return [(mode, blocksize) for mode, blocksize in product(modes, blocksizes) if blocksize % PAGE_SIZES[mode] == 0]
+
+def parse_cpu_list(string):
+    cpus = []
+    for block in string.strip().split(','):
+        if '-' in block:
+            first, last = block.split('-')
+            cpus.extend(range(int(first), int(last)+1))
+        elif block != '':
+            cpus.append(int(block))
+    return cpus
+
+def get_numa_cpus():
+    # CPUs interleaved between the NUMA nodes, so that concurrent experiments are spread on all the nodes
+    nodes = []
+    for path in sorted(glob.glob('/sys/devices/system/node/node[0-9]*/cpulist')):
+        with open(path) as f:
+            nodes.append(parse_cpu_list(f.read()))
+    if len(nodes) == 0:
+        nodes = [sorted(os.sched_getaffinity(0))]
+    cpus = []
+    for i in range(max(len(node) for node in nodes)):
+        cpus.extend(node[i] for node in nodes if i < len(node))
+    return cpus
+
+def measure_all(experiments, nb_workers=1, pin=True):
+    # Run the experiments (tuples of arguments of measure_page_faults) on disjoint CPUs, yield them with their measures.
+    if pin:
+        cpus = get_numa_cpus()
+        if nb_workers > len(cpus):
+            raise ValueError('Cannot run %d workers on %d CPUs.' % (nb_workers, len(cpus)))
     else:
-        cpu_utilization = float(cpu_utilization)/100
-    assert major == 0
-    return sys_time, usr_time, total_time, minor, cpu_utilization, memory_size
+        cpus = [None]*nb_workers
+    available_cpus = queue.Queue()
+    for cpu in cpus[:nb_workers]:
+        available_cpus.put(cpu)
+    def run(exp):
+        cpu = available_cpus.get()
+        try:
+            return measure_page_faults(*exp, cpu=cpu)
+        finally:
+            available_cpus.put(cpu)
+    with ThreadPoolExecutor(max_workers=nb_workers) as executor:
+        futures = {executor.submit(run, exp): exp for exp in experiments}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
 
 def compile_exec():
     args = ['gcc', '-std=gnu11', '-O3', '-o', 'page_faults', 'page_faults.c', '-Wall']
@@ -43,23 +185,50 @@ def compile_exec():
     p = Popen(args, stdout=DEVNULL, stderr=DEVNULL)
     p.wait()
 
+def get_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('nb_exp', type=int, help='Number of experiments to perform.')
+    parser.add_argument('max_size', type=int, help='Maximal size of the allocation.')
+    parser.add_argument('csv_file', type=str, help='Path of the CSV file for the results.')
+    parser.add_argument('--nb_workers', type=int, default=1,
+            help='Number of experiments to run in parallel, each one pinned on its own CPU.')
+    parser.add_argument('--no_pinning', action='store_true',
+            help='Do not pin the experiments (numactl is not required in this case).')
+    parser.add_argument('--modes', type=lambda s: s.split(','), default=['populate', 'hugetlbfs'],
+            help='Allocation modes to test, among %s (default: populate,hugetlbfs).' % ','.join(ALLOCATION_MODES))
+    parser.add_argument('--blocksizes', type=lambda s: IntSetParser.parse(s), default={DEFAULT_BLOCKSIZE},
+            help='Block sizes of the shared allocation (default: %d).' % DEFAULT_BLOCKSIZE)
+    return parser
+
+def parse_args(parser):
+    args = parser.parse_args()
+    for mode in args.modes:
+        if mode not in ALLOCATION_MODES:
+            parser.error('Unknown allocation mode %s, available modes: %s.' % (mode, ','.join(ALLOCATION_MODES)))
+    for blocksize in args.blocksizes:
+        if blocksize & (blocksize-1) != 0: # also checked by page_faults.c, which would exit in the middle of the sweep
+            parser.error('Wrong block size %d, it must be a power of two.' % blocksize)
+    for mode in args.modes:
+        if not any(blocksize % PAGE_SIZES[mode] == 0 for blocksize in args.blocksizes): # otherwise gen_configurations would drop it
+            parser.error('None of the block sizes is a multiple of the page size of the mode %s (%d).' % (mode, PAGE_SIZES[mode]))
+    args.blocksizes = sorted(args.blocksizes)
+    return args
+
 if __name__ == '__main__':
-    if len(sys.argv) != 4:
-        print('Syntax: %s <nb_exp> <max_size> <CSV file>')
-        sys.exit(1)
+    args = parse_args(get_parser('Page faults of the shared malloc'))
     compile_exec()
-    nb_exp = int(sys.argv[1])
-    max_size = int(sys.argv[2])
-    file_name = sys.argv[3]
-    experiments = list(product([True, False], [True, False], [True, False]))
-    with open(file_name, 'w') as f:
+    configurations = [(True, mem_access, mode, blocksize) for mem_access, (mode, blocksize) in product([True, False], gen_configurations(args.modes, args.blocksizes))]
+    configurations += [(False, mem_access, mode, args.blocksizes[0]) for mem_access, mode in product([True, False], args.modes)] # the block size is only used by the shared allocation
+    experiments = []
+    for exp in range(args.nb_exp):
+        random.shuffle(configurations)
+        size = random.randint(1, args.max_size)
+        experiments.extend((shared, size, mem_access, mode, blocksize) for shared, mem_access, mode, blocksize in configurations)
+    with open(args.csv_file, 'w') as f:
         csv_writer = csv.writer(f)
-        csv_writer.writerow(('shared', 'size', 'mem_access', 'hugepage', 'system_time', 'user_time', 'total_time', 'nb_page_faults', 'cpu_utilization', 'memory_size'))
-        exp_id = 0
-        for exp in range(nb_exp):
-            print('Experiment %d/%d' % (exp+1, nb_exp))
-            random.shuffle(experiments)
-            size = random.randint(1, max_size)
-            for shared, mem_access, hugepage in experiments:
-                sys_time, usr_time, total_time, nb_page_faults, cpu_utilization, memory_size = measure_page_faults(shared, size, mem_access, hugepage)
-                csv_writer.writerow((shared, size, mem_access, hugepage, sys_time, usr_time, total_time, nb_page_faults, cpu_utilization, memory_size))
+        csv_writer.writerow(('shared', 'size', 'mem_access', 'mode', 'blocksize', 'system_time', 'user_time', 'total_time', 'nb_page_faults', 'major_page_faults',
+            'cpu_utilization', 'peak_rss', 'peak_pss', 'page_table_size', 'dtlb_load_misses', 'dtlb_store_misses'))
+        for i, ((shared, size, mem_access, mode, blocksize), m) in enumerate(measure_all(experiments, args.nb_workers, not args.no_pinning)):
+            print('Experiment %d/%d' % (i+1, len(experiments)))
+            csv_writer.writerow((shared, size, mem_access, mode, blocksize, m.system_time, m.user_time, m.total_time, m.minor_page_faults, m.major_page_faults,
+                m.cpu_utilization, m.peak_rss, m.peak_pss, m.page_table_size, m.dtlb_load_misses, m.dtlb_store_misses))
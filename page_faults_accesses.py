@@ -23,5 +23,5 @@ if __name__ == '__main__':
         for exp in range(nb_exp):
             print('Experiment %d/%d' % (exp+1, nb_exp))
             nb_access = random.randint(0, max_access)
-            sys_time, usr_time, nb_page_faults = measure_page_faults(True, size, nb_access)
-            csv_writer.writerow((size, nb_access, sys_time, usr_time, nb_page_faults))
+            m = measure_page_faults(True, size, nb_access, False)
+            csv_writer.writerow((size, nb_access, m.system_time, m.user_time, m.minor_page_faults))
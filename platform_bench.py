@@ -0,0 +1,103 @@
+#! /usr/bin/env python3
+import os
+import re
+import csv
+import random
+import argparse
+import itertools
+import tempfile
+from statistics import mean
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from topology import TopoParser, ROUTING_MODES
+from smpi_macros import run_command, print_green, error
+
+simulation_time_reg = re.compile(rb'The simulation took (?P<simulation>[-+]?[0-9]*\.?[0-9]+([eE][-+]?[0-9]+)?) seconds \(after parsing and platform setup\)')
+
+class Benchmark:
+    topo_file = 'topo.xml'
+    host_file = 'host.txt'
+    header = ('topology', 'nb_nodes', 'routing', 'nb_proc', 'wall_time', 'simulation_time', 'setup_time', 'peak_rss', 'peak_uss')
+
+    def __init__(self, topologies, routings, nb_runs, csv_file_name, running_power, nb_workers, nb_iter=1, sampling_period=0.01):
+        self.topologies = topologies
+        self.routings = routings
+        self.nb_runs = nb_runs
+        self.csv_file_name = csv_file_name
+        self.running_power = running_power
+        self.nb_workers = nb_workers
+        self.nb_iter = nb_iter
+        self.sampling_period = sampling_period
+        self.executable = os.path.abspath('network_test')
+        self.results = []
+
+    def run(self, topo, routing):
+        # one process per host, exchanging messages in a ring, so that the routes between all the neighbor hosts are
+        # used; the parsing and platform setup time is the part of the wall time which is not the simulation itself
+        nb_proc = topo.nb_cores()
+        with tempfile.TemporaryDirectory() as directory:
+            topo.dump_topology_file(os.path.join(directory, self.topo_file), routing, self.running_power)
+            topo.dump_host_file(os.path.join(directory, self.host_file))
+            args = ['smpirun', '--cfg=smpi/display-timing:yes', '--cfg=smpi/privatize-global-variables:yes',
+                    '-np', str(nb_proc), '-hostfile', self.host_file, '-platform', self.topo_file,
+                    self.executable, '1', str(self.nb_iter)]
+            output, wall_time, peak_rss, peak_uss = run_command(args, directory, self.sampling_period, keep_stderr=True)
+        match = simulation_time_reg.search(output[1])
+        if match is None:
+            error('could not find the simulation time in the output of: %s' % ' '.join(args))
+        simulation_time = float(match.group('simulation'))
+        return (str(topo), nb_proc // topo.core, routing, nb_proc, wall_time, simulation_time, wall_time - simulation_time, peak_rss, peak_uss)
+
+    def gen_exp(self):
+        all_exp = list(itertools.product(self.topologies, self.routings))
+        random.shuffle(all_exp)
+        return all_exp
+
+    def run_all(self):
+        with open(self.csv_file_name, 'w') as f:
+            csv_writer = csv.writer(f)
+            csv_writer.writerow(self.header)
+            with ThreadPoolExecutor(max_workers=self.nb_workers) as executor:
+                for n in range(self.nb_runs):
+                    print('%d/%d' % (n+1, self.nb_runs))
+                    for row in executor.map(lambda exp: self.run(*exp), self.gen_exp()):
+                        csv_writer.writerow(row)
+                        self.results.append(row)
+                    f.flush()
+        self.report()
+
+    def report(self):
+        values = defaultdict(lambda: defaultdict(list))
+        for row in self.results:
+            entry = dict(zip(self.header, row))
+            values[(entry['nb_nodes'], entry['topology'])][entry['routing']].append((entry['setup_time'], entry['peak_rss']))
+        for (nb_nodes, topo), results in sorted(values.items()):
+            print_green('%s (%d nodes)' % (topo, nb_nodes))
+            for routing in self.routings:
+                print('\t%-14s setup %8.3f s, peak RSS %8.1f MB' % (routing, mean(t for t, _ in results[routing]),
+                    mean(m for _, m in results[routing])*1e-6))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Benchmark of the parsing and platform setup (time and memory) of SMPI for the different routing modes.')
+    parser.add_argument('-n', '--nb_runs', type=int,
+            default=3, help='Number of experiments to perform.')
+    parser.add_argument('--routing', type=lambda s: s.split(','),
+            default=list(ROUTING_MODES), help='Routing modes to compare, comma-separated (default: all of them, i.e. %s).' % ','.join(ROUTING_MODES))
+    parser.add_argument('--running_power', type=float,
+            default=None, help='Running power of the host.')
+    parser.add_argument('--nb_iter', type=int,
+            default=1, help='Number of messages sent by each process.')
+    parser.add_argument('--nb_workers', type=int,
+            default=1, help='Number of simulations to run in parallel (the memory is per simulation, but the times are more noisy).')
+    required_named = parser.add_argument_group('required named arguments')
+    required_named.add_argument('--topo', type = lambda s: TopoParser.parse(s),
+            required=True, help='Description of the fat tree(s), or platform file (e.g. "2;16,32:64;1,16;1,1" for trees of growing sizes).')
+    required_named.add_argument('--csv_file', type = str,
+            required=True, help='Path of the CSV file for the results.')
+    args = parser.parse_args()
+    for routing in args.routing:
+        if routing not in ROUTING_MODES:
+            parser.error('Unknown routing mode %s, must be one of %s.' % (routing, ', '.join(ROUTING_MODES)))
+    benchmark = Benchmark(args.topo, args.routing, args.nb_runs, args.csv_file, args.running_power, args.nb_workers, args.nb_iter)
+    benchmark.run_all()
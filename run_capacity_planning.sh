@@ -6,5 +6,5 @@ nb_proc=$2
 for i in topologies/* ; do
     csvfile=$(basename $i .xml).csv
     echo $csvfile
-    ./run_measures.py --global_csv ${csvfile} --nb_runs 1 --size ${size} --nb_proc ${nb_proc} --topo $i --experiment HPL --running_power 5004882812.500 --hugepage /root/huge
+    ./run_measures.py --csv_file ${csvfile} --nb_runs 1 --size ${size} --nb_proc ${nb_proc} --topo $i --experiment HPL --running_power 5004882812.500 --hugepage /root/huge
 done
@@ -4,16 +4,23 @@ import sys
 import os
 import time
 import random
-from subprocess import Popen, PIPE, check_output, CalledProcessError
+from subprocess import Popen, PIPE
 import re
 from math import sqrt
 import csv
 import argparse
 import itertools
+import tempfile
+import multiprocessing
 import psutil
-from collections import namedtuple
+from statistics import mean
+from collections import namedtuple, defaultdict
 from memstat import get_memory_usage
-from topology import IntSetParser, TopoParser
+from topology import IntSetParser, NonNegativeIntSetParser, TopoParser, ROUTING_MODES, default_running_power
+from hpl_model import predict_time
+import tracing
+from tracing import Tracer
+from work_queue import WorkQueue, run_worker, print_status
 
 HPL_dat_text = '''HPLinpack benchmark input file
 Innovative Computing Laboratory, University of Tennessee
@@ -22,39 +29,69 @@ HPL.out      output file name (if any)
 1            # of problems sizes (N)
 {size}       # default: 29 30 34 35  Ns
 1            # default: 1            # of NBs
-128          # 1 2 3 4      NBs
-0            PMAP process mapping (0=Row-,1=Column-major)
+{NB}         # 1 2 3 4      NBs
+{PMAP}       PMAP process mapping (0=Row-,1=Column-major)
 1            # of process grids (P x Q)
 {P}          Ps
 {Q}          Qs
 16.0         threshold
 1            # of panel fact
-1        PFACTs (0=left, 1=Crout, 2=Right)
+{PFACT}      PFACTs (0=left, 1=Crout, 2=Right)
 1            # of recursive stopping criterium
-2          NBMINs (>= 1)
+{NBMIN}      NBMINs (>= 1)
 1            # of panels in recursion
-2            NDIVs
+{NDIV}       NDIVs
 1            # of recursive panel fact.
-2        RFACTs (0=left, 1=Crout, 2=Right)
+{RFACT}      RFACTs (0=left, 1=Crout, 2=Right)
 1            # of broadcast
-2            BCASTs (0=1rg,1=1rM,2=2rg,3=2rM,4=Lng,5=LnM)
+{BCAST}      BCASTs (0=1rg,1=1rM,2=2rg,3=2rM,4=Lng,5=LnM)
 1            # of lookahead depth
-1            DEPTHs (>=0)
-0            SWAP (0=bin-exch,1=long,2=mix)
-128           swapping threshold
-0            L1 in (0=transposed,1=no-transposed) form
-0            U  in (0=transposed,1=no-transposed) form
-1            Equilibration (0=no,1=yes)
-8            memory alignment in double (> 0)
+{DEPTH}      DEPTHs (>=0)
+{SWAP}       SWAP (0=bin-exch,1=long,2=mix)
+{SWAP_THRESHOLD}  swapping threshold
+{L1}         L1 in (0=transposed,1=no-transposed) form
+{U}          U  in (0=transposed,1=no-transposed) form
+{EQUIL}      Equilibration (0=no,1=yes)
+{ALIGN}      memory alignment in double (> 0)
 '''
 
+# Fields of HPL.dat that can be swept: name, default value, minimal value, maximal value (None if unbounded), description
+HPL_fields = [
+    ('NB',              128,    1,  None,   'block size'),
+    ('PMAP',            0,      0,  1,      'process mapping (0=Row-,1=Column-major)'),
+    ('PFACT',           1,      0,  2,      'panel factorization (0=left, 1=Crout, 2=Right)'),
+    ('NBMIN',           2,      1,  None,   'recursive stopping criterium'),
+    ('NDIV',            2,      2,  None,   'number of panels in recursion'),
+    ('RFACT',           2,      0,  2,      'recursive panel factorization (0=left, 1=Crout, 2=Right)'),
+    ('BCAST',           2,      0,  5,      'broadcast algorithm (0=1rg,1=1rM,2=2rg,3=2rM,4=Lng,5=LnM)'),
+    ('DEPTH',           1,      0,  None,   'lookahead depth'),
+    ('SWAP',            0,      0,  2,      'swapping algorithm (0=bin-exch,1=long,2=mix)'),
+    ('SWAP_THRESHOLD',  128,    1,  None,   'swapping threshold'),
+    ('L1',              0,      0,  1,      'form of L1 (0=transposed,1=no-transposed)'),
+    ('U',               0,      0,  1,      'form of U (0=transposed,1=no-transposed)'),
+    ('EQUIL',           1,      0,  1,      'equilibration (0=no,1=yes)'),
+    ('ALIGN',           8,      1,  None,   'memory alignment in double'),
+]
+
 float_string = b'[-+]?[0-9]*\.?[0-9]+([eE][-+]?[0-9]+)?'
 
+current_runner = None # runner used by the worker processes, they are forked so they share its state
+
+def init_worker():
+    current_runner.tracer.pop() # forget the spans of the main process, recorded before the fork
+
+def run_exp_worker(exp_index):
+    row = current_runner.run_exp_in_dir(current_runner.current_exp[exp_index])
+    return row, current_runner.tracer.pop() # the spans of the worker are sent back with the row
+
 class AbstractRunner:
 
     exec_name = 'smpimain'
     topo_file = 'topo.xml'
     host_file = 'host.txt'
+    name = None
+    metric = 'Gflops' # name of the throughput metric returned by parse_output
+    fields = [] # parameters of the application that can be swept: name, default value, minimal value, maximal value (None if unbounded), description
     simulation_time_str  = b'The simulation took (?P<simulation>%s) seconds \(after parsing and platform setup\)' % float_string
     application_time_str = b'(?P<application>%s) seconds were actual computation of the application' % float_string
     energy_str           = b'Total energy consumption: (?P<total_energy>%s) Joules \(used hosts: (?P<used_energy>%s) Joules; unused/idle hosts: (?P<unused_energy>%s)\)' % ((float_string,)*3)
@@ -62,7 +99,7 @@ class AbstractRunner:
     smpi_reg = re.compile(b'[\S\s]*%s[\S\s]*%s\n%s' % (full_time_str, simulation_time_str, application_time_str))
     smpi_energy_reg = re.compile(b'[\S\s]*%s' % energy_str)
 
-    def __init__(self, topologies, size, nb_proc, nb_runs, csv_file_name, energy=False, huge_page_mount=None, running_power=None, shuffle_hosts=False, P_Q=None):
+    def __init__(self, topologies, size, nb_proc, nb_runs, csv_file_name, energy=False, huge_page_mount=None, running_power=None, shuffle_hosts=False, P_Q=None, prune=None, nb_workers=1, app_params=None, routing=None, tracer=None):
         self.topologies = topologies
         self.size = size
         self.nb_proc = nb_proc
@@ -80,7 +117,19 @@ class AbstractRunner:
             self.default_args.append('--cfg=plugin:Energy')
         self.energy = energy
         self.initial_free_memory = psutil.virtual_memory().available
+        self.running_power = running_power
+        self.routing = routing
         self.shuffle_hosts = shuffle_hosts
+        self.prune = prune
+        self.nb_workers = nb_workers
+        self.tracer = tracer or Tracer(enabled=False)
+        self.app_params = {field[0]: [field[1]] for field in self.fields}
+        if app_params is not None:
+            self.app_params.update({name: sorted(values) for name, values in app_params.items() if values is not None})
+
+    @property
+    def params_header(self): # names of the parameters of the application, each one has its own column in the CSV
+        return [field[0] for field in self.fields]
 
     def check_params(self):
         topo_min_cores = min(self.topologies, key = lambda t: t.nb_cores())
@@ -96,14 +145,21 @@ class AbstractRunner:
 
     def prequel(self):
         self.check_params()
+        self.experiments = [(topo, nb_proc, size, params) for topo, nb_proc, size in itertools.product(self.topologies, self.nb_proc, self.size)
+                                for params in self.gen_params(topo, nb_proc, size)]
+        self.experiments = self.select_exp(self.experiments)
+        if self.prune is not None:
+            self.experiments = self.prune_exp(self.experiments)
+        self.results = []
         self.csv_file = open(self.csv_file_name, 'w')
         self.csv_writer = csv.writer(self.csv_file)
         if self.energy:
             energy_titles = ('total_energy', 'used_energy', 'unused_energy')
         else:
             energy_titles = tuple()
-        self.csv_writer.writerow(('topology', 'nb_roots', 'nb_proc', 'size', 'full_time', 'time', 'Gflops', *energy_titles, 'simulation_time', 'application_time',
-            'user_time', 'system_time', 'major_page_fault', 'minor_page_fault', 'cpu_utilization', 'uss', 'rss', 'page_table_size', 'memory_size'))
+        self.header = ('topology', 'nb_roots', 'nb_proc', 'size', *self.params_header, 'full_time', 'time', self.metric, *energy_titles, 'simulation_time', 'application_time',
+            'user_time', 'system_time', 'major_page_fault', 'minor_page_fault', 'cpu_utilization', 'uss', 'rss', 'page_table_size', 'memory_size')
+        self.csv_writer.writerow(self.header)
 
     def parse_smpi(self, output, args):
         match = self.smpi_reg.match(output)
@@ -141,41 +197,40 @@ class AbstractRunner:
         )
 
     @staticmethod
-    def get_pid(process_name):
-        result = check_output(['pidof', process_name]).split()
+    def get_pid(parent_pid, process_name):
+        # several simulations may run at the same time, so we look for the process among the descendants of smpirun
+        try:
+            children = psutil.Process(parent_pid).children(recursive=True)
+        except psutil.NoSuchProcess:
+            return None
+        result = []
+        for p in children:
+            try:
+                if p.name() == process_name:
+                    result.append(p.pid)
+            except psutil.NoSuchProcess: # another child which terminated during the scan
+                continue
+        if len(result) == 0:
+            return None
         assert len(result) == 1
-        return int(result[0])
-
-    @staticmethod
-    def get_page_table_size(pid):
-        result = check_output(['grep', 'VmPTE', '/proc/%d/status'%pid]).split()
-        assert len(result) == 3
-        assert result[0] == b'VmPTE:'
-        assert result[2] == b'kB'
-        return int(result[1])*1000
+        return result[0]
 
-
-    def get_max_memory(self, process_name, timeout):
+    def get_max_memory(self, parent_pid, process_name, timeout):
         sleep_time = 4
         uss, rss, page_table_size, memory_size = 0, 0, 0, 0
         time.sleep(sleep_time)
-        try:
-            pid = self.get_pid(process_name)
-        except CalledProcessError:
+        pid = self.get_pid(parent_pid, process_name)
+        if pid is None:
             return uss, rss, page_table_size, memory_size
         for i in range(int(timeout/sleep_time)):
             memory_size = max(memory_size, self.initial_free_memory-psutil.virtual_memory().available)
-            mem_usage = get_memory_usage([process_name])
-            if len(mem_usage) == 0:
+            mem_usage = get_memory_usage(pids=[pid])
+            if len(mem_usage) == 0: # the process has terminated
                 return uss, rss, page_table_size, memory_size
-            assert len(mem_usage) == 1
             mem_usage = mem_usage[0]
             uss = max(uss, mem_usage['uss'])
             rss = max(rss, mem_usage['rss'])
-            try:
-                page_table_size = max(page_table_size, self.get_page_table_size(pid))
-            except CalledProcessError:
-                return uss, rss, page_table_size, memory_size
+            page_table_size = max(page_table_size, mem_usage['page_table_size'])
             time.sleep(sleep_time)
         p = psutil.Process(pid)
         p.kill()
@@ -183,52 +238,207 @@ class AbstractRunner:
 
 
     def _run(self, args):
-        p = Popen(args, stdout = PIPE, stderr = PIPE)
-        try:
-            self.uss, self.rss, self.page_table_size, self.memory_size = self.get_max_memory(self.exec_name, timeout=10*60*60)
-        except TimeoutError as e:
-            p.terminate()
-            raise e
-        output = p.communicate()
-        self.parse_smpi(output[1], args)
-        process_exit_code = p.wait()
+        with self.tracer.span('smpirun', 'simulation'):
+            p = Popen(args, stdout = PIPE, stderr = PIPE)
+            try:
+                with self.tracer.span('memory_sampler'): # sleeps at least 4 seconds, even if the simulation is shorter
+                    self.uss, self.rss, self.page_table_size, self.memory_size = self.get_max_memory(p.pid, self.exec_name, timeout=10*60*60)
+            except TimeoutError as e:
+                p.terminate()
+                raise e
+            with self.tracer.span('communicate'):
+                output = p.communicate()
+            process_exit_code = p.wait()
+        with self.tracer.span('parse_smpi'):
+            self.parse_smpi(output[1], args)
         assert process_exit_code == 0
         return output[0]
 
 
-    def run(self, nb_proc, size): # return the time (in second) and the speed (in Gflops)
+    def gen_input_file(self, nb_proc, nb_core, size, params):
+        pass
+
+    def command_line(self, nb_proc, size, params): # command of the application, without smpirun
+        raise NotImplementedError()
+
+    def parse_output(self, output, nb_proc, size, params): # return the time (in second) and the throughput metric
         raise NotImplementedError()
 
+    def run(self, nb_proc, nb_core, size, params):
+        args = self.default_args + ['-np', str(nb_proc)] + self.command_line(nb_proc, size, params)
+        with self.tracer.span('gen_input_file'):
+            self.gen_input_file(nb_proc, nb_core, size, params)
+        output = self._run(args)
+        with self.tracer.span('parse_output'):
+            return self.parse_output(output, nb_proc, size, params)
+
+    def gen_params(self, topo, nb_proc, size): # return the list of parameters to try for this experiment
+        names = [field[0] for field in self.fields]
+        return [dict(zip(names, values)) for values in itertools.product(*[self.app_params[name] for name in names])]
+
+    def format_params(self, params):
+        return ' '.join('%s=%s' % (name, params[name]) for name in self.params_header)
+
+    def predict(self, topo, nb_proc, size, params): # return the predicted time (in microseconds), or None if it cannot be predicted
+        return None
+
+    def select_exp(self, all_exp):
+        return all_exp
+
+    @staticmethod
+    def is_dominated(candidate, others, delta=1e-3):
+        # a topology is dominated by another one if it has more roots for the same predicted time
+        prediction, topo, _ = candidate
+        return any(other_pred <= prediction*(1+delta) and other_topo.nb_roots() < topo.nb_roots() for other_pred, other_topo, _ in others)
+
+    def prune_exp(self, all_exp):
+        selected = []
+        candidates = defaultdict(list)
+        for topo, nb_proc, size, params in all_exp:
+            prediction = self.predict(topo, nb_proc, size, params)
+            if prediction is None: # uncertain, we have to simulate it
+                selected.append((topo, nb_proc, size, params))
+            else:
+                candidates[(nb_proc, size)].append((prediction, topo, params))
+        for (nb_proc, size), predictions in sorted(candidates.items()):
+            best = min(pred for pred, _, _ in predictions)
+            print('Predictions for nb_proc=%d size=%d:' % (nb_proc, size))
+            for prediction, topo, params in sorted(predictions, key=lambda c: c[0]):
+                if prediction > best*(1+self.prune):
+                    status = 'pruned (slow)'
+                elif self.is_dominated((prediction, topo, params), predictions):
+                    status = 'pruned (dominated)'
+                else:
+                    status = 'selected'
+                    selected.append((topo, nb_proc, size, params))
+                print('\t%s %s: %.3f s, %s' % (topo, self.format_params(params), prediction*1e-6, status))
+        print('Selected %d experiments out of %d.' % (len(selected), len(all_exp)))
+        return selected
+
+    def report_best(self):
+        throughput = defaultdict(lambda: defaultdict(list))
+        for row in self.results:
+            entry = dict(zip(self.header, row))
+            params = tuple(entry[name] for name in self.params_header)
+            throughput[(entry['topology'], entry['nb_proc'], entry['size'])][params].append(entry[self.metric])
+        print('Best configurations:')
+        for (topo, nb_proc, size), configs in sorted(throughput.items()):
+            params, best = max(((params, mean(values)) for params, values in configs.items()), key=lambda c: c[1])
+            params = self.format_params(dict(zip(self.params_header, params)))
+            print('\t%s nb_proc=%d size=%d: %s (%.2f %s)' % (topo, nb_proc, size, params, best, self.metric))
+
     def sequel(self):
         self.csv_file.close()
+        if len(self.params_header) > 0:
+            self.report_best()
 
     def gen_exp(self):
-        all_exp = list(itertools.product(self.topologies, self.nb_proc, self.size))
+        all_exp = list(self.experiments)
         random.shuffle(all_exp)
         return all_exp
 
+    def run_exp(self, exp): # return the row of the CSV, or None if the experiment failed
+        topo, nb_proc, size, params = exp
+        with self.tracer.profiled(), self.tracer.span('experiment', topology=str(topo), nb_proc=nb_proc, size=size, **params) as span_args:
+            try:
+                return self._run_exp(topo, nb_proc, size, params)
+            except TimeoutError:
+                span_args['timeout'] = True
+                print('\t\tTimeoutError (size=%d nb_proc=%d)' % (size, nb_proc))
+                return None
+
+    def _run_exp(self, topo, nb_proc, size, params):
+        self.current_topo = topo
+        with self.tracer.span('dump_topology_file'):
+            topo.dump_topology_file(self.topo_file, self.routing, self.running_power)
+        with self.tracer.span('dump_host_file'):
+            topo.dump_host_file(self.host_file, self.shuffle_hosts)
+        time, flops = self.run(nb_proc, topo.core, size, params)
+        return (str(topo), topo.nb_roots(), nb_proc, size, *[params[name] for name in self.params_header],
+            self.full_time, time, flops, *self.energy_metrics,
+            self.smpi_metrics.sim_time, self.smpi_metrics.app_time,
+            self.smpi_metrics.usr_time, self.smpi_metrics.sys_time,
+            self.smpi_metrics.major_page_fault, self.smpi_metrics.minor_page_fault,
+            self.smpi_metrics.cpu_utilization,
+            self.uss, self.rss, self.page_table_size, self.memory_size)
+
+    def run_exp_in_dir(self, exp):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory(dir=cwd) as directory:
+            os.chdir(directory)
+            try:
+                return self.run_exp(exp)
+            finally:
+                os.chdir(cwd)
+
     def run_all(self):
-        self.prequel()
+        global current_runner
+        with self.tracer.span('prequel'):
+            self.prequel()
         for i in range(1, self.nb_runs+1):
-            print('Iteration %d/%d' % (i, args.nb_runs))
-            exp = self.gen_exp()
-            for j, (topo, nb_proc, size) in enumerate(exp):
-                self.current_topo = topo
-                print('\tSub-iteration %d/%d' % (j+1, len(exp)))
-                topo.dump_topology_file(self.topo_file)
-                topo.dump_host_file(self.host_file, self.shuffle_hosts)
-                try:
-                    time, flops = self.run(nb_proc, topo.core, size)
-                except TimeoutError:
-                    print('\t\tTimeoutError (size=%d nb_proc=%d)' % (size, nb_proc))
-                    continue
-                self.csv_writer.writerow((topo, topo.nb_roots(), nb_proc, size, self.full_time, time, flops, *self.energy_metrics,
-                    self.smpi_metrics.sim_time, self.smpi_metrics.app_time,
-                    self.smpi_metrics.usr_time, self.smpi_metrics.sys_time,
-                    self.smpi_metrics.major_page_fault, self.smpi_metrics.minor_page_fault,
-                    self.smpi_metrics.cpu_utilization,
-                    self.uss, self.rss, self.page_table_size, self.memory_size))
-        self.sequel()
+            print('Iteration %d/%d' % (i, self.nb_runs))
+            self.current_exp = self.gen_exp()
+            pool = None
+            if self.nb_workers == 1:
+                rows = ((self.run_exp(exp), ([], [])) for exp in self.current_exp)
+            else:
+                current_runner = self
+                pool = multiprocessing.get_context('fork').Pool(self.nb_workers, initializer=init_worker)
+                rows = pool.imap_unordered(run_exp_worker, range(len(self.current_exp)))
+            try:
+                for j, (row, recorded) in enumerate(rows):
+                    self.tracer.merge(recorded)
+                    print('\tSub-iteration %d/%d' % (j+1, len(self.current_exp)))
+                    if row is not None:
+                        with self.tracer.span('write_csv'):
+                            self.csv_writer.writerow(row)
+                            self.csv_file.flush()
+                        self.results.append(row)
+            finally: # the workers are idle once all the rows are read, or killed if the iteration failed
+                if pool is not None:
+                    pool.terminate()
+                    pool.join()
+        with self.tracer.span('sequel'):
+            self.sequel()
+
+    def describe_exp(self, exp):
+        topo, nb_proc, size, params = exp
+        return ' '.join(['%s nb_proc=%d size=%d' % (topo, nb_proc, size), self.format_params(params)]).strip()
+
+    def run_queue(self, queue_path, config, lease_time=60, max_attempts=3, poll_period=1):
+        # the experiments are published in the queue, run by nb_workers local workers (and by the workers started with
+        # work_queue.py, the configuration being the command line to build the same runner) and their results are
+        # written in the CSV as they arrive; if the queue already exists, the sweep is resumed
+        with self.tracer.span('prequel'):
+            self.prequel()
+        queue = WorkQueue(queue_path)
+        queue_path = queue.path # absolute, the workers open it again
+        points = [(self.describe_exp(exp), exp) for _ in range(self.nb_runs) for exp in self.gen_exp()]
+        if not queue.publish(config, points, lease_time, max_attempts):
+            print('Resuming the sweep of %s.' % queue_path)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=run_worker, args=(queue_path, self, 'local-%d' % i)) for i in range(self.nb_workers)]
+        for worker in workers:
+            worker.start()
+        last_index = 0
+        while True:
+            finished = queue.is_finished() # before reading the results, so that the last ones are not missed
+            for last_index, row, recorded in queue.results(last_index):
+                self.tracer.merge(recorded)
+                print('\tResult %d/%d' % (last_index, len(points)))
+                if row is not None:
+                    with self.tracer.span('write_csv'):
+                        self.csv_writer.writerow(row)
+                        self.csv_file.flush()
+                    self.results.append(row)
+            if finished:
+                break
+            time.sleep(poll_period)
+        for worker in workers:
+            worker.join()
+        print_status(queue)
+        with self.tracer.span('sequel'):
+            self.sequel()
 
 def primes(n):
 # From http://stackoverflow.com/questions/16996217/prime-factorization-list
@@ -245,11 +455,19 @@ def primes(n):
 
 class HPL(AbstractRunner):
 
+    name = 'HPL'
     HPL_file_name = 'HPL.dat'
+    fields = HPL_fields
 
-    def __init__(self, *args):
-        super().__init__(*args)
+    def __init__(self, *args, dgemm=None, dtrsm=None, autotune=None, **kwargs):
+        super().__init__(*args, **kwargs)
         self.index = 0
+        self.dgemm = dgemm
+        self.dtrsm = dtrsm
+        if autotune is not None:
+            assert self.P_Q is None
+        self.autotune = autotune
+        self.xhpl = os.path.abspath('../hpl-2.2/bin/SMPI/xhpl') # absolute, the experiments may run in other directories
 
     def get_P_Q(self, nb_proc, nb_core):
         if self.P_Q is not None:
@@ -268,16 +486,56 @@ class HPL(AbstractRunner):
                 Q *= fact
         return P, Q
 
-    def gen_hpl_file(self, nb_proc, nb_core, size):
-        P, Q = self.get_P_Q(nb_proc, nb_core)
+    def get_grids(self, nb_proc, nb_core):
+        if self.autotune is None:
+            return [self.get_P_Q(nb_proc, nb_core)]
+        return [(P, nb_proc//P) for P in range(1, nb_proc+1) if nb_proc % P == 0]
+
+    @property
+    def params_header(self):
+        return ['P', 'Q'] + super().params_header
+
+    def gen_params(self, topo, nb_proc, size):
+        params = []
+        for P, Q in self.get_grids(nb_proc, topo.core):
+            for app_params in super().gen_params(topo, nb_proc, size):
+                params.append(dict(app_params, P=P, Q=Q))
+        return params
+
+    def predict(self, topo, nb_proc, size, params):
+        network = topo.network_parameters()
+        if network is None or self.dgemm is None or self.dtrsm is None:
+            return None
+        return predict_time(size, params['P'], params['Q'], self.dgemm, self.dtrsm, network,
+                NB=params['NB'], bcast=params['BCAST'], depth=params['DEPTH'])
+
+    def select_exp(self, all_exp):
+        # keep the best configurations according to the model, for each topology, number of processes and size
+        if self.autotune is None:
+            return all_exp
+        selected = []
+        candidates = defaultdict(list)
+        for topo, nb_proc, size, params in all_exp:
+            prediction = self.predict(topo, nb_proc, size, params)
+            if prediction is None: # uncertain, we have to simulate it
+                selected.append((topo, nb_proc, size, params))
+            else:
+                candidates[(topo, nb_proc, size)].append((prediction, params))
+        for (topo, nb_proc, size), predictions in candidates.items():
+            print('Best predicted configurations for %s nb_proc=%d size=%d:' % (topo, nb_proc, size))
+            for prediction, params in sorted(predictions, key=lambda c: c[0])[:self.autotune]:
+                print('\t%s: %.3f s' % (self.format_params(params), prediction*1e-6))
+                selected.append((topo, nb_proc, size, params))
+        return selected
+
+    def gen_input_file(self, nb_proc, nb_core, size, params):
         with open(self.HPL_file_name, 'w') as f:
-            f.write(HPL_dat_text.format(P=P, Q=Q, size=size))
+            f.write(HPL_dat_text.format(size=size, **params))
 
+    def command_line(self, nb_proc, size, params):
+        return [self.xhpl]
 
-    def run(self, nb_proc, nb_core, size): # we parse the ugly output...
-        args = self.default_args + ['-np', str(nb_proc)] + ['../hpl-2.2/bin/SMPI/xhpl']
-        self.gen_hpl_file(nb_proc, nb_core, size)
-        output_str = self._run(args)
+    def parse_output(self, output_str, nb_proc, size, params): # we parse the ugly output...
         self.index += 1
         output = [sub.split() for sub in output_str.split(b'\n')]
         for i, sub in enumerate(output):
@@ -290,6 +548,67 @@ class HPL(AbstractRunner):
         return time, flops
 
 
+class Matmul(AbstractRunner):
+    # Matrix product of smpi_macros.py, it prints its time on the standard output
+    name = 'matmul'
+    fields = [
+        ('smpi_sample',     1,      0,  1,      'macro SMPI_SAMPLE (0=disabled, 1=enabled)'),
+        ('smpi_malloc',     1,      0,  1,      'macro SMPI_SHARED_MALLOC (0=disabled, 1=enabled)'),
+    ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.executable = os.path.abspath('matmul')
+
+    def command_line(self, nb_proc, size, params):
+        return [self.executable, str(size), str(params['smpi_sample']), str(params['smpi_malloc'])]
+
+    def parse_output(self, output, nb_proc, size, params):
+        time = float(output)
+        return time, 2*size**3/time*1e-9
+
+class NAS(AbstractRunner):
+    # NAS parallel benchmarks, the size is the index of the class (1 for S, 2 for W, 3 for A, etc.)
+    metric = 'Mops'
+    kernel = None
+    classes = 'SWABCDEF'
+    time_reg = re.compile(b'\\s*Time in seconds\\s*=\\s*(?P<time>%s)' % float_string)
+    mops_reg = re.compile(b'\\s*Mop/s total\\s*=\\s*(?P<mops>%s)' % float_string)
+
+    def get_class(self, size):
+        if size > len(self.classes):
+            raise ValueError('Wrong size for the NAS benchmarks: %d (maximum is %d).' % (size, len(self.classes)))
+        return self.classes[size-1]
+
+    def command_line(self, nb_proc, size, params):
+        return [os.path.abspath('../NPB3.3-MPI/bin/%s.%s.%d' % (self.kernel, self.get_class(size), nb_proc))]
+
+    def parse_output(self, output, nb_proc, size, params):
+        time, mops = None, None
+        for line in output.split(b'\n'):
+            match = self.time_reg.match(line)
+            if match is not None:
+                time = float(match.group('time'))
+            match = self.mops_reg.match(line)
+            if match is not None:
+                mops = float(match.group('mops'))
+        if time is None or mops is None:
+            print('### ERROR ###')
+            print('Could not parse the output of the NAS benchmark:')
+            print(output.decode('utf-8'))
+            sys.exit(1)
+        return time, mops
+
+runner_classes = {cls.name: cls for cls in [HPL, Matmul]}
+for kernel in ['bt', 'cg', 'ep', 'ft', 'is', 'lu', 'mg', 'sp']:
+    runner_classes['NAS-%s' % kernel.upper()] = type('NAS_%s' % kernel.upper(), (NAS,), {'name': 'NAS-%s' % kernel.upper(), 'kernel': kernel})
+
+def get_runner_class(name):
+    try:
+        return runner_classes[name]
+    except KeyError:
+        raise ValueError('This experiment is not supported: %s.\nSupported values: %s.' % (name, list(runner_classes.keys())))
+
 def int_pair(string):
     a, b = (int(n) for n in string.split(','))
     return a, b
@@ -299,7 +618,12 @@ def float_pair(string):
     a, b = (float(n) for n in string.split(','))
     return a, b
 
-if __name__ == '__main__':
+all_fields = {} # fields of all the runners: name, application, default value, minimal value, maximal value, description
+for runner_class in runner_classes.values():
+    for field in runner_class.fields:
+        all_fields.setdefault(field[0], (runner_class.name, *field))
+
+def get_parser():
     parser = argparse.ArgumentParser(
             description='Experiment runner')
     parser.add_argument('-n', '--nb_runs', type=int,
@@ -316,25 +640,82 @@ if __name__ == '__main__':
     parser.add_argument('--P_Q', type = int_pair,
             default=None, help='Values to use for P and Q.')
     parser.add_argument('--running_power', type = float,
-            default=None, help='Running power of the host.')
+            default=None, help='Running power of the host, written in the platform file (default: %d for the fat-trees, unchanged for the platform files).' % default_running_power)
+    parser.add_argument('--routing', type=str, default=None, choices=ROUTING_MODES,
+            help='Routing of the AS containing the cluster, Cluster to use the routing of the cluster only (default: Full for the fat-trees, unchanged for the platform files).')
     required_named.add_argument('--csv_file', type = str,
             required=True, help='Path of the CSV file for the results.')
     required_named.add_argument('--topo', type = lambda s: TopoParser.parse(s),
-            required=True, help='Description of the fat tree(s).')
+            required=True, help='Description of the fat tree(s) (e.g. "2;16,32;1,16;1,1"), torus (e.g. "torus;8,8,8") or dragonfly (e.g. "dragonfly;9,1;4,1;8,1;4"), or platform file.')
     parser.add_argument('--shuffle_hosts', action='store_true',
             help='Shuffle the host list, therefore giving a random mapping.')
-    required_named.add_argument('--dgemm', type=float_pair, required=True,
-            help='Pair <coefficient, intercept> for the simulation of dgemm.')
-    required_named.add_argument('--dtrsm', type=float_pair, required=True,
-            help='Pair <coefficient, intercept> for the simulation of dtrsm.')
-    args = parser.parse_args()
+    parser.add_argument('--experiment', type=str, default='HPL', choices=list(runner_classes.keys()),
+            help='Application to simulate.')
+    parser.add_argument('--dgemm', type=float_pair, default=None,
+            help='Pair <coefficient, intercept> for the simulation of dgemm (required for HPL).')
+    parser.add_argument('--dtrsm', type=float_pair, default=None,
+            help='Pair <coefficient, intercept> for the simulation of dtrsm (required for HPL).')
+    parser.add_argument('--prune', type=float, default=None,
+            help='Use an analytic model of the application (only available for HPL) to only simulate the experiments whose predicted time is within the given ratio of the best one (e.g. 0.1 for 10%%), skipping the topologies dominated by a topology with less roots.')
+    parser.add_argument('--nb_workers', type=int, default=1,
+            help='Number of experiments to run in parallel, each one in its own temporary directory (the column memory_size is system-wide, so it is not meaningful with several workers); with --queue, number of local workers (0 to only use the workers of work_queue.py).')
+    parser.add_argument('--autotune', type=int, default=None,
+            help='Try all the P×Q grids (and the given values of the HPL.dat fields), rank them with an analytic model of HPL and only simulate the given number of best configurations for each topology, number of processes and size.')
+    parser.add_argument('--queue', type=str, default=None,
+            help='Path of a SQLite file, to run the experiments through a work queue: they are run by --nb_workers local workers and by the workers started with work_queue.py (e.g. on other nodes sharing the file); the sweep is resumed if the file exists and was created with the same command line.')
+    parser.add_argument('--lease_time', type=float, default=60,
+            help='Time (in seconds) after which the experiment of a worker which stopped renewing its lease is run again (only with --queue).')
+    parser.add_argument('--max_attempts', type=int, default=3,
+            help='Number of times an experiment is tried before being reported as failed (only with --queue).')
+    tracing.add_arguments(parser)
+    fields_group = parser.add_argument_group('application parameters', 'Values to use for the parameters of the application (e.g. the fields of HPL.dat), each one has its own column in the CSV.')
+    for app_name, name, default, min_value, max_value, description in all_fields.values():
+        set_parser = IntSetParser if min_value > 0 else NonNegativeIntSetParser
+        fields_group.add_argument('--%s' % name, type = set_parser.parse,
+                default=None, help='Values to use for the %s (%s, default: %d).' % (description, app_name, default))
+    return parser
+
+def get_runner(parser, args):
+    runner_class = get_runner_class(args.experiment)
     if (args.nb_proc is None and args.P_Q is None) or (args.nb_proc is not None and args.P_Q is not None):
         parser.error('Exactly one of --nb_proc and --P_Q is required.')
     if args.P_Q is not None:
         args.nb_proc = [args.P_Q[0] * args.P_Q[1]]
-    runner = HPL(args.topo, args.size, args.nb_proc, args.nb_runs, args.csv_file, args.energy, args.hugepage, args.running_power, args.shuffle_hosts, args.P_Q)
-    os.environ['SMPI_DGEMM_COEFFICIENT'] = str(args.dgemm[0])
-    os.environ['SMPI_DGEMM_INTERCEPT']   = str(args.dgemm[1])
-    os.environ['SMPI_DTRSM_COEFFICIENT'] = str(args.dtrsm[0])
-    os.environ['SMPI_DTRSM_INTERCEPT']   = str(args.dtrsm[1])
-    runner.run_all()
+    if args.autotune is not None and args.P_Q is not None:
+        parser.error('Options --autotune and --P_Q are incompatible.')
+    runner_fields = [field[0] for field in runner_class.fields]
+    for app_name, name, default, min_value, max_value, description in all_fields.values():
+        values = getattr(args, name)
+        if values is not None and name not in runner_fields:
+            parser.error('Option --%s is not available for the experiment %s.' % (name, args.experiment))
+        if values is not None and (min(values) < min_value or (max_value is not None and max(values) > max_value)):
+            parser.error('Wrong values for %s, they must be in [%s, %s].' % (name, min_value, max_value))
+    kwargs = {}
+    if runner_class is HPL:
+        if args.dgemm is None or args.dtrsm is None:
+            parser.error('Options --dgemm and --dtrsm are required for HPL.')
+        kwargs = {'dgemm': args.dgemm, 'dtrsm': args.dtrsm, 'autotune': args.autotune}
+    elif args.P_Q is not None or args.autotune is not None:
+        parser.error('Options --P_Q and --autotune are only available for HPL.')
+    runner = runner_class(args.topo, args.size, args.nb_proc, args.nb_runs, args.csv_file, args.energy, args.hugepage, args.running_power, args.shuffle_hosts, args.P_Q,
+            prune=args.prune, nb_workers=args.nb_workers, app_params={name: getattr(args, name) for name in runner_fields}, routing=args.routing, tracer=tracing.tracer_from_args(args), **kwargs)
+    if args.dgemm is not None:
+        os.environ['SMPI_DGEMM_COEFFICIENT'] = str(args.dgemm[0])
+        os.environ['SMPI_DGEMM_INTERCEPT']   = str(args.dgemm[1])
+    if args.dtrsm is not None:
+        os.environ['SMPI_DTRSM_COEFFICIENT'] = str(args.dtrsm[0])
+        os.environ['SMPI_DTRSM_INTERCEPT']   = str(args.dtrsm[1])
+    return runner
+
+if __name__ == '__main__':
+    parser = get_parser()
+    args = parser.parse_args()
+    runner = get_runner(parser, args)
+    if args.queue is None:
+        runner.run_all()
+    else:
+        try:
+            runner.run_queue(args.queue, sys.argv[1:], args.lease_time, args.max_attempts)
+        except ValueError as e:
+            parser.error(str(e))
+    runner.tracer.report(args.trace, args.profile)
@@ -0,0 +1,154 @@
+#! /usr/bin/env python3
+
+# Sensitivity analysis of HPL to the hardware parameters of a fat-tree: each parameter is divided and multiplied by a
+# factor (the other ones being unchanged), the variants are simulated with the parallel scheduler of run_measures (or
+# predicted with the analytic model) and the parameters are ranked by their impact on the throughput.
+
+import os
+import sys
+import argparse
+from math import log
+from statistics import mean
+from collections import defaultdict
+from topology import FatTree, FatTreeParser, ParseError, default_running_power
+from hpl_model import predict_time, predict_gflops
+from run_measures import HPL, float_pair
+
+def scaled(setting, factor):
+    return type(setting)(setting.value*factor, setting.unit)
+
+def parameter_settings(settings, nb_levels):
+    # for each parameter, a function returning the settings where this parameter is scaled by the given factor
+    links = [settings.link(l) for l in range(nb_levels)]
+    def scale_links(levels, bw_factor, lat_factor):
+        return [(scaled(bw, bw_factor), scaled(lat, lat_factor)) if l in levels else (bw, lat) for l, (bw, lat) in enumerate(links)]
+    all_levels = range(nb_levels)
+    result = {
+        'bw' : lambda f: settings.updated(level_links=scale_links(all_levels, f, 1)),
+        'lat': lambda f: settings.updated(level_links=scale_links(all_levels, 1, f)),
+    }
+    if settings.speed_classes is None:
+        result['speed'] = lambda f: settings.updated(core_speed=scaled(settings.parameters['speed'], f))
+    else:
+        classes = settings.speed_classes
+        result['speed'] = lambda f: settings.updated(speed_classes=[(frac, scaled(speed, f)) for frac, speed in classes])
+        for i in range(len(classes)):
+            result['speed_%d' % i] = lambda f, i=i: settings.updated(speed_classes=[(frac, scaled(speed, f) if j == i else speed)
+                for j, (frac, speed) in enumerate(classes)])
+    if nb_levels > 1:
+        for l in all_levels:
+            result['bw_%d' % l] = lambda f, l=l: settings.updated(level_links=scale_links([l], f, 1))
+            result['lat_%d' % l] = lambda f, l=l: settings.updated(level_links=scale_links([l], 1, f))
+    return result
+
+def gen_variants(tree, factor, parameters=None):
+    # return a dictionary {(parameter, direction): tree}, the base tree having the parameter None
+    variants = {(None, None): FatTree(tree.down, tree.up, tree.parallel, tree.topo_settings.updated(name='base'))}
+    for name, gen_settings in parameter_settings(tree.topo_settings, len(tree.down)).items():
+        if parameters is not None and name not in parameters:
+            continue
+        for direction, f in [('low', 1/factor), ('high', factor)]:
+            settings = gen_settings(f).updated(name='%s_%s' % (name, direction))
+            variants[(name, direction)] = FatTree(tree.down, tree.up, tree.parallel, settings)
+    return variants
+
+def other_model_parameters(variants):
+    # parameters whose variants are not simulated with the same network model as the base tree: a cluster tag (with
+    # the load balancing of the fat-tree over its roots) on one side, an explicit platform with a single shortest path
+    # on the other side, their elasticities cannot be compared
+    base = variants[(None, None)]
+    nb_levels = len(base.down)
+    uniform = base.topo_settings.is_uniform(nb_levels)
+    return sorted({name for (name, _), topo in variants.items() if name is not None and topo.topo_settings.is_uniform(nb_levels) != uniform})
+
+def predict_variant(runner, topo, nb_proc, size, running_power):
+    # the simulated durations of dgemm and dtrsm are converted in flops with the running power, then executed on the
+    # hosts, HPL being synchronous the slowest host gives the pace
+    slowest = min(speed.to_float() for speed in topo.topo_settings.node_speeds(topo.nb_nodes()))
+    slowdown = running_power / slowest
+    params = runner.gen_params(topo, nb_proc, size)[0]
+    dgemm = tuple(x*slowdown for x in runner.dgemm)
+    dtrsm = tuple(x*slowdown for x in runner.dtrsm)
+    time = predict_time(size, params['P'], params['Q'], dgemm, dtrsm, topo.network_parameters(),
+            NB=params['NB'], bcast=params['BCAST'], depth=params['DEPTH'])
+    return predict_gflops(size, time)
+
+def rank_parameters(throughput, factor):
+    # elasticity of the throughput to each parameter, i.e. the slope of log(throughput) as a function of log(parameter)
+    ranking = []
+    for name in sorted({name for name, _ in throughput if name is not None}):
+        low, high = throughput[(name, 'low')], throughput[(name, 'high')]
+        ranking.append((name, log(high/low) / log(factor**2), low, high))
+    return sorted(ranking, key=lambda r: -abs(r[1]))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Sensitivity of HPL to the hardware parameters of a fat-tree (speed of the nodes, bandwidth and latency of each level).')
+    parser.add_argument('-n', '--nb_runs', type=int,
+            default=1, help='Number of experiments to perform.')
+    parser.add_argument('--factor', type=float,
+            default=10, help='Factor applied to each parameter, in both directions.')
+    parser.add_argument('--parameters', type=lambda s: s.split(','),
+            default=None, help='Parameters to vary, comma-separated (default: all of them, e.g. speed,bw,lat,bw_0,lat_1; for the simulations, only those keeping the network model of the base tree).')
+    parser.add_argument('--running_power', type=float,
+            default=None, help='Running power of the host.')
+    parser.add_argument('--nb_workers', type=int, default=1,
+            help='Number of simulations to run in parallel.')
+    parser.add_argument('--predict', action='store_true',
+            help='Use the analytic model of HPL instead of the simulation.')
+    parser.add_argument('--csv_file', type=str, default=None,
+            help='Path of the CSV file for the results of the simulations (required unless --predict).')
+    required_named = parser.add_argument_group('required named arguments')
+    required_named.add_argument('--topo', type=str,
+            required=True, help='Description of the fat tree.')
+    required_named.add_argument('--size', type=int,
+            required=True, help='Size of the problem.')
+    required_named.add_argument('--nb_proc', type=int,
+            required=True, help='Number of processes to use.')
+    required_named.add_argument('--dgemm', type=float_pair, required=True,
+            help='Pair <coefficient, intercept> for the simulation of dgemm.')
+    required_named.add_argument('--dtrsm', type=float_pair, required=True,
+            help='Pair <coefficient, intercept> for the simulation of dtrsm.')
+    args = parser.parse_args()
+    try:
+        trees = FatTreeParser.parse(args.topo)
+    except ParseError as e:
+        parser.error(str(e))
+    if len(trees) != 1:
+        parser.error('A single fat-tree is required, got %d of them.' % len(trees))
+    if not args.predict and args.csv_file is None:
+        parser.error('Option --csv_file is required for the simulations.')
+    variants = gen_variants(trees[0], args.factor, args.parameters)
+    if not args.predict:
+        excluded = other_model_parameters(variants)
+        if len(excluded) > 0 and args.parameters is not None:
+            parser.error('Parameters %s would be simulated with another network model than the base tree, they are only available with --predict.' % ', '.join(excluded))
+        if len(excluded) > 0:
+            print('Skipping the parameters %s, they would be simulated with another network model than the base tree (use --predict for them).' % ', '.join(excluded))
+            variants = {key: topo for key, topo in variants.items() if key[0] not in excluded}
+    names = {str(topo): key for key, topo in variants.items()}
+    running_power = args.running_power or default_running_power
+    runner = HPL(list(variants.values()), [args.size], [args.nb_proc], args.nb_runs, args.csv_file, running_power=args.running_power,
+            nb_workers=args.nb_workers, dgemm=args.dgemm, dtrsm=args.dtrsm)
+    if args.predict:
+        runner.check_params()
+        throughput = {key: predict_variant(runner, topo, args.nb_proc, args.size, running_power) for key, topo in variants.items()}
+    else:
+        os.environ['SMPI_DGEMM_COEFFICIENT'] = str(args.dgemm[0])
+        os.environ['SMPI_DGEMM_INTERCEPT']   = str(args.dgemm[1])
+        os.environ['SMPI_DTRSM_COEFFICIENT'] = str(args.dtrsm[0])
+        os.environ['SMPI_DTRSM_INTERCEPT']   = str(args.dtrsm[1])
+        runner.run_all()
+        values = defaultdict(list)
+        for row in runner.results:
+            entry = dict(zip(runner.header, row))
+            values[names[entry['topology']]].append(entry[runner.metric])
+        throughput = {key: mean(v) for key, v in values.items()}
+        missing = set(variants) - set(throughput)
+        if len(missing) > 0:
+            sys.stderr.write('WARNING: no result for %s.\n' % ', '.join(str(variants[key]) for key in missing))
+            throughput = {key: t for key, t in throughput.items() if (key[0], 'low') in throughput and (key[0], 'high') in throughput}
+    print('Base throughput: %.3f Gflops' % throughput.get((None, None), float('nan')))
+    print('Parameters ranked by their impact on the throughput (elasticity, throughput with the parameter divided and multiplied by %g):' % args.factor)
+    for name, elasticity, low, high in rank_parameters(throughput, args.factor):
+        print('\t%-10s %+.3f\t%10.3f Gflops\t%10.3f Gflops' % (name, elasticity, low, high))
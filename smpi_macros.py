@@ -1,15 +1,26 @@
 #! /usr/bin/env python3
 import sys
+import os
 import csv
-import re
 import random
-from subprocess import Popen, PIPE, DEVNULL
+import argparse
+import itertools
+import tempfile
+import time
+import psutil
+from statistics import mean
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import Popen, DEVNULL
+from topology import IntSetParser, TopoParser
 
 BLUE_STR = '\033[1m\033[94m'
 GREEN_STR = '\033[1m\033[92m'
 RED_STR = '\033[1m\033[91m'
 END_STR = '\033[0m'
 
+MACROS = list(itertools.product([0, 1], [0, 1])) # all the (smpi_sample, smpi_malloc) combinations
+
 def print_color(msg, color):
     print('%s%s%s' % (color, msg, END_STR))
 
@@ -23,40 +34,134 @@ def error(msg):
     sys.stderr.write('%sERROR: %s%s\n' % (RED_STR, msg, END_STR))
     sys.exit(1)
 
-def run_command(args):
+def get_memory(process):
+    # sum of the memory of the process and its descendants (smpirun is a script calling smpimain)
+    rss, uss = 0, 0
+    try:
+        processes = [process] + process.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return rss, uss
+    for proc in processes:
+        try:
+            memory = proc.memory_full_info()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        rss += memory.rss
+        uss += memory.uss
+    return rss, uss
+
+def run_command(args, directory, sampling_period, keep_stderr=False):
+    # the outputs go to temporary files, pipes would block the process once full since they are only read at the end
     print_blue('%s' % ' '.join(args))
-    process = Popen(args, stdout=PIPE, stderr=DEVNULL)
-    output = process.communicate()
-    if process.wait() != 0:
-        error('with command: %s' % ' '.join(args))
-    return output[0]
-
-def run(size, smpi_sample, smpi_malloc, nb_proc=64):
-    args = ['smpirun', '--cfg=smpi/running-power:6217956542.969', '--cfg=smpi/privatize-global-variables:yes', '-np', str(nb_proc), '-hostfile', 'hostfile_64.txt', '-platform', 'cluster_fat_tree_64.xml', './matmul', str(size), str(smpi_sample), str(smpi_malloc)]
-    result = run_command(args)
-    return float(result)
-
-def run_exp(csv_writer, size):
-    values = [(0, 0), (0, 1), (1, 0), (1, 1)]
-    random.shuffle(values)
-    for smpi_sample, smpi_malloc in values:
-        time = run(size, smpi_sample, smpi_malloc)
-        csv_writer.writerow((time, size, smpi_sample, smpi_malloc))
-
-def run_all(csv_file, nb_exp, size=4000):
-    with open(csv_file, 'w') as f:
-        csv_writer = csv.writer(f)
-        csv_writer.writerow(('time', 'size', 'smpi_sample', 'smpi_malloc'))
-        for n in range(nb_exp):
-            print('%d/%d' % (n+1, nb_exp))
-            run_exp(csv_writer, size)
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        process = Popen(args, stdout=stdout, stderr=stderr if keep_stderr else DEVNULL, cwd=directory)
+        ps_process = psutil.Process(process.pid)
+        peak_rss, peak_uss = 0, 0
+        while process.poll() is None:
+            rss, uss = get_memory(ps_process)
+            peak_rss = max(peak_rss, rss)
+            peak_uss = max(peak_uss, uss)
+            time.sleep(sampling_period)
+        simulation_time = time.perf_counter() - start
+        if process.wait() != 0:
+            error('with command: %s' % ' '.join(args))
+        stdout.seek(0)
+        stderr.seek(0)
+        output = stdout.read(), stderr.read()
+    if keep_stderr:
+        return output, simulation_time, peak_rss, peak_uss
+    return output[0], simulation_time, peak_rss, peak_uss
+
+class Benchmark:
+    topo_file = 'topo.xml'
+    host_file = 'host.txt'
+    header = ('topology', 'nb_proc', 'size', 'smpi_sample', 'smpi_malloc', 'time', 'simulation_time', 'peak_rss', 'peak_uss')
+
+    def __init__(self, topologies, nb_proc, size, nb_runs, csv_file_name, running_power, nb_workers, sampling_period=0.01):
+        self.topologies = topologies
+        self.nb_proc = nb_proc
+        self.size = size
+        self.nb_runs = nb_runs
+        self.csv_file_name = csv_file_name
+        self.running_power = running_power
+        self.nb_workers = nb_workers
+        self.sampling_period = sampling_period
+        self.executable = os.path.abspath('matmul')
+        self.results = []
+
+    def check_params(self):
+        for topo in self.topologies:
+            if topo.nb_cores() < max(self.nb_proc):
+                error('more processes than cores for the topology %s (%d cores, asked for %d processes).' % (topo, topo.nb_cores(), max(self.nb_proc)))
+
+    def run(self, topo, nb_proc, size, smpi_sample, smpi_malloc):
+        # each simulation has its own directory, so that several ones can run at the same time
+        with tempfile.TemporaryDirectory() as directory:
+            topo.dump_topology_file(os.path.join(directory, self.topo_file))
+            topo.dump_host_file(os.path.join(directory, self.host_file))
+            args = ['smpirun', '--cfg=smpi/running-power:%f' % self.running_power, '--cfg=smpi/privatize-global-variables:yes',
+                    '-np', str(nb_proc), '-hostfile', self.host_file, '-platform', self.topo_file,
+                    self.executable, str(size), str(smpi_sample), str(smpi_malloc)]
+            output, simulation_time, peak_rss, peak_uss = run_command(args, directory, self.sampling_period)
+        return (str(topo), nb_proc, size, smpi_sample, smpi_malloc, float(output), simulation_time, peak_rss, peak_uss)
+
+    def gen_exp(self):
+        all_exp = [(topo, nb_proc, size, *macros) for topo, nb_proc, size, macros in
+                itertools.product(self.topologies, self.nb_proc, self.size, MACROS)]
+        random.shuffle(all_exp)
+        return all_exp
+
+    def run_all(self):
+        self.check_params()
+        with open(self.csv_file_name, 'w') as f:
+            csv_writer = csv.writer(f)
+            csv_writer.writerow(self.header)
+            with ThreadPoolExecutor(max_workers=self.nb_workers) as executor:
+                for n in range(self.nb_runs):
+                    print('%d/%d' % (n+1, self.nb_runs))
+                    for row in executor.map(lambda exp: self.run(*exp), self.gen_exp()):
+                        csv_writer.writerow(row)
+                        self.results.append(row)
+                    f.flush()
+        self.report()
+
+    def report(self):
+        # speed-up and memory savings of each combination, compared to the simulation without any macro
+        values = defaultdict(lambda: defaultdict(list))
+        for row in self.results:
+            entry = dict(zip(self.header, row))
+            key = (entry['topology'], entry['nb_proc'], entry['size'])
+            macros = (entry['smpi_sample'], entry['smpi_malloc'])
+            values[key][macros].append((entry['simulation_time'], entry['peak_rss']))
+        for (topo, nb_proc, size), results in sorted(values.items()):
+            print_green('%s nb_proc=%d size=%d' % (topo, nb_proc, size))
+            base_time = mean(t for t, _ in results[(0, 0)])
+            base_memory = mean(m for _, m in results[(0, 0)])
+            for smpi_sample, smpi_malloc in MACROS:
+                sim_time = mean(t for t, _ in results[(smpi_sample, smpi_malloc)])
+                memory = mean(m for _, m in results[(smpi_sample, smpi_malloc)])
+                print('\tsmpi_sample=%d smpi_malloc=%d: speed-up %.2f, memory %.2f%% of the baseline' % (smpi_sample, smpi_malloc,
+                    base_time/sim_time, 100*memory/base_memory if base_memory > 0 else float('nan')))
 
 if __name__ == '__main__':
-    if len(sys.argv) != 3:
-        error('Syntax: %s <nb_exp> <csv_file>' % sys.argv[0])
-    try:
-        nb_exp = int(sys.argv[1])
-        assert nb_exp > 0
-    except (ValueError, AssertionError):
-        error('Argument nb_exp must be a positive integer.')
-    run_all(sys.argv[2], nb_exp)
+    parser = argparse.ArgumentParser(
+            description='Benchmark of the SMPI_SAMPLE and SMPI_SHARED_MALLOC optimizations on a matrix product.')
+    parser.add_argument('-n', '--nb_runs', type=int,
+            default=10, help='Number of experiments to perform.')
+    parser.add_argument('--size', type = lambda s: IntSetParser.parse(s),
+            default={4000}, help='Sizes of the matrices.')
+    parser.add_argument('--running_power', type=float,
+            default=6217956542.969, help='Running power of the host.')
+    parser.add_argument('--nb_workers', type=int,
+            default=len(MACROS), help='Number of simulations to run in parallel.')
+    required_named = parser.add_argument_group('required named arguments')
+    required_named.add_argument('--nb_proc', type = lambda s: IntSetParser.parse(s),
+            required=True, help='Number of processes to use.')
+    required_named.add_argument('--topo', type = lambda s: TopoParser.parse(s),
+            required=True, help='Description of the fat tree(s), or platform file.')
+    required_named.add_argument('--csv_file', type = str,
+            required=True, help='Path of the CSV file for the results.')
+    args = parser.parse_args()
+    benchmark = Benchmark(args.topo, args.nb_proc, args.size, args.nb_runs, args.csv_file, args.running_power, args.nb_workers)
+    benchmark.run_all()
@@ -26,6 +26,228 @@ class TestFatTree(unittest.TestCase):
         self.assertNotEqual(FatTree([1,2], [3,4], [5,6]),
                          FatTree([1,2], [3,4], [5,60]))
 
+    def test_nb_switches(self):
+        for tree in [FatTree([4,4], [1,2], [1,1]), FatTree([2,3,4], [1,2,3], [1,1,2])]:
+            tree.initialize()
+            for l in range(len(tree.down)):
+                self.assertEqual(tree.nb_switches(l), len(tree.nodes[l]))
+
+    def test_switch_edges(self):
+        for tree in [FatTree([4,4], [1,2], [1,2]), FatTree([2,3,4], [2,3,2], [1,2,1]), FatTree([2,3,2,2], [1,2,3,2], [1,1,1,1])]:
+            tree.initialize()
+            for l in range(1, len(tree.down)):
+                expected = sorted((child.index, parent.index) for parent in tree.nodes[l] for child in parent.children)
+                self.assertEqual(sorted(tree.switch_edges(l)), expected)
+
+    def test_bandwidth_ratio(self):
+        self.assertEqual(FatTree([4,4], [1,4], [1,1]).bandwidth_ratio(), 1)
+        self.assertEqual(FatTree([4,4], [1,2], [1,1]).bandwidth_ratio(), 0.5)
+        self.assertEqual(FatTree([4,4], [1,1], [1,2]).bandwidth_ratio(), 0.5)
+        self.assertEqual(FatTree([4,4], [1,1], [1,1]).bandwidth_ratio(), 0.25)
+
+    def test_metrics(self):
+        tree = FatTree([4,4], [1,2], [1,1])
+        self.assertEqual(tree.total_switches(), 6)
+        self.assertEqual(tree.nb_cables(), 16 + 8)
+        self.assertEqual(tree.oversubscription(0), 2)
+        self.assertEqual(tree.diameter(), 4)
+        self.assertEqual(tree.hop_distribution(), {2: 0.2, 4: 0.8})
+        self.assertAlmostEqual(tree.bisection_bandwidth(), 8 * 1.25e9 * 0.5)
+        for tree in [FatTree([2,3,4], [1,2,3], [1,1,2]), FatTree([2,3,2,2], [1,2,3,2], [2,1,1,1])]:
+            tree.initialize()
+            nb_links = tree.nb_nodes() * tree.parallel[0]
+            nb_links += sum(len(list(tree.switch_edges(l))) * tree.parallel[l] for l in range(1, len(tree.down)))
+            self.assertEqual(tree.nb_cables(), nb_links)
+            self.assertAlmostEqual(sum(tree.hop_distribution().values()), 1)
+
+    def test_to_xml(self):
+        tree = FatTree([4,4], [1,2], [1,1])
+        platform = tree.to_xml().getroot()
+        self.assertEqual(platform.find('AS').get('routing'), 'Full')
+        self.assertEqual(platform.find("config/prop[@id='smpi/running-power']").get('value'), '1000')
+        platform = tree.to_xml('Floyd', 2.5e9).getroot()
+        self.assertEqual(platform.find('AS').get('routing'), 'Floyd')
+        self.assertEqual(platform.find("config/prop[@id='smpi/running-power']").get('value'), '2500000000.0')
+        platform = tree.to_xml('Cluster').getroot()
+        self.assertIsNone(platform.find('AS'))
+        self.assertEqual(platform.find('cluster').get('topo_parameters'), tree.standard_repr())
+        with self.assertRaises(ValueError):
+            tree.to_xml('Foo')
+
+    def test_heterogeneous(self):
+        links = [(BandwidthSetting(10, 'Gbps'), LatencySetting(1, 'us')), (BandwidthSetting(1, 'Gbps'), LatencySetting(2, 'us'))]
+        speeds = [(0.75, CoreSpeedSetting(1, 'Gf')), (0.25, CoreSpeedSetting(2, 'Gf'))]
+        uniform = FatTree([4,4], [1,2], [1,1], default_topo.updated(level_links=[links[0]]*2))
+        self.assertEqual(uniform.network_parameters(), FatTree([4,4], [1,2], [1,1], default_topo.updated(
+            remote_link_bandwidth=links[0][0], remote_link_latency=links[0][1])).network_parameters())
+        self.assertIsNotNone(uniform.to_xml().getroot().find('AS/cluster'))
+        tree = FatTree([4,4], [1,2], [1,1], default_topo.updated(level_links=links, speed_classes=speeds))
+        self.assertNotEqual(tree, FatTree([4,4], [1,2], [1,1]))
+        bw, lat = tree.network_parameters()
+        self.assertAlmostEqual(bw, 1.25e8 * 0.5)
+        self.assertAlmostEqual(lat, 6e-6)
+        AS = tree.to_xml().getroot().find('AS')
+        self.assertIsNone(AS.find('cluster'))
+        self.assertEqual([host.get('speed') for host in AS.findall('host')], ['1Gf']*12 + ['2Gf']*4)
+        self.assertEqual(len(AS.findall('router')), tree.total_switches())
+        self.assertEqual(len(AS.findall('route')), tree.nb_nodes() + 8)
+        with self.assertRaises(ValueError):
+            tree.to_xml('Full')
+
+    def test_pareto_frontier(self):
+        from topology_pareto import pareto_frontier
+        points = [(1, 1, 'a'), (2, 1, 'b'), (2, 3, 'c'), (3, 2, 'd'), (4, 5, 'e'), (1, 0, 'f')]
+        self.assertEqual([p[2] for p in pareto_frontier(points)], ['a', 'c', 'e'])
+
+class TestTorusDragonfly(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(TopoParser.parse('torus;2:3,4'), [Torus([2,4]), Torus([3,4])])
+        self.assertEqual(TopoParser.parse('dragonfly;3,4;3,1:2;3,1;2'), [Dragonfly((3,4), (3,1), (3,1), 2), Dragonfly((3,4), (3,2), (3,1), 2)])
+        self.assertEqual(TopoParser.parse('2;4,4;1,2;1,1'), [FatTree([4,4], [1,2], [1,1])])
+        self.assertNotEqual(Torus([4,4]), FatTree([4,4], [1,1], [1,1]))
+        with self.assertRaises(ParseError):
+            TopoParser.parse('torus;4;4')
+        with self.assertRaises(ParseError):
+            TopoParser.parse('dragonfly;3,4;3,1;3;2')
+        with self.assertRaises(ParseError):
+            TopoParser.parse('dragonfly;9,1;2,1;2,1;2')  # more groups than routers per group
+
+    def test_torus(self):
+        torus = Torus([4,4,2])
+        self.assertEqual(torus.nb_cores(), 32)
+        self.assertEqual(torus.nb_cables(), 96)
+        self.assertEqual(torus.diameter(), 5)
+        self.assertEqual(torus.hop_distribution()[1], 5/31)
+        self.assertAlmostEqual(sum(torus.hop_distribution().values()), 1)
+        self.assertEqual(torus.bandwidth_ratio(), 1)
+        self.assertEqual(Torus([16,2]).bandwidth_ratio(), 0.25)
+        cluster = torus.to_xml().getroot().find('AS/cluster')
+        self.assertEqual((cluster.get('topology'), cluster.get('topo_parameters')), ('TORUS', '4,4,2'))
+
+    def test_dragonfly(self):
+        dragonfly = Dragonfly((3,4), (3,2), (3,1), 2)
+        self.assertEqual(dragonfly.nb_nodes(), 54)
+        self.assertEqual(dragonfly.total_switches(), 27)
+        self.assertEqual(dragonfly.nb_cables(), 54 + 27 + 54 + 12)
+        self.assertEqual(dragonfly.diameter(), 7)
+        self.assertAlmostEqual(sum(dragonfly.hop_distribution().values()), 1)
+        self.assertEqual(dragonfly.hop_distribution()[2], 1/53)
+        cluster = dragonfly.to_xml().getroot().find('AS/cluster')
+        self.assertEqual((cluster.get('topology'), cluster.get('topo_parameters')), ('DRAGONFLY', '3,4;3,2;3,1;2'))
+
+class TestSettings(unittest.TestCase):
+
+    def test_from_string(self):
+        self.assertEqual(BandwidthSetting.from_string('10Gbps'), BandwidthSetting(10, 'Gbps'))
+        self.assertEqual(BandwidthSetting.from_string('10Gbps').to_float(), 1.25e9)
+        self.assertEqual(BandwidthSetting.from_string('125MBps').to_float(), 1.25e8)
+        self.assertAlmostEqual(LatencySetting.from_string('2.4E-5s').to_float(), 2.4e-5)
+        self.assertAlmostEqual(LatencySetting.from_string('50us').to_float(), 5e-5)
+        with self.assertRaises(ParseError):
+            BandwidthSetting.from_string('10Gs')
+        with self.assertRaises(ParseError):
+            LatencySetting.from_string('abc')
+
+class TestHPLModel(unittest.TestCase):
+    dgemm = (1.7e-10, 2.4e-6)
+    dtrsm = (8.0e-11, 2.1e-6)
+
+    def predict(self, tree, size=30000, P=4, Q=4):
+        from hpl_model import predict_time
+        return predict_time(size, P, Q, self.dgemm, self.dtrsm, tree.network_parameters())
+
+    def test_monotonic(self):
+        tree = FatTree([4,4], [1,2], [1,1])
+        self.assertLess(self.predict(tree, size=20000), self.predict(tree, size=30000))
+        self.assertLess(self.predict(tree, P=4, Q=4), self.predict(tree, P=2, Q=2))
+        self.assertLessEqual(self.predict(FatTree([4,4], [1,4], [1,1])), self.predict(FatTree([4,4], [1,1], [1,1])))
+
+class TestTracer(unittest.TestCase):
+
+    def test_spans(self):
+        from tracing import Tracer
+        tracer = Tracer()
+        with tracer.span('experiment', size=100):
+            with tracer.span('parse'):
+                pass
+        worker = Tracer()
+        with worker.span('parse'):
+            pass
+        tracer.merge(worker.pop())
+        self.assertEqual(worker.events, [])
+        self.assertEqual([event['name'] for event in tracer.events], ['parse', 'experiment', 'parse'])
+        self.assertEqual(tracer.events[1]['args'], {'size': 100})
+        summary = {row[0]: row for row in tracer.summary()}
+        self.assertEqual(summary['parse'][1], 2)
+        self.assertGreaterEqual(summary['experiment'][2], tracer.events[0]['dur']*1e-6)
+        disabled = Tracer(enabled=False)
+        with disabled.span('experiment') as span_args:
+            span_args['timeout'] = True
+        self.assertEqual(disabled.events, [])
+
+class TestWorkQueue(unittest.TestCase):
+
+    def test_leases(self):
+        import os, time, tempfile
+        from work_queue import WorkQueue
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'queue.db')
+            queue = WorkQueue(path)
+            self.assertTrue(queue.publish(['--size', '1'], [('a', (1, 'a')), ('b', (2, 'b'))], lease_time=0.1, max_attempts=2))
+            self.assertFalse(WorkQueue(path).publish(['--size', '1'], [], lease_time=0.1, max_attempts=2))
+            with self.assertRaises(ValueError):
+                queue.publish(['--size', '2'], [], lease_time=0.1, max_attempts=2)
+            lease_a, point = queue.claim('w1')
+            self.assertEqual(point, (1, 'a'))
+            lease_b, point = queue.claim('w1')
+            self.assertEqual(point, (2, 'b'))
+            self.assertIsNone(queue.claim('w2'))
+            self.assertTrue(queue.renew(lease_a))
+            queue.complete(lease_a, [1, 'a'], (['span'], []))
+            time.sleep(0.2) # the lease of b expires, its worker is considered dead
+            lease, point = queue.claim('w2')
+            self.assertEqual((lease, point), ((lease_b[0], 2), (2, 'b')))
+            self.assertFalse(queue.renew(lease_b))
+            queue.complete(lease_b, ['late']) # discarded, the point was claimed again
+            queue.fail(lease, 'error')
+            self.assertTrue(queue.is_finished())
+            self.assertEqual(queue.counts(), {'pending': 0, 'running': 0, 'done': 1, 'failed': 1})
+            self.assertEqual(queue.results(), [(1, [1, 'a'], (['span'], []))])
+            self.assertEqual(queue.failures(), [('b', 2, 'error')])
+
+    def test_worker(self):
+        # the experiment runs in its own directory, for longer than the lease, the heartbeat must keep it
+        import os, time, tempfile
+        from work_queue import WorkQueue, run_worker
+        from tracing import Tracer
+        lease_time = 0.3
+        class Runner:
+            tracer = Tracer()
+            def run_exp_in_dir(self, exp):
+                cwd = os.getcwd()
+                with tempfile.TemporaryDirectory(dir=cwd) as directory:
+                    os.chdir(directory)
+                    try:
+                        with self.tracer.span('experiment'):
+                            time.sleep(lease_time*3)
+                        return [exp, WorkQueue(os.path.join(cwd, 'queue.db')).claim('other'), os.listdir('.')]
+                    finally:
+                        os.chdir(cwd)
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                WorkQueue('queue.db').publish([], [('a', 'a')], lease_time=lease_time, max_attempts=2)
+                self.assertEqual(run_worker('queue.db', Runner(), 'w1', poll_period=0.1), 1)
+                queue = WorkQueue('queue.db')
+                self.assertEqual(queue.counts(), {'pending': 0, 'running': 0, 'done': 1, 'failed': 0})
+                (index, row, (events, _)), = queue.results()
+                self.assertEqual(row, ['a', None, []]) # not claimed again, no queue in the directory
+                self.assertEqual([event['name'] for event in events], ['experiment'])
+            finally:
+                os.chdir(cwd)
+
 class TestParser(unittest.TestCase):
 
     def check_valid_descr(self, description):
@@ -50,6 +272,20 @@ class TestParser(unittest.TestCase):
         with self.assertRaises(ParseError):
             Parser.parse('3:24;1,4,5;82,27:100:1000;42:42;17,42')   # invalid range
 
+class TestIntSetParser(unittest.TestCase):
+
+    def test_valid(self):
+        self.assertEqual(IntSetParser.parse('1,3:5'), {1, 3, 4, 5})
+        self.assertEqual(NonNegativeIntSetParser.parse('0:2,5'), {0, 1, 2, 5})
+
+    def test_invalid(self):
+        with self.assertRaises(ParseError):
+            IntSetParser.parse('0:2')
+        with self.assertRaises(ParseError):
+            NonNegativeIntSetParser.parse('-1:2')
+        with self.assertRaises(ParseError):
+            NonNegativeIntSetParser.parse('1;2')
+
 class TestFatTreeParser(unittest.TestCase):
 
     def test_simple_valid(self):
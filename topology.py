@@ -1,8 +1,11 @@
+import copy
 import functools
 import itertools
+from collections import defaultdict
 from lxml import etree
 import os
 import random
+import re
 
 class ParseError(Exception):
     pass
@@ -11,6 +14,7 @@ class Parser:
     out_separator = ';'
     in_separator = ','
     range_separator = ':'
+    min_value = 1
 
     @classmethod
     def parse(cls, description):
@@ -45,7 +49,7 @@ class Parser:
             result = int(description)
         except ValueError:
             error = True
-        if error or result <= 0:
+        if error or result < cls.min_value:
             raise ParseError('Wrong integer: %s' % description)
         else:
             return result
@@ -59,6 +63,9 @@ class IntSetParser(Parser):
         result = result[0]
         return set.union(*[set(sub) for sub in result])
 
+class NonNegativeIntSetParser(IntSetParser):
+    min_value = 0
+
 class FatTreeParser(Parser):
     @classmethod
     def parse(cls, description):
@@ -77,13 +84,79 @@ class FatTreeParser(Parser):
         descriptors = itertools.product(*descriptors)
         return [FatTree(*t) for t in descriptors]
 
+class TorusParser(Parser):
+    @classmethod
+    def parse(cls, description): # e.g. '4:8,4,4', the size of each dimension
+        result = super().parse(description)
+        if len(result) != 1:
+            raise ParseError('A torus description is a single list (size of each dimension).')
+        return [Torus(list(dims)) for dims in itertools.product(*result[0])]
+
+class DragonflyParser(Parser):
+    @classmethod
+    def parse(cls, description): # e.g. '3,4;3,2;3,1;2', in the same format than the topo_parameters of SimGrid
+        result = super().parse(description)
+        if len(result) != 4 or any(len(sub) != 2 for sub in result[:3]) or len(result[3]) != 1:
+            raise ParseError('A dragonfly description has exactly 4 parts, three pairs (groups, chassis and routers, with their number of links) and the number of nodes per router.')
+        groups, chassis, routers, nodes = [list(itertools.product(*sub)) for sub in result]
+        trees = []
+        for g, c, r, (n,) in itertools.product(groups, chassis, routers, nodes):
+            if g[0] > c[0]*r[0]:
+                raise ParseError('A dragonfly needs at least as many routers per group as groups (got %d groups and %d routers per group).' % (g[0], c[0]*r[0]))
+            trees.append(Dragonfly(g, c, r, n))
+        return trees
+
+# Topologies whose description starts with their name (e.g. 'torus;4,4,4'), the other descriptions are fat-trees
+topology_parsers = {
+    'torus'     : TorusParser,
+    'dragonfly' : DragonflyParser,
+}
+
+class GeneratedTopoParser(Parser):
+    @classmethod
+    def parse(cls, description):
+        name, _, parameters = description.partition(cls.out_separator)
+        if name in topology_parsers:
+            return topology_parsers[name].parse(parameters)
+        return FatTreeParser.parse(description)
+
 class TopoParser(Parser):
     @classmethod
     def parse(cls, description):
         if os.path.exists(description):
             return [TopoFile(description)]
         else:
-            return FatTreeParser.parse(description)
+            return GeneratedTopoParser.parse(description)
+
+# Routing of the AS containing the cluster ('Cluster' meaning that the cluster is not in an AS)
+ROUTING_MODES = ('Full', 'Floyd', 'Dijkstra', 'DijkstraCache', 'None', 'Cluster')
+
+# Routing of the AS for the heterogeneous settings, where the routes are only given between neighbors
+EXPLICIT_ROUTING_MODES = ('Floyd', 'Dijkstra', 'DijkstraCache')
+
+default_running_power = 1000
+
+def check_routing(routing):
+    if routing not in ROUTING_MODES:
+        raise ValueError('Unknown routing mode %s, must be one of %s.' % (routing, ', '.join(ROUTING_MODES)))
+
+def set_running_power(platform, running_power):
+    # the config element has to be the first child of the platform
+    prop = platform.find("config/prop[@id='smpi/running-power']")
+    if prop is None:
+        config = platform.find('config')
+        if config is None:
+            config = etree.Element('config')
+            platform.insert(0, config)
+        prop = etree.SubElement(config, 'prop')
+        prop.set('id', 'smpi/running-power')
+    prop.set('value', str(running_power))
+
+def dump_xml(xml, file_name):
+    with open(file_name, 'wb') as f:
+        string = etree.tostring(xml, xml_declaration=True, pretty_print=True,
+                doctype='<!DOCTYPE platform SYSTEM "http://simgrid.gforge.inria.fr/simgrid/simgrid.dtd">')
+        f.write(string)
 
 class TopoFile:
     def __init__(self, filepath):
@@ -94,6 +167,7 @@ class TopoFile:
             self.filename = filepath
         self.xml = etree.parse(filepath).getroot()
         self.core = None
+        self.cluster = None
         self.hostnames = self.parse_hosts()
 
     def parse_hosts(self):
@@ -103,6 +177,7 @@ class TopoFile:
         if len(cluster) > 0:
             assert len(cluster) == 1
             cluster = cluster[0]
+            self.cluster = cluster
             self.core = int(cluster.get('core', default=1))
             prefix = cluster.get('prefix')
             suffix = cluster.get('suffix')
@@ -121,12 +196,27 @@ class TopoFile:
                 host_list.extend([hostname]*nb_cores)
         return host_list
 
+    def __getstate__(self): # lxml elements cannot be pickled, the platform is sent as text (e.g. to the workers of a queue)
+        return {'filepath': self.filepath, 'filename': self.filename, 'xml': etree.tostring(self.xml)}
+
+    def __setstate__(self, state):
+        self.filepath = state['filepath']
+        self.filename = state['filename']
+        self.xml = etree.fromstring(state['xml'])
+        self.core = None
+        self.cluster = None
+        self.hostnames = self.parse_hosts()
+
 
-    def dump_topology_file(self, file_name):
-        with open(file_name, 'wb') as f:
-            string = etree.tostring(self.xml, xml_declaration=True, pretty_print=True,
-                    doctype='<!DOCTYPE platform SYSTEM "http://simgrid.gforge.inria.fr/simgrid/simgrid.dtd">')
-            f.write(string)
+    def dump_topology_file(self, file_name, routing=None, running_power=None):
+        # the platform is written as is, except for the routing of its root AS and the running power, if given
+        xml = copy.deepcopy(self.xml)
+        if routing is not None and routing != 'Cluster':
+            check_routing(routing)
+            xml.findall('AS')[0].set('routing', routing)
+        if running_power is not None:
+            set_running_power(xml, running_power)
+        dump_xml(xml, file_name)
 
     def dump_host_file(self, file_name, shuffle=False):
         hostnames = list(self.hostnames)
@@ -148,12 +238,42 @@ class TopoFile:
     def nb_roots(self):
         return -1
 
+    def network_parameters(self):
+        if self.cluster is None:
+            return None
+        bw = BandwidthSetting.from_string(self.cluster.get('bw')).to_float()
+        lat = LatencySetting.from_string(self.cluster.get('lat')).to_float()
+        parsers = {'FAT_TREE': FatTreeParser, 'TORUS': TorusParser, 'DRAGONFLY': DragonflyParser}
+        topology = self.cluster.get('topology')
+        if topology in parsers:
+            topo = parsers[topology].parse(self.cluster.get('topo_parameters'))[0]
+            return bw*topo.bandwidth_ratio(), lat*topo.diameter()
+        return bw, lat*2
+
 class AbstractSetting:
+    units = {None: 1}
+    reg = re.compile('(?P<value>[-+]?[0-9]*\\.?[0-9]+([eE][-+]?[0-9]+)?)(?P<unit>[a-zA-Z]*)$')
+
     def __init__(self, value, unit=None):
         self.value = value
         self.unit = unit
         self.check()
 
+    @classmethod
+    def from_string(cls, string):
+        match = cls.reg.match(string.strip())
+        if match is None:
+            raise ParseError('Wrong setting: %s' % string)
+        unit = match.group('unit')
+        if unit == '':
+            unit = None
+        if unit not in cls.units:
+            raise ParseError('Wrong unit for %s: %s' % (cls.__name__, string))
+        return cls(float(match.group('value')), unit)
+
+    def to_float(self): # value in the base unit (bytes per second, seconds or flops)
+        return self.value * self.units[self.unit]
+
     def get_value(self):
         if self.unit is None:
             return str(self.value)
@@ -173,17 +293,26 @@ class AbstractSetting:
         return type(self) == type(other) and self.value == other.value and self.unit == other.unit
 
 class BandwidthSetting(AbstractSetting):
+    units = {  # bits are converted to bytes
+        'bps': 1/8, 'kbps': 1e3/8, 'kibps': 2**10/8, 'Mbps': 1e6/8, 'Mibps': 2**20/8, 'Gbps': 1e9/8, 'Gibps': 2**30/8,
+        'Bps': 1,   'kBps': 1e3,   'kiBps': 2**10,   'MBps': 1e6,   'MiBps': 2**20,   'GBps': 1e9,   'GiBps': 2**30,
+    }
+
     def check(self):
-        assert self.unit in ['bps', 'kbps', 'kibps', 'Mbps', 'Mibps', 'Gbps', 'Gibps']
+        assert self.unit in self.units
         assert self.value > 0
 
 class LatencySetting(AbstractSetting):
+    units = {'s': 1, 'ms': 1e-3, 'us': 1e-6, 'ns': 1e-9}
+
     def check(self):
-        assert self.unit in ['s']
+        assert self.unit in self.units
 
 class CoreSpeedSetting(AbstractSetting):
+    units = {None: 1, 'f': 1, 'kf': 1e3, 'Mf': 1e6, 'Gf': 1e9}
+
     def check(self):
-        assert self.unit in [None, 'f', 'kf', 'Mf', 'Gf']
+        assert self.unit in self.units
         assert self.value > 0
 
 class CoreNumberSetting(AbstractSetting):
@@ -193,7 +322,10 @@ class CoreNumberSetting(AbstractSetting):
 
 class ClusterSetting:
     def __init__(self, *, core_speed, core_number, remote_link_bandwidth, remote_link_latency,
-            local_link_bandwidth, local_link_latency):
+            local_link_bandwidth, local_link_latency, level_links=None, speed_classes=None, name=None):
+        # level_links gives a (bandwidth, latency) pair for each level of the fat-tree (level l being the links from
+        # level l-1 to level l, level -1 being the nodes), instead of the remote bandwidth and latency, speed_classes
+        # is a list of (fraction of the nodes, speed) pairs, instead of the core speed (the first nodes get the first class)
         self.core = core_number.value
         self.parameters = {
             'speed'         : core_speed,
@@ -203,12 +335,68 @@ class ClusterSetting:
             'loopback_bw'   : local_link_bandwidth,
             'loopback_lat'  : local_link_latency,
         }
-
-    def update_xml(self, etree):
+        self.level_links = tuple(level_links) if level_links is not None else None
+        self.speed_classes = tuple(speed_classes) if speed_classes is not None else None
+        if self.speed_classes is not None:
+            assert abs(sum(fraction for fraction, _ in self.speed_classes) - 1) < 1e-9
+        self.name = name
+
+    def updated(self, **kwargs): # copy of the setting, with the given arguments of the constructor changed
+        args = {
+            'core_speed'            : self.parameters['speed'],
+            'core_number'           : self.parameters['core'],
+            'remote_link_bandwidth' : self.parameters['bw'],
+            'remote_link_latency'   : self.parameters['lat'],
+            'local_link_bandwidth'  : self.parameters['loopback_bw'],
+            'local_link_latency'    : self.parameters['loopback_lat'],
+            'level_links'           : self.level_links,
+            'speed_classes'         : self.speed_classes,
+            'name'                  : self.name,
+        }
+        args.update(kwargs)
+        return ClusterSetting(**args)
+
+    def link(self, l): # (bandwidth, latency) settings of the links of level l
+        if self.level_links is None:
+            return self.parameters['bw'], self.parameters['lat']
+        return self.level_links[l]
+
+    def node_speeds(self, nb_nodes): # list of the speed settings of the nodes
+        if self.speed_classes is None:
+            return [self.parameters['speed']]*nb_nodes
+        speeds = []
+        total = 0
+        for fraction, speed in self.speed_classes:
+            total += fraction
+            speeds.extend([speed]*(round(total*nb_nodes) - len(speeds)))
+        return speeds
+
+    def is_uniform(self, nb_levels): # True if the cluster tag of SimGrid can describe this setting
+        uniform_links = len({self.link(l) for l in range(nb_levels)}) == 1
+        uniform_speed = self.speed_classes is None or len({speed for _, speed in self.speed_classes}) == 1
+        return uniform_links and uniform_speed
+
+    def update_xml(self, etree): # only for the uniform settings, possibly given with level links or speed classes
         for name, param in self.parameters.items():
             etree.set(name, param.get_value())
+        bw, lat = self.link(0)
+        etree.set('bw', bw.get_value())
+        etree.set('lat', lat.get_value())
+        if self.speed_classes is not None:
+            etree.set('speed', self.speed_classes[0][1].get_value())
+
+    def key(self):
+        return (tuple(sorted(self.parameters.items())), self.level_links, self.speed_classes)
+
+    def __eq__(self, other):
+        return isinstance(other, ClusterSetting) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
 
     def __repr__(self):
+        if self.name is not None:
+            return self.name
         return str(self.parameters)
 
 default_topo = ClusterSetting(
@@ -220,44 +408,39 @@ default_topo = ClusterSetting(
     local_link_latency      = LatencySetting(1.5E-9, 's'),
 )
 
-class FatTree:
+class ClusterTopology:
+    # Common part of the topologies generated as a cluster of SimGrid, the subclasses give the name of the topology in
+    # SimGrid, its parameters (standard_repr) and its metrics.
     prefix = 'host-'
     suffix = '.hawaii.edu'
+    cluster_topology = None
+    name = None # first part of the description of the topology (e.g. 'torus;4,4,4'), no such part for the fat-trees
 
-    def __init__(self, down, up, parallel, topo_settings=default_topo):
-        def check_list(l):
-            for n in l:
-                assert isinstance(n, int) and n > 0
-        check_list(down)
-        check_list(up)
-        check_list(parallel)
-        assert len(down) == len(up) == len(parallel)
-        self.down = tuple(down)
-        self.up = tuple(up)
-        self.parallel = tuple(parallel)
+    def __init__(self, topo_settings):
         self.topo_settings = topo_settings
 
+    def key(self):
+        raise NotImplementedError()
+
     def __eq__(self, other):
-        return self.down == other.down and\
-            self.up == other.up and\
-            self.parallel == other.parallel
+        return type(self) == type(other) and self.key() == other.key() and self.topo_settings == other.topo_settings
 
     def __hash__(self):
-        return hash((self.down, self.up, self.parallel))
+        return hash((self.key(), self.topo_settings))
 
-    def standard_repr(self):
-        def intlist_to_str(l):
-            return ','.join(str(n) for n in l)
-        down = intlist_to_str(self.down)
-        up = intlist_to_str(self.up)
-        parallel = intlist_to_str(self.parallel)
-        return ';'.join([str(len(self.down)), down, up, parallel])
+    def standard_repr(self): # parameters of the topology in SimGrid
+        raise NotImplementedError()
 
-    def __repr__(self):
-        return ';'.join([self.standard_repr(), str(self.core)])
+    def description(self):
+        if self.name is None:
+            return self.standard_repr()
+        return ';'.join([self.name, self.standard_repr()])
 
-    def nb_nodes(self):
-        return functools.reduce(lambda a, b: a*b, self.down, 1)
+    def __repr__(self):
+        result = ';'.join([self.description(), str(self.core)])
+        if self.topo_settings.name is not None:
+            result += '(%s)' % self.topo_settings.name
+        return result
 
     @property
     def core(self):
@@ -266,36 +449,69 @@ class FatTree:
     def nb_cores(self):
         return self.nb_nodes() * self.core
 
-    def nb_roots(self):
-        return functools.reduce(lambda a, b: a*b, self.up, 1)
+    def nb_levels(self): # number of levels of links which may have their own settings
+        return 1
+
+    def nb_roots(self): # only meaningful for the fat-trees
+        return -1
+
+    def diameter(self):
+        return max(self.hop_distribution())
+
+    def average_hops(self):
+        return sum(hops*fraction for hops, fraction in self.hop_distribution().items())
+
+    def bisection_bandwidth(self): # in bytes per second
+        return self.nb_nodes()/2 * self.network_parameters()[0]
 
-    def to_xml(self):
+    def cost(self, switch_cost=1, cable_cost=0.1):
+        return switch_cost*self.total_switches() + cable_cost*self.nb_cables()
+
+    def link_parameters(self, l): # bandwidth (in bytes per second) and latency (in seconds) of a link of level l
+        bw, lat = self.topo_settings.link(l)
+        return bw.to_float(), lat.to_float()
+
+    def network_parameters(self):
+        # effective bandwidth (in bytes per second) and latency (in seconds) of a route between two nodes
+        bw, lat = self.link_parameters(0)
+        return bw*self.bandwidth_ratio(), lat*self.diameter()
+
+    def comment(self):
+        return '%s with %d nodes' % (self.description(), self.nb_nodes())
+
+    def to_xml(self, routing=None, running_power=None):
+        # routing is the one of the AS containing the cluster, or 'Cluster' to have no such AS, the cluster being
+        # the root zone (its routing is then the one of the topology, without any routing table for the enclosing AS)
+        check_routing(routing or 'Full')
         platform = etree.Element('platform')
         platform.set('version', '4')
-        platform.addprevious(etree.Comment('%d-level fat-tree with %d nodes' %
-            (len(self.down), self.nb_nodes())))
-        config = etree.SubElement(platform, 'config')
-        prop = etree.SubElement(config, 'prop')
-        prop.set('id', 'smpi/running-power')
-        prop.set('value', '1000')
-        AS = etree.SubElement(platform, 'AS')
-        AS.set('id', 'AS0')
-        AS.set('routing', 'Full') # TODO may need to change routing
-        cluster = etree.SubElement(AS, 'cluster')
+        platform.addprevious(etree.Comment(self.comment()))
+        set_running_power(platform, running_power or default_running_power)
+        if not self.topo_settings.is_uniform(self.nb_levels()):
+            self.add_explicit_xml(platform, routing or 'Floyd')
+            return etree.ElementTree(platform)
+        routing = routing or 'Full'
+        if routing == 'Cluster':
+            parent = platform
+        else:
+            parent = etree.SubElement(platform, 'AS')
+            parent.set('id', 'AS0')
+            parent.set('routing', routing)
+        cluster = etree.SubElement(parent, 'cluster')
         cluster.set('id', 'cluster0')
         cluster.set('prefix', self.prefix)
         cluster.set('suffix', self.suffix)
         cluster.set('radical', '0-%d' % (self.nb_nodes()-1))
-        cluster.set('topology', 'FAT_TREE')
+        cluster.set('topology', self.cluster_topology)
         cluster.set('topo_parameters', self.standard_repr())
         self.topo_settings.update_xml(cluster)
         return etree.ElementTree(platform)
 
-    def dump_topology_file(self, file_name):
-        with open(file_name, 'wb') as f:
-            string = etree.tostring(self.to_xml(), xml_declaration=True, pretty_print=True,
-                    doctype='<!DOCTYPE platform SYSTEM "http://simgrid.gforge.inria.fr/simgrid/simgrid.dtd">')
-            f.write(string)
+    def add_explicit_xml(self, platform, routing):
+        raise ValueError('Heterogeneous settings are not available for the topology %s.' % self.description())
+
+    def dump_topology_file(self, file_name, routing=None, running_power=None):
+        dump_xml(self.to_xml(routing, running_power), file_name)
 
     def dump_host_file(self, file_name, shuffle=False):
         pattern = self.prefix + '%d' + self.suffix
@@ -309,6 +525,143 @@ class FatTree:
             for hostname in hostnames:
                 f.write('%s\n' % hostname)
 
+class FatTree(ClusterTopology):
+    cluster_topology = 'FAT_TREE'
+
+    def __init__(self, down, up, parallel, topo_settings=default_topo):
+        def check_list(l):
+            for n in l:
+                assert isinstance(n, int) and n > 0
+        check_list(down)
+        check_list(up)
+        check_list(parallel)
+        assert len(down) == len(up) == len(parallel)
+        super().__init__(topo_settings)
+        self.down = tuple(down)
+        self.up = tuple(up)
+        self.parallel = tuple(parallel)
+
+    def key(self):
+        return (self.down, self.up, self.parallel)
+
+    def standard_repr(self):
+        def intlist_to_str(l):
+            return ','.join(str(n) for n in l)
+        down = intlist_to_str(self.down)
+        up = intlist_to_str(self.up)
+        parallel = intlist_to_str(self.parallel)
+        return ';'.join([str(len(self.down)), down, up, parallel])
+
+    def comment(self):
+        return '%d-level fat-tree with %d nodes' % (len(self.down), self.nb_nodes())
+
+    def nb_levels(self):
+        return len(self.down)
+
+    def nb_nodes(self):
+        return functools.reduce(lambda a, b: a*b, self.down, 1)
+
+    def nb_roots(self):
+        return functools.reduce(lambda a, b: a*b, self.up, 1)
+
+    def nb_switches(self, l): # level 0 is made of the switches connected to the nodes
+        return functools.reduce(lambda a, b: a*b, self.down[l+1:] + self.up[:l+1], 1)
+
+    def nb_uplinks(self, l): # number of links going from level l-1 to level l (level -1 being the nodes)
+        if l == 0:
+            return self.nb_nodes() * self.up[0] * self.parallel[0]
+        return self.nb_switches(l-1) * self.up[l] * self.parallel[l]
+
+    def bandwidth_ratio(self):
+        # fraction of the link bandwidth a node can get when all the nodes communicate through the roots
+        return min(1, min(self.nb_uplinks(l)/self.nb_nodes() for l in range(len(self.down))))
+
+    def nb_hops(self): # number of links in the longest route between two nodes
+        return 2*len(self.down)
+
+    def total_switches(self):
+        return sum(self.nb_switches(l) for l in range(len(self.down)))
+
+    def nb_cables(self): # including the cables between the nodes and the first level of switches
+        return sum(self.nb_uplinks(l) for l in range(len(self.down)))
+
+    def oversubscription(self, l):
+        # ratio between the links going down and the links going up, for a switch of level l (not defined for the roots)
+        return (self.down[l]*self.parallel[l]) / (self.up[l+1]*self.parallel[l+1])
+
+    def diameter(self):
+        return self.nb_hops()
+
+    def hop_distribution(self):
+        # fraction of the pairs of distinct nodes whose route has a given number of links: two nodes whose closest common
+        # ancestors are at level l are 2*(l+1) links away, there are prod(down[:l+1]) nodes below a switch of level l
+        nb_nodes = self.nb_nodes()
+        if nb_nodes < 2:
+            return {}
+        distribution = {}
+        below = 1
+        for l in range(len(self.down)):
+            nb_pairs = nb_nodes * (below*self.down[l] - below)
+            if nb_pairs > 0:
+                distribution[2*(l+1)] = nb_pairs / (nb_nodes*(nb_nodes-1))
+            below *= self.down[l]
+        return distribution
+
+    def network_parameters(self):
+        # effective bandwidth (in bytes per second) and latency (in seconds) of a route between two nodes, the
+        # bandwidth is the one of the level with the lowest aggregated bandwidth, the route goes up and down each level
+        bw = min(self.link_parameters(l)[0] * min(1, self.nb_uplinks(l)/self.nb_nodes()) for l in range(len(self.down)))
+        lat = sum(2*self.link_parameters(l)[1] for l in range(len(self.down)))
+        return bw, lat
+
+    def add_explicit_xml(self, platform, routing):
+        # The cluster tag of SimGrid has a single link bandwidth, latency and host speed, so the heterogeneous settings
+        # are described with hosts, routers (the switches) and links. The parallel links between two switches are
+        # merged in a single link. The routes are only given between neighbors, SimGrid computes the shortest paths,
+        # so there is a single route between two nodes (no load balancing on the roots, unlike the FAT_TREE routing).
+        if routing not in EXPLICIT_ROUTING_MODES:
+            raise ValueError('Routing mode %s is not available for heterogeneous settings, must be one of %s.' % (
+                routing, ', '.join(EXPLICIT_ROUTING_MODES)))
+        settings = self.topo_settings
+        AS = etree.SubElement(platform, 'AS')
+        AS.set('id', 'AS0')
+        AS.set('routing', routing)
+        host_pattern = self.prefix + '%d' + self.suffix
+        for i, speed in enumerate(settings.node_speeds(self.nb_nodes())):
+            host = etree.SubElement(AS, 'host')
+            host.set('id', host_pattern % i)
+            host.set('speed', speed.get_value())
+            host.set('core', str(self.core))
+        for l in range(len(self.down)):
+            for i in range(self.nb_switches(l)):
+                etree.SubElement(AS, 'router').set('id', 'switch-%d-%d' % (l, i))
+        routes = []
+        for l in range(len(self.down)):
+            bw, lat = settings.link(l)
+            bw = BandwidthSetting(bw.value*self.parallel[l], bw.unit)
+            child_pattern = host_pattern if l == 0 else 'switch-%d-%%d' % (l-1)
+            for child, parent in self.switch_edges(l):
+                link = etree.SubElement(AS, 'link')
+                link.set('id', 'link-%d-%d-%d' % (l, child, parent))
+                link.set('bandwidth', bw.get_value())
+                link.set('latency', lat.get_value())
+                routes.append((child_pattern % child, 'switch-%d-%d' % (l, parent), link.get('id')))
+        for src, dst, link in routes: # the routes have to be after all the links
+            route = etree.SubElement(AS, 'route')
+            route.set('src', src)
+            route.set('dst', dst)
+            etree.SubElement(route, 'link_ctn').set('id', link)
+
+    def switch_edges(self, l):
+        # Edges between the switches of levels l-1 and l, as (child index, parent index) pairs, with the indices used by
+        # initialize_nodes. The index of a switch is a mixed radix number, a child and its parents only differ by the
+        # digit of level l (in range(down[l]) for the child, in range(up[l]) for the parents), no need to initialize.
+        low_size = functools.reduce(lambda a, b: a*b, self.up[:l], 1)
+        for child in range(self.nb_switches(l-1)):
+            low, high = child % low_size, child // (low_size*self.down[l])
+            for k in range(self.up[l]):
+                yield child, low + k*low_size + high*low_size*self.up[l]
+
     def get_nodes_at_level(self, l):
         descriptors = []
         for j in reversed(range(len(self.down))):
@@ -386,6 +739,139 @@ class FatTree:
         fd.write('\\caption{%s}\n' % str(self))
         fd.write('\\end{figure}\n')
 
+def ring_distances(size):
+    # number of positions at each distance from a given position, on a ring of the given size
+    counts = [0]*(size//2 + 1)
+    for position in range(size):
+        counts[min(position, size-position)] += 1
+    return counts
+
+def convolve(a, b):
+    result = [0]*(len(a) + len(b) - 1)
+    for i, x in enumerate(a):
+        for j, y in enumerate(b):
+            result[i+j] += x*y
+    return result
+
+class Torus(ClusterTopology):
+    # Direct network, each node being linked to its two neighbors in each dimension (SimGrid uses the shortest direction
+    # in each dimension, one dimension after the other).
+    cluster_topology = 'TORUS'
+    name = 'torus'
+
+    def __init__(self, dimensions, topo_settings=default_topo):
+        assert len(dimensions) > 0
+        for n in dimensions:
+            assert isinstance(n, int) and n > 0
+        super().__init__(topo_settings)
+        self.dimensions = tuple(dimensions)
+
+    def key(self):
+        return self.dimensions
+
+    def standard_repr(self):
+        return ','.join(str(n) for n in self.dimensions)
+
+    def comment(self):
+        return '%s torus with %d nodes' % ('x'.join(str(n) for n in self.dimensions), self.nb_nodes())
+
+    def nb_nodes(self):
+        return functools.reduce(lambda a, b: a*b, self.dimensions, 1)
+
+    def total_switches(self):
+        return 0
+
+    def nb_cables(self): # one link from each node to its next neighbor, in each dimension with more than one node
+        return self.nb_nodes() * sum(1 for n in self.dimensions if n > 1)
+
+    def bandwidth_ratio(self):
+        # cutting the largest dimension in two halves cuts two links of each of its rings
+        largest = max(self.dimensions)
+        if largest == 1:
+            return 1
+        cut_links = 2 * self.nb_nodes() // largest
+        return min(1, cut_links / (self.nb_nodes()/2))
+
+    def hop_distribution(self):
+        # the distance between two nodes is the sum of their distances on the ring of each dimension
+        nb_nodes = self.nb_nodes()
+        if nb_nodes < 2:
+            return {}
+        counts = [1]
+        for n in self.dimensions:
+            counts = convolve(counts, ring_distances(n))
+        return {hops: count/(nb_nodes-1) for hops, count in enumerate(counts) if hops > 0 and count > 0}
+
+class Dragonfly(ClusterTopology):
+    # Groups of chassis of routers with the nodes, the routers of a chassis are all linked together (blue links), each
+    # router is linked to the routers at the same position in the other chassis of its group (black links) and each
+    # group is linked to all the other groups (green links), the router at position j of group i being linked to group j.
+    cluster_topology = 'DRAGONFLY'
+    name = 'dragonfly'
+
+    def __init__(self, groups, chassis, routers, nodes, topo_settings=default_topo):
+        # groups, chassis and routers are pairs <number, number of parallel links>, nodes is the number of nodes per router
+        for n in (*groups, *chassis, *routers, nodes):
+            assert isinstance(n, int) and n > 0
+        assert groups[0] <= chassis[0]*routers[0] # not enough routers in a group for the green links
+        super().__init__(topo_settings)
+        self.groups = tuple(groups)
+        self.chassis = tuple(chassis)
+        self.routers = tuple(routers)
+        self.nodes = nodes
+
+    def key(self):
+        return (self.groups, self.chassis, self.routers, self.nodes)
+
+    def standard_repr(self):
+        return ';'.join([*(','.join(str(n) for n in pair) for pair in (self.groups, self.chassis, self.routers)), str(self.nodes)])
+
+    def comment(self):
+        return 'dragonfly with %d groups of %d chassis of %d routers and %d nodes' % (self.groups[0], self.chassis[0],
+            self.routers[0], self.nb_nodes())
+
+    def nb_nodes(self):
+        return self.groups[0] * self.chassis[0] * self.routers[0] * self.nodes
+
+    def total_switches(self):
+        return self.groups[0] * self.chassis[0] * self.routers[0]
+
+    def nb_cables(self):
+        (g, green), (c, black), (r, blue) = self.groups, self.chassis, self.routers
+        pairs = lambda n: n*(n-1)//2
+        return self.nb_nodes() + g*c*pairs(r)*blue + g*r*pairs(c)*black + pairs(g)*green
+
+    def bandwidth_ratio(self):
+        # cut between the two halves of the groups (or of the chassis, or of the routers if there is a single one)
+        (g, green), (c, black), (r, blue) = self.groups, self.chassis, self.routers
+        half = lambda n: (n//2) * (n - n//2)
+        if g > 1:
+            cut_links = half(g)*green
+        elif c > 1:
+            cut_links = half(c)*r*black
+        elif r > 1:
+            cut_links = half(r)*blue
+        else:
+            return 1
+        return min(1, cut_links / (self.nb_nodes()/2))
+
+    def hop_distribution(self):
+        # Within a group, two routers are at distance 0, 1 (same chassis or same position) or 2. In another group, the
+        # route goes to the router linked to the destination group, then through the green link, then to the
+        # destination router, the first and last parts having the same distribution as within a group.
+        nb_nodes = self.nb_nodes()
+        if nb_nodes < 2:
+            return {}
+        g, c, r, n = self.groups[0], self.chassis[0], self.routers[0], self.nodes
+        intra = [1, (c-1) + (r-1), (c-1)*(r-1)] # routers at each distance of a given router, in its group
+        counts = defaultdict(int)
+        counts[2] += n-1 # same router
+        for distance, nb_routers in enumerate(intra[1:], 1):
+            counts[2 + distance] += nb_routers*n
+        for distance, nb_routers in enumerate(convolve(intra, intra)): # averaged over the source routers of the group
+            counts[2 + distance + 1] += (g-1)*nb_routers*n / (c*r)
+        return {hops: count/(nb_nodes-1) for hops, count in counts.items() if count > 0}
+
 def topo_to_tex(topologies, filename):
     with open(filename, 'w') as fd:
         fd.write('\\documentclass[10pt]{article}\n')
@@ -403,16 +889,15 @@ def topo_to_tex(topologies, filename):
 def topo_to_pdf(topologies, filename):
     import os
     import shutil
+    import tempfile
     from subprocess import Popen, PIPE, DEVNULL
-    cwd = os.getcwd()
-    os.chdir('/tmp')
-    topo_to_tex(topologies, 'tmp.tex')
-    p = Popen(['xelatex', '-interaction=batchmode', 'tmp.tex'], stdout = DEVNULL, stderr = DEVNULL)
-    assert p.wait() == 0
-    p = Popen(['pdfcrop', 'tmp.pdf', 'tmp.pdf'], stdout = DEVNULL, stderr = DEVNULL)
-    assert p.wait() == 0
-    shutil.move('tmp.pdf', os.path.join(cwd, filename))
-    os.chdir(cwd)
+    with tempfile.TemporaryDirectory() as directory: # private directory, several drawings can be done at the same time
+        topo_to_tex(topologies, os.path.join(directory, 'tmp.tex'))
+        p = Popen(['xelatex', '-interaction=batchmode', 'tmp.tex'], stdout = DEVNULL, stderr = DEVNULL, cwd=directory)
+        assert p.wait() == 0
+        p = Popen(['pdfcrop', 'tmp.pdf', 'tmp.pdf'], stdout = DEVNULL, stderr = DEVNULL, cwd=directory)
+        assert p.wait() == 0
+        shutil.move(os.path.join(directory, 'tmp.pdf'), filename)
 
 
 class Node:
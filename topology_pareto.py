@@ -0,0 +1,62 @@
+#! /usr/bin/env python3
+
+import csv
+import argparse
+from topology import FatTree, GeneratedTopoParser
+
+def pareto_frontier(points):
+    # points are (cost, throughput, item) tuples, return those which are not dominated (no other point has a lower or
+    # equal cost and a strictly higher throughput, or a strictly lower cost and an equal throughput), by increasing cost
+    frontier = []
+    for cost, throughput, item in sorted(points, key=lambda p: (p[0], -p[1])):
+        if len(frontier) == 0 or throughput > frontier[-1][1]:
+            frontier.append((cost, throughput, item))
+    return frontier
+
+def get_metrics(tree, switch_cost, cable_cost):
+    # closed-form metrics, no need to initialize the tree
+    metrics = {
+        'topology': tree.description(),
+        'nb_nodes': tree.nb_nodes(),
+        'nb_switches': tree.total_switches(),
+        'nb_cables': tree.nb_cables(),
+        'cost': tree.cost(switch_cost, cable_cost),
+        'bisection_bandwidth': tree.bisection_bandwidth(),
+        'bandwidth_ratio': tree.bandwidth_ratio(),
+        'diameter': tree.diameter(),
+        'average_hops': tree.average_hops(),
+    }
+    if isinstance(tree, FatTree):
+        for l in range(len(tree.down)-1):
+            metrics['oversubscription_%d' % l] = tree.oversubscription(l)
+    return metrics
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Cost and bisection bandwidth of fat-trees, tori and dragonflies, and the Pareto frontier of these two metrics.')
+    parser.add_argument('topologies', nargs='+',
+            help='Descriptions of the topologies (with ranges, e.g. "2;24,48;1,1:24;1,1:3", "torus;8:16,8,8" or "dragonfly;9,1;4,1:2;8,1;4").')
+    parser.add_argument('--switch_cost', type=float, default=1, help='Cost of a switch.')
+    parser.add_argument('--cable_cost', type=float, default=0.1, help='Cost of a cable.')
+    parser.add_argument('--nb_nodes', type=int, default=None, help='Only keep the topologies with (at least) this number of nodes.')
+    parser.add_argument('--csv_file', type=str, default=None, help='Path of a CSV file for the metrics of all the topologies.')
+    args = parser.parse_args()
+    trees = set()
+    for descriptor in args.topologies:
+        trees.update(GeneratedTopoParser.parse(descriptor))
+    if args.nb_nodes is not None:
+        trees = [tree for tree in trees if tree.nb_nodes() >= args.nb_nodes]
+    all_metrics = [get_metrics(tree, args.switch_cost, args.cable_cost) for tree in trees]
+    frontier = pareto_frontier([(m['cost'], m['bisection_bandwidth'], m) for m in all_metrics])
+    if args.csv_file is not None:
+        on_frontier = {id(m) for _, _, m in frontier}
+        header = sorted({key for m in all_metrics for key in m}, key=lambda k: (k.startswith('oversubscription'), k != 'topology', k))
+        with open(args.csv_file, 'w') as f:
+            writer = csv.DictWriter(f, fieldnames=header + ['pareto'])
+            writer.writeheader()
+            for m in all_metrics:
+                writer.writerow(dict(m, pareto=id(m) in on_frontier))
+    print('%d topologies, %d on the Pareto frontier:' % (len(all_metrics), len(frontier)))
+    for cost, bandwidth, m in frontier:
+        print('%s\tcost %g\tbisection %.3e B/s\t%d nodes\t%d switches\t%d cables' % (m['topology'], cost, bandwidth,
+            m['nb_nodes'], m['nb_switches'], m['nb_cables']))
@@ -0,0 +1,170 @@
+#! /usr/bin/env python3
+
+# Phase-level tracing of the experiment drivers (run_measures.py, cblas_tests/experiment.py): each phase of each
+# experiment is a span, exported in the Chrome trace format (to open with chrome://tracing or https://ui.perfetto.dev)
+# and summarized in a table, so that the overhead of the driver can be compared to the cost of the simulation.
+# Optionally, the Python side is profiled with cProfile and its allocations are traced with tracemalloc.
+
+import os
+import sys
+import json
+import time
+import cProfile
+import pstats
+import argparse
+import threading
+import contextlib
+import tracemalloc
+from collections import defaultdict
+
+class NullSpan:
+    # span of a disabled tracer, the arguments given to it are ignored
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *exc_info):
+        return False
+
+null_span = NullSpan()
+
+class ProfileStats:
+    # pstats.Stats can be built from any object with a create_stats method, this one wraps the (picklable) dictionary
+    # of the statistics of a profile, sent back by the worker processes
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+class Tracer:
+    def __init__(self, enabled=True, profile=False, memory=False):
+        self.enabled = enabled or profile or memory
+        self.profile = profile
+        self.memory = memory
+        self.origin = time.perf_counter() # shared by the forked processes, the clock is system-wide
+        self.events = []
+        self.profile_stats = []
+        self.depth = 0
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def span(self, name, category='driver', **args):
+        if not self.enabled:
+            return null_span
+        return self._span(name, category, args)
+
+    @contextlib.contextmanager
+    def _span(self, name, category, args):
+        if self.memory:
+            if self.depth == 0 and hasattr(tracemalloc, 'reset_peak'): # Python >= 3.9, otherwise the peak is the one of the process
+                tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            yield args # the caller can add arguments to the span while it is running
+        finally:
+            end = time.perf_counter()
+            self.depth -= 1
+            if self.memory:
+                current, peak = tracemalloc.get_traced_memory()
+                args['allocated'] = current - start_memory
+                if self.depth == 0 and hasattr(tracemalloc, 'reset_peak'):
+                    args['peak_allocated'] = peak - start_memory
+            self.events.append({'name': name, 'cat': category, 'ph': 'X', 'ts': (start-self.origin)*1e6, 'dur': (end-start)*1e6,
+                'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args})
+
+    @contextlib.contextmanager
+    def profiled(self):
+        # profile of the Python code run in the block (not nested), the time spent waiting for a child process is
+        # accounted to the functions waiting for it (e.g. time.sleep, Popen.communicate)
+        if not self.profile:
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.create_stats()
+            self.profile_stats.append(profile.stats)
+
+    def pop(self):
+        # events and profiles recorded since the last call, to send them from a worker process to the main one
+        result = self.events, self.profile_stats
+        self.events, self.profile_stats = [], []
+        return result
+
+    def merge(self, recorded):
+        events, profile_stats = recorded
+        self.events.extend(events)
+        self.profile_stats.extend(profile_stats)
+
+    def dump_chrome_trace(self, file_name):
+        main_pid = os.getpid()
+        pids = sorted({event['pid'] for event in self.events})
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'main' if pid == main_pid else 'worker %d' % pid}}
+                for pid in pids]
+        with open(file_name, 'w') as f:
+            json.dump({'traceEvents': metadata + self.events, 'displayTimeUnit': 'ms'}, f)
+
+    def dump_profile(self, file_name):
+        if len(self.profile_stats) == 0:
+            return None
+        stats = pstats.Stats(*[ProfileStats(s) for s in self.profile_stats])
+        stats.dump_stats(file_name)
+        return stats
+
+    def summary(self):
+        # return a list of (name, count, total, mean, max, share) sorted by total time, the times in seconds and the
+        # share relative to the wall time of the trace (it can exceed 100% with several workers)
+        durations = defaultdict(list)
+        for event in self.events:
+            durations[event['name']].append(event['dur']*1e-6)
+        if len(self.events) == 0:
+            return []
+        total = (max(event['ts'] + event['dur'] for event in self.events) - min(event['ts'] for event in self.events))*1e-6
+        rows = []
+        for name, values in durations.items():
+            rows.append((name, len(values), sum(values), sum(values)/len(values), max(values), sum(values)/total if total > 0 else 0))
+        return sorted(rows, key=lambda r: -r[2])
+
+    def print_summary(self, file=sys.stdout):
+        print('%-30s %8s %12s %12s %12s %8s' % ('span', 'count', 'total (s)', 'mean (s)', 'max (s)', 'share'), file=file)
+        for name, count, total, mean, maximum, share in self.summary():
+            print('%-30s %8d %12.4f %12.4f %12.4f %7.1f%%' % (name, count, total, mean, maximum, share*100), file=file)
+
+    def report(self, trace_file=None, profile_file=None, nb_functions=20):
+        if not self.enabled:
+            return
+        self.print_summary()
+        if trace_file is not None:
+            self.dump_chrome_trace(trace_file)
+            print('Trace written in %s.' % trace_file)
+        if profile_file is not None:
+            stats = self.dump_profile(profile_file)
+            if stats is not None:
+                print('Profile written in %s, the %d functions with the highest cumulative time:' % (profile_file, nb_functions))
+                stats.sort_stats('cumulative').print_stats(nb_functions)
+
+def add_arguments(parser):
+    group = parser.add_argument_group('tracing', 'Timing of each phase of the experiments (the summary is printed at the end).')
+    group.add_argument('--trace', type=str, default=None,
+            help='Path of a JSON file for the spans, in the Chrome trace format (chrome://tracing, https://ui.perfetto.dev).')
+    group.add_argument('--profile', type=str, default=None,
+            help='Path of a file for the cProfile statistics of the Python side (e.g. for snakeviz or pstats).')
+    group.add_argument('--tracemalloc', action='store_true',
+            help='Record the memory allocated by the Python side during each span (slows down the driver).')
+
+def tracer_from_args(args):
+    return Tracer(enabled=args.trace is not None, profile=args.profile is not None, memory=args.tracemalloc)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summary of a trace written with --trace.')
+    parser.add_argument('trace_file', help='Path of the JSON file of the trace.')
+    args = parser.parse_args()
+    with open(args.trace_file) as f:
+        tracer = Tracer()
+        tracer.events = [event for event in json.load(f)['traceEvents'] if event['ph'] == 'X']
+    tracer.print_summary()
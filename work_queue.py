@@ -0,0 +1,223 @@
+#! /usr/bin/env python3
+
+# Durable queue of experiments in a SQLite file, to spread a sweep of run_measures.py over several processes or nodes
+# (sharing the file). The coordinator (run_measures.py --queue) publishes the experiments and writes their results in
+# its CSV as they arrive. The workers claim the experiments one by one with a lease, renewed while the experiment runs:
+# if a worker dies, its lease expires and the experiment is claimed again by another worker, up to a maximal number of
+# attempts.
+
+import os
+import sys
+import time
+import json
+import pickle
+import socket
+import sqlite3
+import argparse
+import threading
+import traceback
+import contextlib
+import multiprocessing
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+schema = '''
+CREATE TABLE IF NOT EXISTS sweep (
+    id              INTEGER PRIMARY KEY CHECK (id = 0),
+    config          TEXT NOT NULL,
+    lease_time      REAL NOT NULL,
+    max_attempts    INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS points (
+    id              INTEGER PRIMARY KEY,
+    description     TEXT NOT NULL,
+    payload         BLOB NOT NULL,
+    status          TEXT NOT NULL,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    worker          TEXT,
+    lease_end       REAL,
+    result          TEXT,
+    error           TEXT,
+    trace           BLOB,
+    done_index      INTEGER
+);
+'''
+
+class WorkQueue:
+    def __init__(self, path, timeout=60):
+        # a connection cannot be shared by several processes or threads, each one opens the file; the path is made absolute
+        # since the experiments are run in temporary directories, while the heartbeat of the worker opens it again
+        self.path = os.path.abspath(path)
+        self.connection = sqlite3.connect(self.path, timeout=timeout, isolation_level=None)
+        self.connection.executescript(schema)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # the database is locked for writing from the beginning, so that two workers cannot claim the same point
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def settings(self):
+        # return the configuration of the sweep, the lease time and the maximal number of attempts, None if not published
+        row = self.connection.execute('SELECT config, lease_time, max_attempts FROM sweep').fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def publish(self, config, points, lease_time, max_attempts):
+        # points is a list of (description, object), return False if the sweep was already published
+        with self.transaction() as c:
+            row = c.execute('SELECT config FROM sweep').fetchone()
+            if row is not None:
+                if json.loads(row[0]) != config:
+                    raise ValueError('The queue %s contains another sweep (%s).' % (self.path, ' '.join(json.loads(row[0]))))
+                return False
+            c.execute('INSERT INTO sweep VALUES (0, ?, ?, ?)', (json.dumps(config), lease_time, max_attempts))
+            c.executemany('INSERT INTO points (description, payload, status) VALUES (?, ?, ?)',
+                    [(description, pickle.dumps(point), PENDING) for description, point in points])
+        return True
+
+    def expire(self, c):
+        # the points whose lease expired at their last attempt are failed, the other ones can be claimed again
+        c.execute('UPDATE points SET status=?, error=? WHERE status=? AND lease_end<? AND attempts>=(SELECT max_attempts FROM sweep)',
+                (FAILED, 'lease expired', RUNNING, time.time()))
+
+    def claim(self, worker):
+        # return ((id, attempt), object) for a pending point or a point whose lease expired, None if there is none
+        with self.transaction() as c:
+            self.expire(c)
+            now = time.time()
+            row = c.execute('SELECT id, attempts, payload FROM points WHERE status=? OR (status=? AND lease_end<?) ORDER BY id LIMIT 1',
+                    (PENDING, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            c.execute('UPDATE points SET status=?, attempts=attempts+1, worker=?, lease_end=?+(SELECT lease_time FROM sweep) WHERE id=?',
+                    (RUNNING, worker, now, row[0]))
+        return (row[0], row[1]+1), pickle.loads(row[2])
+
+    def renew(self, lease):
+        # return False if the lease was lost (it expired and the point was claimed again)
+        with self.transaction() as c:
+            cursor = c.execute('UPDATE points SET lease_end=?+(SELECT lease_time FROM sweep) WHERE id=? AND attempts=? AND status=?',
+                    (time.time(), *lease, RUNNING))
+            return cursor.rowcount == 1
+
+    def complete(self, lease, result, recorded=([], [])):
+        # the result is discarded if the lease was lost, recorded is what the tracer of the worker recorded for the point
+        with self.transaction() as c:
+            c.execute('UPDATE points SET status=?, result=?, trace=?, lease_end=NULL, done_index=(SELECT COALESCE(MAX(done_index), 0)+1 FROM points) '
+                    'WHERE id=? AND attempts=? AND status=?', (DONE, json.dumps(result), pickle.dumps(recorded), *lease, RUNNING))
+
+    def fail(self, lease, error):
+        with self.transaction() as c:
+            c.execute('UPDATE points SET status=CASE WHEN attempts>=(SELECT max_attempts FROM sweep) THEN ? ELSE ? END, error=?, lease_end=NULL '
+                    'WHERE id=? AND attempts=? AND status=?', (FAILED, PENDING, error, *lease, RUNNING))
+
+    def results(self, after=0):
+        # return the list of (index, result, recorded) of the points done after the given index, in the order they were done
+        rows = self.connection.execute('SELECT done_index, result, trace FROM points WHERE status=? AND done_index>? ORDER BY done_index',
+                (DONE, after)).fetchall()
+        return [(index, json.loads(result), pickle.loads(trace)) for index, result, trace in rows]
+
+    def failures(self):
+        return self.connection.execute('SELECT description, attempts, error FROM points WHERE status=? ORDER BY id', (FAILED,)).fetchall()
+
+    def counts(self):
+        # return a dictionary {status: number of points}
+        with self.transaction() as c:
+            self.expire(c)
+            counts = dict(c.execute('SELECT status, COUNT(*) FROM points GROUP BY status').fetchall())
+        return {status: counts.get(status, 0) for status in (PENDING, RUNNING, DONE, FAILED)}
+
+    def is_finished(self):
+        counts = self.counts()
+        return counts[PENDING] == 0 and counts[RUNNING] == 0
+
+class Heartbeat(threading.Thread):
+    # renews the lease of a point while its experiment runs
+    def __init__(self, path, lease, period):
+        super().__init__(daemon=True)
+        self.path = path
+        self.lease = lease
+        self.period = period
+        self.stopped = threading.Event()
+
+    def run(self):
+        queue = WorkQueue(self.path)
+        while not self.stopped.wait(self.period):
+            if not queue.renew(self.lease):
+                print('Lost the lease of the point %d (attempt %d), it expired before being renewed.' % self.lease, file=sys.stderr)
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+def run_worker(path, runner, name=None, poll_period=1):
+    # run the experiments of the queue with the given runner (of run_measures.py) until none is left, the points still
+    # running elsewhere are waited for, in case their worker dies; return the number of experiments run
+    queue = WorkQueue(path)
+    name = name or '%s:%d' % (socket.gethostname(), os.getpid())
+    lease_time = queue.settings()[1]
+    runner.tracer.pop() # forget the spans of the coordinator, recorded before the fork
+    nb_exp = 0
+    while True:
+        claimed = queue.claim(name)
+        if claimed is None:
+            if queue.is_finished():
+                return nb_exp
+            time.sleep(poll_period)
+            continue
+        lease, exp = claimed
+        heartbeat = Heartbeat(queue.path, lease, lease_time/3)
+        heartbeat.start()
+        try:
+            row = runner.run_exp_in_dir(exp)
+        except (Exception, SystemExit): # the runners exit when the output of the simulation cannot be parsed
+            heartbeat.stop()
+            runner.tracer.pop()
+            queue.fail(lease, traceback.format_exc())
+        else:
+            heartbeat.stop()
+            queue.complete(lease, row, runner.tracer.pop()) # the spans are merged by the coordinator
+        nb_exp += 1
+
+def print_status(queue):
+    counts = queue.counts()
+    print(', '.join('%d %s' % (counts[status], status) for status in (PENDING, RUNNING, DONE, FAILED)))
+    for description, attempts, error in queue.failures():
+        print('FAILED after %d attempt(s): %s\n%s' % (attempts, description, error))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Workers for a sweep published in a work queue by run_measures.py --queue, to start from the same directory (on any node sharing the queue file).')
+    parser.add_argument('queue', type=str,
+            help='Path of the SQLite file of the queue.')
+    parser.add_argument('--nb_workers', type=int, default=1,
+            help='Number of workers to start.')
+    parser.add_argument('--status', action='store_true',
+            help='Only print the number of experiments in each state and the errors of the failed ones.')
+    args = parser.parse_args()
+    if not os.path.exists(args.queue):
+        parser.error('No queue at %s.' % args.queue)
+    queue = WorkQueue(args.queue)
+    if args.status:
+        print_status(queue)
+        sys.exit(0)
+    settings = queue.settings()
+    if settings is None:
+        parser.error('No sweep published in %s.' % args.queue)
+    import run_measures # the runner is built from the command line of the coordinator
+    runner_parser = run_measures.get_parser()
+    runner = run_measures.get_runner(runner_parser, runner_parser.parse_args(settings[0]))
+    workers = [multiprocessing.get_context('fork').Process(target=run_worker, args=(args.queue, runner)) for _ in range(args.nb_workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    print_status(queue)